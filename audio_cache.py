@@ -0,0 +1,278 @@
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+from config import AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES
+import metrics
+from utils import extract_youtube_id
+
+INDEX_FILE = 'index.json'
+# Names of the files the cache writes: a SHA-1 of the key, and '.part' while being teed
+_CACHE_FILE_PATTERN = re.compile(r'[0-9a-f]{40}\.ogg(\.part)?')
+
+class AudioCache:
+    """
+    Size-bounded on-disk cache of played audio, stored as Ogg/Opus files.
+
+    The first playback of a song tees its audio into a temporary file, which
+    is committed only if the song played to the end. Entries are evicted least
+    recently used first once the cache holds more than ``max_bytes``. The
+    index (LRU order and sizes) is kept in ``index.json`` so the cache survives
+    restarts.
+    """
+
+    def __init__(self, directory: str = AUDIO_CACHE_DIR, max_bytes: int = AUDIO_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # key -> {'file': name, 'size': bytes, 'last_used': unix time, 'lufs': loudness once
+        # measured}, least recently used first
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+        self._writing: Set[str] = set()
+        self._dirty = False
+        self._load_index()
+
+    @staticmethod
+    def key(url: str) -> str:
+        """Get the cache key of a song's webpage URL."""
+        return extract_youtube_id(url) or url
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load_index(self) -> None:
+        """
+        Read the index, dropping entries whose file is gone and leftover partial files.
+
+        Complete files missing from the index (e.g. because it was unreadable)
+        are kept as entries under their file name, least recently used first,
+        until their song is looked up again. Files the cache did not write are
+        left alone.
+        """
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        try:
+            with open(self._path(INDEX_FILE), encoding='utf-8') as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            saved = []
+        except ValueError as e:
+            print(f"Audio cache index is unreadable, rebuilding it from the cached files: {e}")
+            saved = []
+        for key, entry in saved:
+            if os.path.exists(self._path(entry['file'])):
+                self.entries[key] = entry
+                self.total_bytes += entry['size']
+        known = {entry['file'] for entry in self.entries.values()}
+        orphans = []
+        for name in names:
+            match = _CACHE_FILE_PATTERN.fullmatch(name)
+            if match is None or name in known:
+                continue
+            try:
+                if match.group(1):
+                    # Partial tee from a crash
+                    os.remove(self._path(name))
+                else:
+                    stat = os.stat(self._path(name))
+                    orphans.append((stat.st_mtime, name, stat.st_size))
+            except OSError:
+                pass
+        if orphans:
+            entries = OrderedDict((name, {'file': name, 'size': size, 'last_used': mtime})
+                                  for mtime, name, size in sorted(orphans))
+            entries.update(self.entries)
+            self.entries = entries
+            self.total_bytes += sum(size for _, _, size in orphans)
+            self._dirty = True
+        self._evict()
+
+    def save(self) -> None:
+        """Atomically write the index."""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._path(f"{INDEX_FILE}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(list(self.entries.items()), f, separators=(',', ':'))
+        os.replace(tmp_path, self._path(INDEX_FILE))
+        self._dirty = False
+
+    def flush(self) -> None:
+        """Write the index if playbacks have changed the LRU order since the last save."""
+        if self._dirty:
+            self.save()
+
+    def _entry(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get the entry of a key, claiming its file if it was kept from a lost index."""
+        entry = self.entries.get(key)
+        if entry is None:
+            name = self._file_name(key)
+            entry = self.entries.pop(name, None)
+            if entry is not None:
+                self.entries[key] = entry
+                self.entries.move_to_end(key, last=False)
+                self._dirty = True
+        return entry
+
+    def contains(self, url: str) -> bool:
+        """Check whether a song is cached, without counting a hit or miss."""
+        return self._entry(self.key(url)) is not None
+
+    def peek(self, url: str) -> Optional[str]:
+        """Get the cached audio file of a song without counting a hit or touching the LRU order."""
+        entry = self._entry(self.key(url))
+        if entry is None:
+            return None
+        path = self._path(entry['file'])
+        return path if os.path.exists(path) else None
+
+    def lookup(self, url: str) -> Optional[str]:
+        """
+        Get the cached audio file of a song and mark it as recently used.
+
+        Args:
+            url (str): Webpage URL of the song
+
+        Returns:
+            Optional[str]: Path of the cached Ogg/Opus file, or None on a miss
+        """
+        key = self.key(url)
+        entry = self._entry(key)
+        if entry is not None and not os.path.exists(self._path(entry['file'])):
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            metrics.increment('audio_cache_misses')
+            return None
+        self.entries.move_to_end(key)
+        entry['last_used'] = time.time()
+        self._dirty = True
+        self.hits += 1
+        self.bytes_saved += entry['size']
+        metrics.increment('audio_cache_hits')
+        metrics.increment('audio_cache_bytes_saved', entry['size'])
+        return self._path(entry['file'])
+
+    def reserve(self, url: str) -> Optional[str]:
+        """
+        Get a temporary path to tee a song's first playback into.
+
+        Args:
+            url (str): Webpage URL of the song
+
+        Returns:
+            Optional[str]: Temporary file path, or None if the song is already
+                cached or being written by another playback
+        """
+        key = self.key(url)
+        if self.max_bytes <= 0 or self._entry(key) is not None or key in self._writing:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        self._writing.add(key)
+        return self._path(f"{self._file_name(key)}.part")
+
+    def commit(self, url: str, tmp_path: str, completed: bool) -> bool:
+        """
+        Add a teed file to the cache, or discard it if playback stopped early.
+
+        Args:
+            url (str): Webpage URL of the song
+            tmp_path (str): Path returned by ``reserve``
+            completed (bool): True if the whole song was written
+
+        Returns:
+            bool: True if the file was added to the cache
+        """
+        key = self.key(url)
+        self._writing.discard(key)
+        try:
+            size = os.path.getsize(tmp_path) if completed else 0
+        except OSError:
+            size = 0
+        if size <= 0 or size > self.max_bytes:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+        name = self._file_name(key)
+        os.replace(tmp_path, self._path(name))
+        self.entries[key] = {'file': name, 'size': size, 'last_used': time.time()}
+        self.total_bytes += size
+        metrics.increment('audio_cache_stores')
+        self._evict()
+        self.save()
+        return True
+
+    def loudness(self, url: str) -> Optional[float]:
+        """Get the measured integrated loudness (LUFS) of a cached song, if known."""
+        entry = self._entry(self.key(url))
+        return entry.get('lufs') if entry is not None else None
+
+    def has_loudness(self, url: str) -> bool:
+        """Check whether a cached song's loudness has been measured (or found unmeasurable)."""
+        entry = self._entry(self.key(url))
+        return entry is not None and 'lufs' in entry
+
+    def set_loudness(self, url: str, lufs: Optional[float]) -> None:
+        """
+        Store the measured loudness of a cached song in the index.
+
+        Args:
+            url (str): Webpage URL (or cache key) of the song
+            lufs (Optional[float]): Integrated loudness, None if it could not be measured
+        """
+        entry = self._entry(self.key(url))
+        if entry is not None:
+            entry['lufs'] = lufs
+            self._dirty = True
+
+    def keys_without_loudness(self) -> List[str]:
+        """Get the keys of cached songs whose loudness has not been measured."""
+        return [key for key, entry in self.entries.items() if 'lufs' not in entry]
+
+    def _evict(self) -> None:
+        """Remove least recently used files until the cache fits in ``max_bytes``."""
+        while self.total_bytes > self.max_bytes and self.entries:
+            key = next(iter(self.entries))
+            self._remove(key)
+            self.evictions += 1
+            metrics.increment('audio_cache_evictions')
+            self._dirty = True
+
+    def _remove(self, key: str) -> None:
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry['size']
+        try:
+            os.remove(self._path(entry['file']))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _file_name(key: str) -> str:
+        return hashlib.sha1(key.encode()).hexdigest() + '.ogg'
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Get cache size, hit ratio and bytes served from disk instead of the network."""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'bytes_saved': self.bytes_saved,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,665 @@
+import bisect
+import mmap
+import os
+import shlex
+import struct
+import subprocess
+import threading
+from array import array
+from collections import OrderedDict
+from typing import IO, Callable, Dict, Optional, Sequence, Tuple, Type
+import discord
+from discord.oggparse import OggStream
+from discord.opus import Encoder as OpusEncoder
+from discord.player import OPUS_SILENCE
+import metrics
+
+PCM_SILENCE = b'\x00' * OpusEncoder.FRAME_SIZE
+# Largest Opus packet of a single 20 ms frame (RFC 6716); bigger ones are kept aside
+OPUS_SLOT_SIZE = 1275
+# Audio decoded before a seek target so the Opus decoder has converged (RFC 7845 recommends 80 ms)
+OPUS_PREROLL = 0.08
+# Page indexes kept for recently seeked cached files
+PAGE_INDEX_CACHE_SIZE = 64
+
+_OGG_PAGE_HEADER = struct.Struct('<4sBBqIIIB')
+
+def _opus_packet_samples(packet: bytes) -> int:
+    """Get the duration of an Opus packet in 48 kHz samples from its TOC byte (RFC 6716, section 3.1)."""
+    config = packet[0] >> 3
+    if config < 12:
+        frame = (480, 960, 1920, 2880)[config % 4]
+    elif config < 16:
+        frame = (480, 960)[config % 2]
+    else:
+        frame = (120, 240, 480, 960)[config % 4]
+    code = packet[0] & 3
+    if code == 0:
+        count = 1
+    elif code < 3:
+        count = 2
+    else:
+        count = packet[1] & 0x3F if len(packet) > 1 else 0
+    return frame * count
+
+class OggPageIndex:
+    """
+    Byte offsets of the pages of an Ogg/Opus file, by playback time.
+
+    Each Ogg page header carries the granule position (48 kHz samples) of
+    the last packet completed on it, so the page a time falls in is found by
+    bisection without decoding anything. Playback time 0 is at granule
+    ``origin``: the granule the stream starts at (not always 0 in remuxed
+    files) plus the Opus pre-skip.
+
+    Args:
+        header_end (int): Offset of the first audio page; everything before is headers
+        pre_skip (int): Samples the decoder drops at the start of the stream
+        origin (int): Granule position of playback time 0
+        offsets (Sequence[int]): Offset of each audio page
+        granules (Sequence[int]): Granule position of each audio page
+        continued (Sequence[bool]): Whether each page starts with the rest of a packet
+    """
+
+    def __init__(self, header_end: int, pre_skip: int, origin: int, offsets: Sequence[int],
+                 granules: Sequence[int], continued: Sequence[bool]):
+        self.header_end = header_end
+        self.pre_skip = pre_skip
+        self.origin = origin
+        self.offsets = offsets
+        self.granules = granules
+        self.continued = continued
+
+    @classmethod
+    def from_file(cls, path: str) -> Optional['OggPageIndex']:
+        """
+        Index an Ogg/Opus file.
+
+        Returns:
+            Optional[OggPageIndex]: The index, None if the file is not Ogg/Opus or has no audio pages
+        """
+        with open(path, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return cls._parse(data)
+
+    @classmethod
+    def _parse(cls, data: mmap.mmap) -> Optional['OggPageIndex']:
+        size = len(data)
+        pos = 0
+        pre_skip = None
+        origin = None
+        offsets = array('q')
+        granules = array('q')
+        continued = []
+        while pos + _OGG_PAGE_HEADER.size <= size:
+            magic, _, flags, granule, _, _, _, segments = _OGG_PAGE_HEADER.unpack_from(data, pos)
+            if magic != b'OggS':
+                return None
+            body = pos + _OGG_PAGE_HEADER.size + segments
+            if body > size:
+                break
+            lacing = data[pos + _OGG_PAGE_HEADER.size:body]
+            if pre_skip is None:
+                if data[body:body + 8] != b'OpusHead':
+                    return None
+                pre_skip, = struct.unpack_from('<H', data, body + 10)
+            elif granule > 0:
+                if origin is None:
+                    # The granule counts from where the first audio page's packets start
+                    origin = granule - cls._page_samples(data, body, lacing) + pre_skip
+                offsets.append(pos)
+                granules.append(granule)
+                continued.append(bool(flags & 1))
+            pos = body + sum(lacing)
+        if origin is None:
+            return None
+        return cls(offsets[0], pre_skip, origin, offsets, granules, continued)
+
+    @staticmethod
+    def _page_samples(data: mmap.mmap, body: int, lacing: bytes) -> int:
+        """Samples in the packets completed on a page."""
+        samples = 0
+        start = length = 0
+        for value in lacing:
+            length += value
+            if value < 255:
+                if length:
+                    samples += _opus_packet_samples(data[body + start:body + start + min(length, 2)])
+                start += length
+                length = 0
+        return samples
+
+    def locate(self, seconds: float) -> Tuple[int, float]:
+        """
+        Find the page to start decoding from to play from a given time.
+
+        Args:
+            seconds (float): Seek target
+
+        Returns:
+            Tuple[int, float]: Offset of the page, and the time it starts at
+                (at least ``OPUS_PREROLL`` before the target unless it is the first page)
+        """
+        target = (seconds - OPUS_PREROLL) * OpusEncoder.SAMPLING_RATE + self.origin
+        # First page ending after the target, i.e. the page the target falls in
+        index = min(bisect.bisect_right(self.granules, target), len(self.offsets) - 1)
+        # A page starting mid-packet cannot be decoded from its start
+        while index > 0 and self.continued[index]:
+            index -= 1
+        if index == 0:
+            return self.offsets[0], 0.0
+        start = (self.granules[index - 1] - self.origin) / OpusEncoder.SAMPLING_RATE
+        return self.offsets[index], max(0.0, start)
+
+_page_indexes: 'OrderedDict[Tuple[str, int, int], Optional[OggPageIndex]]' = OrderedDict()
+_page_indexes_lock = threading.Lock()
+
+def page_index(path: str) -> Optional[OggPageIndex]:
+    """
+    Get the page index of an Ogg/Opus file, building it on first use.
+
+    Args:
+        path (str): Cached audio file
+
+    Returns:
+        Optional[OggPageIndex]: The index, None if the file cannot be indexed
+    """
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _page_indexes_lock:
+        if key in _page_indexes:
+            _page_indexes.move_to_end(key)
+            return _page_indexes[key]
+    try:
+        index = OggPageIndex.from_file(path)
+    except (OSError, ValueError, struct.error):
+        index = None
+    with _page_indexes_lock:
+        _page_indexes[key] = index
+        while len(_page_indexes) > PAGE_INDEX_CACHE_SIZE:
+            _page_indexes.popitem(last=False)
+    return index
+
+class MappedFile:
+    """
+    Read-only, memory-mapped file fed to ffmpeg's stdin.
+
+    Reads are served straight from the page cache without copying the file
+    through Python's buffered I/O. ``close`` may be called from another
+    thread while ffmpeg's stdin writer is still reading.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, 'rb')
+        self._lock = threading.Lock()
+        self._pos = 0
+        # Byte range left out of what is read, set by ``skip``
+        self._skip: Optional[Tuple[int, int]] = None
+        size = os.fstat(self._file.fileno()).st_size
+        self._map: Optional[mmap.mmap] = None
+        if size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                self._map.madvise(mmap.MADV_SEQUENTIAL)
+
+    def skip(self, start: int, end: int) -> None:
+        """Leave the bytes from ``start`` to ``end`` out of what is read, e.g. to jump past Ogg pages."""
+        self._skip = (start, end)
+
+    def read(self, size: int = -1) -> bytes:
+        with self._lock:
+            if self._map is None or self._map.closed:
+                return b''
+            if self._skip is not None and self._pos >= self._skip[0]:
+                self._pos = max(self._pos, self._skip[1])
+                self._skip = None
+            end = len(self._map) if size < 0 else self._pos + size
+            if self._skip is not None:
+                end = min(end, self._skip[0])
+            data = self._map[self._pos:end]
+            self._pos += len(data)
+            return data
+
+    def close(self) -> None:
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+            self._file.close()
+
+class StreamFFmpegPCMAudio(discord.FFmpegPCMAudio):
+    """FFmpegPCMAudio whose frames can also be read straight into a caller's buffer."""
+
+    def read_into(self, buffer: memoryview) -> int:
+        """
+        Read the next frame into a buffer of at least ``FRAME_SIZE`` bytes.
+
+        Returns:
+            int: Bytes read, 0 once the stream has ended
+        """
+        size = self._stdout.readinto(buffer[:OpusEncoder.FRAME_SIZE])
+        if size != OpusEncoder.FRAME_SIZE:
+            self._check_process_returncode()
+            return 0
+        return size
+
+def _seek_mapped(mapped: MappedFile, path: str, start: float, kwargs: dict) -> None:
+    """
+    Make ffmpeg start a piped cached file at ``start`` seconds.
+
+    The headers are sent followed by the page the target falls in, and
+    ffmpeg discards the remaining fraction of a page as an output option.
+    Files that cannot be indexed fall back to input seeking, which on a
+    pipe means ffmpeg reads through everything before the target.
+    """
+    index = page_index(path)
+    if index is None:
+        kwargs['before_options'] = f"-ss {start:.3f} {kwargs.get('before_options') or ''}".strip()
+        return
+    offset, page_start = index.locate(start)
+    mapped.skip(index.header_end, offset)
+    # The decoder drops the pre-skip again at the first packet it sees, so that much less is discarded
+    skip = start - page_start - index.pre_skip / OpusEncoder.SAMPLING_RATE if page_start else start
+    kwargs['options'] = f"-ss {skip:.3f} {kwargs.get('options') or ''}".strip()
+
+def _write_mapped(audio: discord.FFmpegAudio, source: MappedFile) -> None:
+    """Run discord.py's stdin writer, which fails on its own cleanup if a skip or seek kills ffmpeg mid-write."""
+    try:
+        discord.FFmpegAudio._pipe_writer(audio, source)
+    except AttributeError:
+        # The process was already cleared by cleanup()
+        pass
+
+class MappedFFmpegPCMAudio(discord.FFmpegPCMAudio):
+    """
+    FFmpegPCMAudio that decodes a local file piped in from a memory map.
+
+    Args:
+        path (str): Cached Ogg/Opus file
+        start (float): Offset in seconds to start playing from, found through the file's page index
+        **kwargs: See ``discord.FFmpegPCMAudio``
+    """
+
+    def __init__(self, path: str, start: float = 0.0, **kwargs):
+        self._mapped = MappedFile(path)
+        try:
+            if start > 0:
+                _seek_mapped(self._mapped, path, start, kwargs)
+            super().__init__(self._mapped, pipe=True, **kwargs)
+        except Exception:
+            self._mapped.close()
+            raise
+
+    def _pipe_writer(self, source: MappedFile) -> None:
+        _write_mapped(self, source)
+
+    def cleanup(self) -> None:
+        super().cleanup()
+        self._mapped.close()
+
+class MappedFFmpegOpusAudio(discord.FFmpegOpusAudio):
+    """
+    FFmpegOpusAudio that remuxes or re-encodes a local file piped in from a memory map.
+
+    Args:
+        path (str): Cached Ogg/Opus file
+        start (float): Offset in seconds to start playing from, found through the file's page index
+        **kwargs: See ``discord.FFmpegOpusAudio``
+    """
+
+    def __init__(self, path: str, start: float = 0.0, **kwargs):
+        self._mapped = MappedFile(path)
+        try:
+            if start > 0:
+                _seek_mapped(self._mapped, path, start, kwargs)
+            super().__init__(self._mapped, pipe=True, **kwargs)
+        except Exception:
+            self._mapped.close()
+            raise
+
+    def _pipe_writer(self, source: MappedFile) -> None:
+        _write_mapped(self, source)
+
+    def cleanup(self) -> None:
+        super().cleanup()
+        self._mapped.close()
+
+class TeeFFmpegAudio(discord.FFmpegAudio):
+    """
+    Plays a remote stream while ffmpeg writes the audio to a file as well.
+
+    The file output keeps the original audio stream (remuxed into Ogg when it
+    is already Opus, otherwise encoded to Opus), so the file can be cached and
+    replayed without the network. Playback options such as filters only apply
+    to the playback output, whose format subclasses choose.
+
+    Args:
+        source (str): Stream URL
+        cache_path (str): File the Ogg/Opus copy is written to
+        playback_args (Sequence[str]): ffmpeg options selecting the playback output format
+        copy_codec (bool): Remux the audio instead of encoding it, for Opus sources
+        before_options (Optional[str]): ffmpeg options placed before ``-i``
+        options (Optional[str]): ffmpeg options for the playback output
+        stderr (Optional[IO[bytes]]): Where ffmpeg's log goes
+        on_finished (Optional[Callable[[bool], None]]): Called from the audio
+            thread on cleanup with True if the whole song was written
+    """
+
+    def __init__(self, source: str, cache_path: str, playback_args: Sequence[str], *,
+                 copy_codec: bool = False, before_options: Optional[str] = None,
+                 options: Optional[str] = None, stderr: Optional[IO[bytes]] = None,
+                 on_finished: Optional[Callable[[bool], None]] = None):
+        args = []
+        if before_options:
+            args.extend(shlex.split(before_options))
+        args.extend(('-i', source, '-loglevel', 'warning'))
+        # First output: the original audio for the cache
+        args.extend(('-map', '0:a:0', '-vn'))
+        args.extend(('-c:a', 'copy') if copy_codec else ('-c:a', 'libopus', '-b:a', '128k'))
+        args.extend(('-f', 'ogg', '-y', cache_path))
+        # Second output: the audio for playback
+        args.extend(('-map', '0:a:0'))
+        args.extend(playback_args)
+        if options:
+            args.extend(shlex.split(options))
+        args.append('pipe:1')
+
+        self.cache_path = cache_path
+        self.on_finished = on_finished
+        self._reached_end = False
+        super().__init__(source, args=args, stdin=subprocess.DEVNULL, stderr=stderr)
+
+    def cleanup(self) -> None:
+        completed = False
+        process = self._process
+        if self._reached_end and process:
+            # ffmpeg closes the PCM pipe before it finishes the Ogg trailer
+            try:
+                completed = process.wait(timeout=5) == 0
+            except subprocess.TimeoutExpired:
+                completed = False
+        super().cleanup()
+        if self.on_finished is not None:
+            self.on_finished(completed)
+
+class TeeFFmpegPCMAudio(TeeFFmpegAudio):
+    """TeeFFmpegAudio playing PCM, as FFmpegPCMAudio produces it."""
+
+    def __init__(self, source: str, cache_path: str, **kwargs):
+        super().__init__(source, cache_path, ('-f', 's16le', '-ar', '48000', '-ac', '2'), **kwargs)
+
+    def read(self) -> bytes:
+        ret = self._stdout.read(OpusEncoder.FRAME_SIZE)
+        if len(ret) != OpusEncoder.FRAME_SIZE:
+            self._reached_end = True
+            return b''
+        return ret
+
+    def read_into(self, buffer: memoryview) -> int:
+        """Read the next frame into a buffer, see ``StreamFFmpegPCMAudio.read_into``."""
+        size = self._stdout.readinto(buffer[:OpusEncoder.FRAME_SIZE])
+        if size != OpusEncoder.FRAME_SIZE:
+            self._reached_end = True
+            return 0
+        return size
+
+    def is_opus(self) -> bool:
+        return False
+
+class TeeFFmpegOpusAudio(TeeFFmpegAudio):
+    """
+    TeeFFmpegAudio playing Opus packets, as FFmpegOpusAudio produces them.
+
+    Args:
+        source (str): Stream URL
+        cache_path (str): File the Ogg/Opus copy is written to
+        copy_opus (bool): Pass the Opus stream through instead of encoding it;
+            playback options must then not contain filters
+        **kwargs: See ``TeeFFmpegAudio``
+    """
+
+    def __init__(self, source: str, cache_path: str, *, copy_opus: bool = False, **kwargs):
+        if copy_opus:
+            playback_args = ('-f', 'opus', '-c:a', 'copy')
+        else:
+            playback_args = ('-f', 'opus', '-c:a', 'libopus', '-ar', '48000', '-ac', '2', '-b:a', '128k',
+                             '-fec', 'true', '-packet_loss', '15')
+        super().__init__(source, cache_path, playback_args, **kwargs)
+        self._packet_iter = OggStream(self._stdout).iter_packets()
+
+    def read(self) -> bytes:
+        packet = next(self._packet_iter, b'')
+        if not packet:
+            self._reached_end = True
+        return packet
+
+    def is_opus(self) -> bool:
+        return True
+
+class ReadAheadAudio(discord.AudioSource):
+    """
+    Keeps a few seconds of another source's frames buffered ahead of playback.
+
+    A background thread reads the wrapped source into a ring of fixed-size
+    slots allocated up front, so a stall in ffmpeg's input (a CDN hiccup it
+    rides out with ``-reconnect``) drains the buffer instead of delaying the
+    voice thread. Sources with a ``read_into(buffer)`` method are read
+    straight into the ring without allocating per frame.
+
+    PCM frames are returned as a memoryview of their slot, which stays valid
+    until the next ``read`` (the ring has one slot more than it buffers);
+    the volume/DSP stage above copies or converts them anyway. Opus packets
+    are copied out as bytes, since they go to discord.py as they are and
+    its DAVE encryption is handed the packet object.
+
+    Playback starts once ``resume`` seconds are buffered (the wrapped source
+    would block the first read as well). If the buffer runs dry later,
+    silence is played until that much is buffered again, and the underrun is
+    counted. After ``give_up`` seconds of silence the source is treated as
+    dead and ``read`` returns b'', rather than waiting for ffmpeg to exhaust
+    its reconnect attempts against a URL that has expired.
+
+    Args:
+        original (discord.AudioSource): Source to read ahead of
+        seconds (float): Capacity of the buffer
+        resume (float): Seconds buffered again before playback resumes after an underrun
+        on_underrun (Optional[Callable[[], None]]): Called from the audio thread on each underrun
+        give_up (float): Seconds of continuous underrun after which playback ends (0 never gives up)
+    """
+
+    def __init__(self, original: discord.AudioSource, seconds: float = 3.0, resume: float = 0.2,
+                 on_underrun: Optional[Callable[[], None]] = None, give_up: float = 0.0):
+        self.original = original
+        self.on_underrun = on_underrun
+        frame_seconds = OpusEncoder.FRAME_LENGTH / 1000
+        self.capacity = max(1, int(seconds / frame_seconds))
+        self.resume_frames = min(self.capacity, max(1, int(resume / frame_seconds)))
+        self.give_up_frames = int(give_up / frame_seconds)
+        self._opus = original.is_opus()
+        self._silence = OPUS_SILENCE if self._opus else PCM_SILENCE
+        self._slot_size = OPUS_SLOT_SIZE if self._opus else OpusEncoder.FRAME_SIZE
+        # The slot of the frame read last is not refilled until the next read
+        self._slots = self.capacity + 1
+        self._ring = bytearray(self._slots * self._slot_size)
+        self._view = memoryview(self._ring)
+        self._lengths = array('i', [0]) * self._slots
+        # Packets too large for a slot, by slot
+        self._oversized: Dict[int, bytes] = {}
+        # Frames written and read so far; the difference is the fill level
+        self._written = 0
+        self._read = 0
+        self._ended = False
+        self._closed = False
+        self._started = False
+        self._rebuffering = False
+        self._cond = threading.Condition()
+        # Underruns, and silent frames played while the buffer refilled
+        self.underruns = 0
+        self.underrun_frames = 0
+        # Silent frames played since audio last came through, and whether that lasted too long
+        self._stall_frames = 0
+        self.stalled = False
+        self._thread = threading.Thread(target=self._fill, name='audio-read-ahead', daemon=True)
+        self._thread.start()
+
+    @property
+    def fill(self) -> int:
+        """Frames currently buffered."""
+        return self._written - self._read
+
+    @property
+    def fill_seconds(self) -> float:
+        return self.fill * OpusEncoder.FRAME_LENGTH / 1000
+
+    def _fill(self) -> None:
+        read_into = getattr(self.original, 'read_into', None)
+        try:
+            while True:
+                with self._cond:
+                    while self._written - self._read >= self.capacity and not self._closed:
+                        self._cond.wait()
+                    if self._closed:
+                        return
+                    slot = self._written % self._slots
+                # The reader never touches a slot until it has been published
+                start = slot * self._slot_size
+                if read_into is not None:
+                    size = read_into(self._view[start:start + self._slot_size])
+                else:
+                    data = self.original.read()
+                    size = len(data)
+                    if size > self._slot_size:
+                        self._oversized[slot] = data
+                    elif size:
+                        self._view[start:start + size] = data
+                if not size:
+                    break
+                self._lengths[slot] = size
+                with self._cond:
+                    self._written += 1
+                    self._cond.notify_all()
+        except Exception as e:
+            if not self._closed:
+                print(f"Error reading audio ahead: {e}")
+        with self._cond:
+            self._ended = True
+            self._cond.notify_all()
+
+    def wait_filled(self, frames: int, timeout: Optional[float] = None) -> int:
+        """
+        Block until ``frames`` frames (at most the capacity) are buffered or the source has ended.
+
+        Returns:
+            int: Frames buffered
+        """
+        frames = min(frames, self.capacity)
+        with self._cond:
+            self._cond.wait_for(lambda: self.fill >= frames or self._ended or self._closed, timeout)
+            return self.fill
+
+    def read(self) -> bytes:
+        with self._cond:
+            if not self._started:
+                # Ogg pages carry many packets, so the first one can arrive well before the rest
+                self._cond.wait_for(lambda: self.fill >= self.resume_frames or self._ended or self._closed)
+                self._started = True
+            if self.stalled:
+                return b''
+            if self._rebuffering and self.fill < self.resume_frames and not self._ended:
+                return self._stall()
+            self._rebuffering = False
+            if not self.fill:
+                if self._ended or self._closed:
+                    return b''
+                self._rebuffering = True
+                self.underruns += 1
+                underrun = True
+            else:
+                underrun = False
+                self._stall_frames = 0
+                slot = self._read % self._slots
+        if underrun:
+            metrics.increment('readahead_underruns')
+            if self.on_underrun is not None:
+                self.on_underrun()
+            with self._cond:
+                return self._stall()
+        size = self._lengths[slot]
+        if size > self._slot_size:
+            data = self._oversized.pop(slot)
+        else:
+            start = slot * self._slot_size
+            data = self._view[start:start + size]
+            if self._opus:
+                data = bytes(data)
+        with self._cond:
+            self._read += 1
+            self._cond.notify_all()
+        return data
+
+    def _stall(self) -> bytes:
+        """Play a silent frame while the buffer refills, or give up. Called with the lock held."""
+        if self.give_up_frames and self._stall_frames >= self.give_up_frames:
+            print(f"Read-ahead buffer empty for {self._stall_frames * OpusEncoder.FRAME_LENGTH / 1000:g}s, "
+                  f"giving up on the stream")
+            self.stalled = True
+            metrics.increment('readahead_stalls')
+            return b''
+        self._stall_frames += 1
+        self.underrun_frames += 1
+        return self._silence
+
+    def is_opus(self) -> bool:
+        return self._opus
+
+    def cleanup(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        # Killing ffmpeg also unblocks a read in the filling thread
+        self.original.cleanup()
+
+def live_ffmpeg_processes() -> int:
+    """
+    Count the ffmpeg processes this process has running, for any purpose.
+    
+    Reads /proc, so it only works on Linux; call it when metrics are
+    collected, not per frame.
+    
+    Returns:
+        int: Number of running ffmpeg child processes
+    """
+    parent = os.getpid()
+    count = 0
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as stat:
+                fields = stat.read()
+        except OSError:
+            # The process exited while the list was read
+            continue
+        # "pid (comm) state ppid ..."; the command name may itself contain spaces and parentheses
+        command = fields[fields.find(b'(') + 1:fields.rfind(b')')]
+        state_and_ppid = fields[fields.rfind(b')') + 2:].split(b' ', 2)
+        if command.startswith(b'ffmpeg') and int(state_and_ppid[1]) == parent and state_and_ppid[0] != b'Z':
+            count += 1
+    return count
+
+def find_source(source: Optional[discord.AudioSource], kind: Type[discord.AudioSource]
+                ) -> Optional[discord.AudioSource]:
+    """
+    Find a source of a given type among a chain of wrappers.
+
+    Args:
+        source (Optional[discord.AudioSource]): Outermost source
+        kind (Type[discord.AudioSource]): Type to look for
+
+    Returns:
+        Optional[discord.AudioSource]: The first source of that type, following ``original``
+    """
+    while source is not None and not isinstance(source, kind):
+        source = getattr(source, 'original', None)
+    return source
@@ -0,0 +1 @@
+"""Offline benchmarks for the music bot. Run the end-to-end scenarios with ``python -m benchmarks`` and a focused benchmark with ``python -m benchmarks.<name>``."""
@@ -0,0 +1,60 @@
+"""
+Run the end-to-end scenarios (see benchmarks/scenarios.py), or list the focused benchmarks.
+
+No network access needed; ``--ffmpeg`` plays through real ffmpeg processes
+streaming from a local CDN stand-in. The same options and ``--seed`` give
+the same extraction latencies and failures on every run; ``--json`` writes
+the reports for comparing runs.
+
+    python -m benchmarks
+    python -m benchmarks skip_storm many_guilds --speed 20 --failure-rate 0.05
+    python -m benchmarks --list
+"""
+import argparse
+import asyncio
+import json
+import pkgutil
+
+import benchmarks
+from benchmarks.scenarios import SCENARIOS, run
+from config import EXTRACTOR_WORKERS
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('scenarios', nargs='*', metavar='scenario', help=f"scenarios to run, all by default: {', '.join(SCENARIOS)}")
+    parser.add_argument('--list', action='store_true', help="list the focused benchmarks and exit")
+    parser.add_argument('--guilds', type=int, default=20, help="guilds playing at once in 'play'")
+    parser.add_argument('--many-guilds', type=int, default=100, help="guilds in 'many_guilds'")
+    parser.add_argument('--songs', type=int, default=30, help="songs skipped through in 'skip_storm'")
+    parser.add_argument('--skip-interval', type=float, default=0.05, help="seconds between skips in 'skip_storm'")
+    parser.add_argument('--queue-size', type=int, default=5000, help="songs queued in 'big_queue'")
+    parser.add_argument('--rounds', type=int, default=20, help="rounds of queue commands in 'big_queue'")
+    parser.add_argument('--think-time', type=float, default=0.2, help="most seconds between a user's commands")
+    parser.add_argument('--duration', type=float, default=30, help="song length in seconds")
+    parser.add_argument('--speed', type=float, default=10, help="voice clients read frames this much faster")
+    parser.add_argument('--latency', type=float, default=0.3, help="median seconds of a full extraction")
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help="log-normal spread of extraction latency")
+    parser.add_argument('--flat-latency', type=float, default=0.1, help="seconds of a flat listing")
+    parser.add_argument('--failure-rate', type=float, default=0.02, help="share of extractions that fail")
+    parser.add_argument('--workers', type=int, default=EXTRACTOR_WORKERS, help="extraction worker threads")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--ffmpeg', action='store_true', help="decode with ffmpeg from a local CDN stand-in")
+    parser.add_argument('--cdn-latency', type=float, default=0.05, help="seconds to the CDN's first byte")
+    parser.add_argument('--json', metavar='PATH', help="write the reports to a JSON file")
+    options = parser.parse_args()
+
+    if options.list:
+        for module in pkgutil.iter_modules(benchmarks.__path__):
+            if module.name.startswith('bench_'):
+                print(f"python -m benchmarks.{module.name}")
+        return
+    unknown = [name for name in options.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario {unknown[0]!r} (choose from {', '.join(SCENARIOS)})")
+    reports = asyncio.run(run(options.scenarios or list(SCENARIOS), options))
+    if options.json:
+        with open(options.json, 'w', encoding='utf-8') as f:
+            json.dump({'options': vars(options), 'reports': [report.as_dict() for report in reports]}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
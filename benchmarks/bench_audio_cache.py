@@ -0,0 +1,98 @@
+"""
+Replay a skewed play history against the on-disk audio cache.
+
+Songs are picked with Zipf-distributed popularity, as in a bot where a few
+tracks are requested over and over. Each miss stores a sparse file of the
+song's Ogg/Opus size, so no real audio or network is needed. Reports hit
+ratio, bytes not fetched from the CDN, restart recovery and mmap read speed.
+
+    python -m benchmarks.bench_audio_cache --plays 20000 --cache-mb 2048
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from typing import List, Tuple
+
+from audio_cache import AudioCache
+from audio_sources import MappedFile
+from benchmarks.common import format_summary
+
+# 128 kbit/s Opus
+BYTES_PER_SECOND = 16000
+
+def zipf_weights(size: int, exponent: float) -> List[float]:
+    return [1 / (rank ** exponent) for rank in range(1, size + 1)]
+
+def replay(cache: AudioCache, catalog: int, plays: int, exponent: float,
+           rng: random.Random) -> Tuple[List[float], int]:
+    """Play songs through the cache; returns lookup latencies and the bytes all plays stream."""
+    urls = [f"https://www.youtube.com/watch?v={i:011d}" for i in range(catalog)]
+    durations = [rng.randint(120, 420) for _ in range(catalog)]
+    picks = rng.choices(range(catalog), weights=zipf_weights(catalog, exponent), k=plays)
+    lookups = []
+    streamed = 0
+    for index in picks:
+        streamed += durations[index] * BYTES_PER_SECOND
+        start = time.perf_counter()
+        path = cache.lookup(urls[index])
+        lookups.append(time.perf_counter() - start)
+        if path is None:
+            tmp_path = cache.reserve(urls[index])
+            with open(tmp_path, 'wb') as f:
+                # Sparse file: the right size without writing the bytes
+                f.truncate(durations[index] * BYTES_PER_SECOND)
+            cache.commit(urls[index], tmp_path, True)
+    return lookups, streamed
+
+def read_speed(path: str, mapped: bool) -> float:
+    """Read a file the way ffmpeg's stdin writer does and return MB/s."""
+    start = time.perf_counter()
+    source = MappedFile(path) if mapped else open(path, 'rb')
+    total = 0
+    while True:
+        data = source.read(8192)
+        if not data:
+            break
+        total += len(data)
+    source.close()
+    return total / (time.perf_counter() - start) / 1e6
+
+def main(plays: int, catalog: int, cache_mb: int, exponent: float) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        cache = AudioCache(directory, cache_mb * 2**20)
+        lookups, streamed = replay(cache, catalog, plays, exponent, random.Random(1))
+        stats = cache.stats()
+        print(f"{plays} plays over {catalog} songs (zipf {exponent}), cache limit {cache_mb} MiB")
+        print(f"  hit ratio {stats['hit_ratio']:.1%}, {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['evictions']} evictions")
+        print(f"  CDN traffic: {streamed / 2**30:.2f} GiB without the cache, "
+              f"{(streamed - stats['bytes_saved']) / 2**30:.2f} GiB with it "
+              f"({stats['bytes_saved'] / 2**30:.2f} GiB served from disk)")
+        print("  " + format_summary("lookup", lookups))
+
+        cache.flush()
+        start = time.perf_counter()
+        reopened = AudioCache(directory, cache_mb * 2**20)
+        elapsed = time.perf_counter() - start
+        assert list(reopened.entries) == list(cache.entries), "LRU order lost across restart"
+        print(f"  restart: {len(reopened)} entries ({reopened.total_bytes / 2**20:.0f} MiB) "
+              f"reloaded in {elapsed * 1000:.1f}ms")
+
+        sample = os.path.join(directory, 'sample.bin')
+        with open(sample, 'wb') as f:
+            f.write(os.urandom(32 * 2**20))
+        # Warm the page cache so both runs read from memory
+        read_speed(sample, mapped=False)
+        print(f"  32 MiB file: buffered read {read_speed(sample, mapped=False):.0f} MB/s, "
+              f"mmap read {read_speed(sample, mapped=True):.0f} MB/s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--plays', type=int, default=20000)
+    parser.add_argument('--catalog', type=int, default=5000)
+    parser.add_argument('--cache-mb', type=int, default=2048)
+    parser.add_argument('--zipf', type=float, default=1.0)
+    args = parser.parse_args()
+    main(args.plays, args.catalog, args.cache_mb, args.zipf)
@@ -0,0 +1,156 @@
+"""
+Measure how CPU scales with listener count: one stream per guild versus one broadcast.
+
+Every listener is a thread reading a frame every 20 ms, as discord.py's audio
+thread does. Per guild, each listener gets its own source from
+MusicPlayer.create_audio_source (its own ffmpeg; in 'pcm' mode its own Opus
+encode in this process, as discord.py would). With a broadcast, one source
+and one encoder feed every listener the same packets. CPU of this process
+and of the ffmpeg children is divided by the seconds measured, so 100% is
+one core.
+
+Needs ffmpeg on PATH (with libopus), libopus for the Opus encoder in 'pcm'
+mode and Linux's /proc to read ffmpeg's CPU time; no network access.
+
+    python -m benchmarks.bench_broadcast --listeners 1 8 32 128 --seconds 10
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import discord
+from discord.opus import Encoder as OpusEncoder
+
+from benchmarks.bench_opus import load_opus, make_song_file, serve
+from benchmarks.common import quiet
+from benchmarks.fakes import FakeBot
+from broadcast import BroadcastHub
+import music_player
+from music_player import MusicPlayer, Song
+
+FRAME = OpusEncoder.FRAME_LENGTH / 1000
+# Per-guild streams are capped, one ffmpeg each
+MAX_STREAMS = 32
+# Seconds every listener gets to play its first frame
+WARMUP_TIMEOUT = 15.0
+
+def listen(source: discord.AudioSource, stop: threading.Event, counts: List[int], index: int) -> None:
+    """Read a frame every 20 ms like discord.py's AudioPlayer, encoding PCM to Opus as it does."""
+    encoder = None if source.is_opus() else OpusEncoder()
+    next_frame = time.perf_counter()
+    while not stop.is_set():
+        data = source.read()
+        if not data:
+            break
+        if encoder is not None:
+            encoder.encode(data, OpusEncoder.SAMPLES_PER_FRAME)
+        counts[index] += 1
+        next_frame += FRAME
+        time.sleep(max(0.0, next_frame - time.perf_counter()))
+    source.cleanup()
+
+def ffmpeg_cpu() -> float:
+    """CPU seconds used so far by this process's running children, from /proc (Linux)."""
+    total = 0
+    parent = str(os.getpid())
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        # Fields after the command name: state, ppid, ..., utime (12th), stime (13th)
+        if fields[1] == parent:
+            total += int(fields[11]) + int(fields[12])
+    return total / os.sysconf('SC_CLK_TCK')
+
+def measure(sources: List[discord.AudioSource], seconds: float) -> Tuple[float, float, int]:
+    """Run a listener per source; returns (own CPU, ffmpeg CPU) per second and the frames read in that time."""
+    stop = threading.Event()
+    counts = [0] * len(sources)
+    threads = [threading.Thread(target=listen, args=(source, stop, counts, i), daemon=True)
+               for i, source in enumerate(sources)]
+    for thread in threads:
+        thread.start()
+    # ffmpeg's start-up is not part of the steady state
+    deadline = time.perf_counter() + WARMUP_TIMEOUT
+    while not all(counts) and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    time.sleep(0.5)
+    frames_start = sum(counts)
+    own_start, child_start, wall_start = time.process_time(), ffmpeg_cpu(), time.perf_counter()
+    time.sleep(seconds)
+    own, child = time.process_time() - own_start, ffmpeg_cpu() - child_start
+    wall = time.perf_counter() - wall_start
+    frames = sum(counts) - frames_start
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return own / wall, child / wall, frames
+
+async def per_guild(player: MusicPlayer, song: Song, listeners: int, seconds: float) -> Tuple[float, float, int]:
+    sources = [player.create_audio_source(song) for _ in range(listeners)]
+    return await asyncio.to_thread(measure, sources, seconds)
+
+async def broadcast(player: MusicPlayer, song: Song, listeners: int, seconds: float) -> Tuple[float, float, int]:
+    hub = BroadcastHub()
+    on_air = await player.start_broadcast(hub, 'bench', song)
+    sources = [on_air.subscribe() for _ in range(listeners)]
+    result = await asyncio.to_thread(measure, sources, seconds)
+    on_air.stop()
+    return result
+
+async def main(listeners: List[int], seconds: float, mode: Optional[str]) -> None:
+    if shutil.which('ffmpeg') is None:
+        print("ffmpeg is not on PATH, skipping")
+        return
+    if mode is None:
+        mode = 'pcm' if load_opus() else 'opus'
+    elif mode == 'pcm' and not load_opus():
+        print("libopus not found for the Opus encoder, skipping")
+        return
+    music_player.PLAYBACK_MODE = mode
+    with tempfile.TemporaryDirectory() as directory:
+        make_song_file(directory, int(seconds) + 30)
+        server = serve(directory)
+        url = f"http://127.0.0.1:{server.server_address[1]}/song.webm"
+        player = MusicPlayer(FakeBot(asyncio.get_running_loop()))
+        # Each mode's default volume; at 1.0 'opus' streams pass through ffmpeg without re-encoding
+        player.volume = 1.0 if mode == 'opus' else 0.5
+        song = Song("bench", "https://www.youtube.com/watch?v=benchcast00", int(seconds) + 30)
+        song.set_stream_url(url, codec='opus')
+        print(f"'{mode}' playback, {seconds:g}s measured per case, {os.cpu_count()} CPUs; "
+              f"CPU as % of one core, then the share of frames delivered in real time")
+        print(f"  {'listeners':>9}  {'per guild':>29}  {'broadcast':>29}")
+        for count in listeners:
+            cells = []
+            for label, run in (("per guild", per_guild), ("broadcast", broadcast)):
+                if run is per_guild and count > MAX_STREAMS:
+                    cells.append(f"{'(skipped)':>29}")
+                    continue
+                with quiet():
+                    own, child, frames = await run(player, song, count, seconds)
+                # Below 100% the listeners heard stutter: the CPU could not keep up
+                delivered = frames / (count * seconds / FRAME)
+                if run is broadcast:
+                    assert delivered >= 0.95, f"broadcast to {count} listeners delivered {delivered:.0%} of the frames"
+                cells.append(f"{(own + child) * 100:6.1f}% (ffmpeg {child * 100:5.1f}%) {min(delivered, 1.0):4.0%}")
+            print(f"  {count:>9}  " + "  ".join(cells))
+        player.extractor.shutdown()
+        server.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--listeners', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--mode', choices=['pcm', 'opus'], default=None,
+                        help="playback mode (default: 'pcm' if libopus is found, else 'opus')")
+    args = parser.parse_args()
+    asyncio.run(main(args.listeners, args.seconds, args.mode))
@@ -0,0 +1,109 @@
+"""
+Measure PCM frames processed per second by the volume/DSP wrappers.
+
+Each wrapper reads 20 ms frames of stereo noise from an in-memory source, as
+discord.py's audio thread does before encoding. 50 frames/s is one voice
+stream in real time. Also reports the largest jump between two samples when
+the volume changes mid-tone, which is heard as a click.
+
+    python -m benchmarks.bench_dsp --frames 20000
+"""
+import argparse
+import math
+import time
+from typing import Callable, List
+
+import discord
+from discord.opus import Encoder as OpusEncoder
+
+import dsp
+from benchmarks.fakes import FakeAudioSource
+
+np = dsp.np
+
+class NoiseSource(FakeAudioSource):
+    """PCM source cycling through pre-generated frames."""
+
+    def __init__(self, frames: List[bytes], count: int):
+        super().__init__(count)
+        self.pool = frames
+
+    def read(self) -> bytes:
+        if self.read_count >= self.frames:
+            return b''
+        frame = self.pool[self.read_count % len(self.pool)]
+        self.read_count += 1
+        return frame
+
+def noise_frames(count: int = 50) -> List[bytes]:
+    rng = np.random.default_rng(1)
+    shape = (OpusEncoder.SAMPLES_PER_FRAME, OpusEncoder.CHANNELS)
+    return [rng.normal(0, 8000, shape).clip(-32768, 32767).astype(np.int16).tobytes() for _ in range(count)]
+
+def tone_frames(count: int) -> List[bytes]:
+    """A 440 Hz tone at half scale, peaking where the middle frame starts."""
+    t = np.arange(count * OpusEncoder.SAMPLES_PER_FRAME) / OpusEncoder.SAMPLING_RATE
+    t -= count // 2 * OpusEncoder.FRAME_LENGTH / 1000
+    wave = (np.cos(2 * math.pi * 440 * t) * 16384).astype(np.int16)
+    stereo = np.repeat(wave[:, None], OpusEncoder.CHANNELS, axis=1)
+    return [frame.tobytes() for frame in np.split(stereo, count)]
+
+def throughput(make: Callable[[discord.AudioSource], discord.AudioSource], frames: List[bytes],
+               count: int, volume_changes: bool = False) -> float:
+    source = make(NoiseSource(frames, count))
+    start = time.perf_counter()
+    read = source.read
+    if volume_changes:
+        # A new volume every 10 frames keeps the gain ramp busy
+        for i in range(count):
+            if i % 10 == 0:
+                source.volume = 0.3 + (i % 70) / 100
+            read()
+    else:
+        for _ in range(count):
+            read()
+    return count / (time.perf_counter() - start)
+
+def largest_step(make: Callable[[discord.AudioSource], discord.AudioSource]) -> int:
+    """Play a tone, change the volume from 100% to 20% halfway, return the largest sample-to-sample jump."""
+    frames = tone_frames(20)
+    source = make(NoiseSource(frames, len(frames)))
+    out = []
+    for i in range(len(frames)):
+        if i == len(frames) // 2:
+            source.volume = 0.2
+        # Copied, as DSPAudio reuses its frame buffer
+        out.append(np.frombuffer(source.read(), dtype=np.int16)[::OpusEncoder.CHANNELS].copy())
+    return int(np.abs(np.diff(np.concatenate(out).astype(np.int32))).max())
+
+def main(count: int) -> None:
+    if dsp.np is None:
+        print("NumPy is not installed, skipping")
+        return
+    frames = noise_frames()
+    cases = [
+        ("PCMVolumeTransformer", lambda s: discord.PCMVolumeTransformer(s, 0.125)),
+        ("DSPAudio gain", lambda s: dsp.DSPAudio(s, 0.5, 0.25, limiter=False)),
+        ("DSPAudio gain+limiter", lambda s: dsp.DSPAudio(s, 0.5, 0.25)),
+        ("DSPAudio limiting", lambda s: dsp.DSPAudio(s, 1.0, 4.0)),
+    ]
+    if dsp.sosfilt is not None:
+        cases.append(("DSPAudio +EQ", lambda s: dsp.DSPAudio(s, 0.5, 0.25, stages=[dsp.Equalizer(4, -2)])))
+    print(f"{count} frames of 20 ms stereo PCM (50 frames/s = one stream in real time)")
+    for label, make in cases:
+        steady = throughput(make, frames, count)
+        ramping = throughput(make, frames, count, volume_changes=True)
+        print(f"  {label:<24} {steady:9.0f} frames/s ({steady / 50:6.0f} streams/core), "
+              f"{ramping:9.0f} frames/s with volume changes")
+    if dsp.sosfilt is None:
+        print("  (SciPy is not installed, equalizer not measured)")
+    print("Largest sample step when the volume drops 100% -> 20% on a 440 Hz tone "
+          "(a clean tone steps at most ~950)")
+    print(f"  PCMVolumeTransformer {largest_step(lambda s: discord.PCMVolumeTransformer(s, 1.0))}")
+    print(f"  DSPAudio             {largest_step(lambda s: dsp.DSPAudio(s, 1.0, limiter=False))}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--frames', type=int, default=20000)
+    args = parser.parse_args()
+    main(args.frames)
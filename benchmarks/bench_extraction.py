@@ -0,0 +1,75 @@
+"""
+Compare extraction throughput and event-loop lag of the thread and process backends.
+
+The fake extractor burns ``--cpu`` seconds of GIL-holding Python and waits
+``--latency`` seconds of simulated network per job. A ticker task measures how
+late the event loop wakes up while the jobs run.
+
+    python -m benchmarks.bench_extraction --jobs 200 --workers 4
+"""
+import argparse
+import asyncio
+import functools
+import time
+from typing import List
+
+from benchmarks.common import format_summary
+from benchmarks.fakes import FakeYoutubeDL
+from extraction import create_extractor
+import metrics
+
+async def measure_lag(interval: float, lags: List[float], done: asyncio.Event) -> None:
+    while not done.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+async def run_backend(backend: str, jobs: int, workers: int, cpu: float, latency: float) -> None:
+    factory = functools.partial(FakeYoutubeDL, cpu_work=cpu, latency=latency)
+    extractor = create_extractor(backend, workers=workers, ytdl_factory=factory)
+    # Warm the workers up so pool start-up is not counted
+    await asyncio.gather(*(extractor.extract(f"warmup {i}") for i in range(workers)))
+
+    lags: List[float] = []
+    done = asyncio.Event()
+    ticker = asyncio.create_task(measure_lag(0.005, lags, done))
+    start = time.perf_counter()
+    await asyncio.gather(*(extractor.extract(f"song {i}") for i in range(jobs)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await ticker
+    extractor.shutdown()
+
+    print(f"{backend:>7}: {jobs / elapsed:7.1f} jobs/s ({elapsed:.2f}s for {jobs} jobs)")
+    print("         " + format_summary("event loop lag", lags))
+
+async def run_burst(callers: int, latency: float) -> None:
+    """Many users !play the same link at once; only one extraction should run."""
+    factory = functools.partial(FakeYoutubeDL, latency=latency)
+    extractor = create_extractor('thread', ytdl_factory=factory)
+    before = metrics.snapshot()
+    queries = [f"https://www.youtube.com/watch?v=dQw4w9WgXcQ&t={i}" for i in range(callers)]
+    start = time.perf_counter()
+    await asyncio.gather(*(extractor.extract(query) for query in queries))
+    elapsed = time.perf_counter() - start
+    extractor.shutdown()
+    after = metrics.snapshot()
+    jobs = after.get('extractions', 0) - before.get('extractions', 0)
+    coalesced = after.get('extractions_coalesced', 0) - before.get('extractions_coalesced', 0)
+    print(f"Burst: {callers} identical requests ran {jobs} job(s), {coalesced} coalesced, "
+          f"{elapsed * 1000:.0f}ms total")
+
+async def main(jobs: int, workers: int, cpu: float, latency: float) -> None:
+    print(f"{jobs} jobs, {workers} workers, {cpu * 1000:.0f}ms CPU + {latency * 1000:.0f}ms wait per job")
+    for backend in ('thread', 'process'):
+        await run_backend(backend, jobs, workers, cpu, latency)
+    await run_burst(10, latency)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--cpu', type=float, default=0.02)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+    asyncio.run(main(args.jobs, args.workers, args.cpu, args.latency))
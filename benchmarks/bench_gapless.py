@@ -0,0 +1,79 @@
+"""
+Measure the silence between tracks with and without gapless playback.
+
+A fake voice client reads a frame every 20 ms, as discord.py's audio thread
+does, and fake sources take ``--startup`` seconds to produce their first
+frame, like ffmpeg connecting to a stream and probing it. Without gapless
+playback that startup is heard between every two songs; with it the next
+source is started and primed while the current song still plays.
+
+    python -m benchmarks.bench_gapless --tracks 5 --startup 0.3
+"""
+import argparse
+import asyncio
+import functools
+import time
+import types
+
+from benchmarks.common import format_summary, percentile, quiet
+from benchmarks.fakes import CadenceVoiceClient, FakeGuild, FakeVoiceChannel, FakeYoutubeDL, OfflineMusicPlayer
+from extraction import ThreadExtractor
+import metrics
+import music_player
+from music_player import Song
+
+FRAME = 0.02
+# A gapless switch must not be later than one frame
+GAP_BUDGET = FRAME
+
+def frame_gaps(received: list) -> list:
+    """Silence between the last frame of each source and the first frame of the next."""
+    gaps = []
+    for (previous, previous_marker), (now, marker) in zip(received, received[1:]):
+        if marker != previous_marker:
+            gaps.append(max(0.0, now - previous - FRAME))
+    return gaps
+
+async def measure(preload: float, tracks: int, track_seconds: int, startup: float) -> tuple:
+    music_player.GAPLESS_PRELOAD_SECONDS = preload
+    metrics.counters.pop('gapless_transitions', None)
+    bot = types.SimpleNamespace(loop=asyncio.get_running_loop())
+    extractor = ThreadExtractor(ytdl_factory=functools.partial(FakeYoutubeDL, duration=track_seconds))
+    player = OfflineMusicPlayer(bot, guild_id=1, extractor=extractor)
+    player.source_frames = int(track_seconds / FRAME)
+    player.source_startup = startup
+    player.voice_client = CadenceVoiceClient(FakeVoiceChannel(1, FakeGuild(1)))
+
+    with quiet():
+        for i in range(tracks):
+            await player.add_to_queue(Song(f"Track {i}", f"https://www.youtube.com/watch?v=track{i:06d}",
+                                           track_seconds))
+        await player.play_next()
+        deadline = time.monotonic() + tracks * (track_seconds + startup) + 5
+        while (player.current_song is not None or player.queue) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await player.stop()
+        await asyncio.sleep(0.05)
+    extractor.shutdown()
+    return frame_gaps(player.voice_client.received), metrics.counters.get('gapless_transitions', 0)
+
+async def main(tracks: int, track_seconds: int, startup: float, preload: float) -> None:
+    off, _ = await measure(0, tracks, track_seconds, startup)
+    on, switches = await measure(preload, tracks, track_seconds, startup)
+    print(f"Source startup {startup * 1000:.0f}ms, {tracks} tracks of {track_seconds}s, 20 ms frames")
+    print(format_summary("gap, gapless off", off))
+    print(format_summary(f"gap, gapless on (preload {preload:g}s)", on))
+    print(f"{switches} of {tracks - 1} track changes switched at a frame boundary")
+    assert len(on) == tracks - 1, f"expected {tracks - 1} track changes, saw {len(on)}"
+    worst = percentile(on, 100)
+    assert worst <= GAP_BUDGET, f"gap {worst * 1000:.0f}ms exceeds {GAP_BUDGET * 1000:.0f}ms budget"
+    print(f"OK: every gap under {GAP_BUDGET * 1000:.0f}ms with gapless playback")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=5)
+    parser.add_argument('--track-seconds', type=int, default=2)
+    parser.add_argument('--startup', type=float, default=0.3)
+    parser.add_argument('--preload', type=float, default=1.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.tracks, args.track_seconds, args.startup, args.preload))
@@ -0,0 +1,100 @@
+"""
+Drive thousands of simulated guilds through !join/!play/!skip against fake voice clients.
+
+Reports per-guild memory of the player registry and per-command latency.
+
+    python -m benchmarks.bench_guilds --guilds 5000
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+from typing import Dict, List
+
+from benchmarks.common import format_summary, quiet
+from benchmarks.fakes import FakeContext, FakeYoutubeDL, OfflineMusicPlayer
+
+with quiet():
+    import bot as bot_module
+from extraction import ThreadExtractor
+import metrics
+from player_manager import PlayerManager
+
+def make_manager(idle_timeout: float = 300) -> PlayerManager:
+    manager = PlayerManager(bot_module.bot, idle_timeout=idle_timeout,
+                            player_factory=OfflineMusicPlayer)
+    manager.extractor = ThreadExtractor(ytdl_factory=FakeYoutubeDL)
+    manager.audio_cache = None
+    manager.loudness = None
+    bot_module.players = manager
+    return manager
+
+async def drive_guild(guild_id: int, timings: Dict[str, List[float]]) -> None:
+    ctx = FakeContext(guild_id)
+    for name, call in (
+        ('join', lambda: bot_module.join_voice_channel.callback(ctx)),
+        ('play', lambda: bot_module.play_music.callback(ctx, query=f"song a {guild_id}")),
+        ('play (queued)', lambda: bot_module.play_music.callback(ctx, query=f"song b {guild_id}")),
+        ('skip', lambda: bot_module.skip_song.callback(ctx)),
+    ):
+        start = time.perf_counter()
+        await call()
+        timings[name].append(time.perf_counter() - start)
+
+async def run_guilds(guilds: int, concurrency: int) -> Dict[str, List[float]]:
+    timings: Dict[str, List[float]] = {'join': [], 'play': [], 'play (queued)': [], 'skip': []}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(guild_id: int) -> None:
+        async with semaphore:
+            await drive_guild(guild_id, timings)
+
+    await asyncio.gather(*(bounded(guild_id) for guild_id in range(1, guilds + 1)))
+    # Let the skip callbacks start the queued songs
+    await asyncio.sleep(0.1)
+    return timings
+
+async def main(guilds: int, concurrency: int) -> None:
+    bot_module.bot.loop = asyncio.get_running_loop()
+
+    # Latency pass
+    manager = make_manager()
+    with quiet():
+        start = time.perf_counter()
+        timings = await run_guilds(guilds, concurrency)
+        elapsed = time.perf_counter() - start
+    playing = manager.stats()['playing']
+
+    # Memory pass, separate because tracemalloc slows everything down
+    manager = make_manager()
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    with quiet():
+        await run_guilds(guilds, concurrency)
+    current = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    grown = sum(stat.size_diff for stat in current.compare_to(baseline, 'filename'))
+
+    # Eviction pass: stop everything and let the reaper clear the registry
+    with quiet():
+        for player in manager.players.values():
+            await player.stop()
+        await asyncio.sleep(0.1)
+        start = time.perf_counter()
+        evicted = await manager.evict_idle(now=time.monotonic() + manager.idle_timeout)
+        evict_time = time.perf_counter() - start
+
+    print(f"Guilds: {guilds} (concurrency {concurrency}), wall time {elapsed:.2f}s, "
+          f"{guilds * 4 / elapsed:.0f} commands/s, {playing} guilds playing")
+    for name, samples in timings.items():
+        print(format_summary(name, samples))
+    print(f"Memory: {grown / guilds / 1024:.1f} KiB per guild ({grown / 1024 / 1024:.1f} MiB total)")
+    print(f"Evicted {evicted} idle players in {evict_time * 1000:.1f}ms, {len(manager)} left")
+    print(f"Stream URLs: {metrics.snapshot()}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--guilds', type=int, default=3000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.guilds, args.concurrency))
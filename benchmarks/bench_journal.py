@@ -0,0 +1,107 @@
+"""
+Measure the cost of the queue journal on add_to_queue and how long a restart takes to restore.
+
+A journal for ``--guilds`` guilds, each with a queue and a playing song, is
+written through the real writer thread and then restored into a fresh
+PlayerManager that reconnects to fake voice channels.
+
+    python -m benchmarks.bench_journal --guilds 10000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import List, Optional
+
+from benchmarks.common import format_summary, quiet
+from benchmarks.bench_extraction import measure_lag
+from benchmarks.fakes import FakeBot, FakeYoutubeDL, OfflineMusicPlayer
+from extraction import ThreadExtractor
+from music_player import Song
+from player_manager import PlayerManager
+from queue_journal import QueueJournal
+
+def make_song(guild_id: int, i: int) -> Song:
+    song = Song(f"Artist {i % 50} - Track {guild_id}/{i}", f"https://www.youtube.com/watch?v={guild_id:06d}{i:05d}",
+                180 + i % 120, f"https://i.ytimg.com/vi/{guild_id:06d}{i:05d}/hqdefault.jpg")
+    song.requester_id = 10**17 + guild_id
+    return song
+
+async def time_adds(journal: Optional[QueueJournal], adds: int) -> List[float]:
+    player = OfflineMusicPlayer(FakeBot(asyncio.get_running_loop()), guild_id=1, journal=journal,
+                                extractor=ThreadExtractor(ytdl_factory=FakeYoutubeDL))
+    player.prefetcher.depth = 0
+    songs = [make_song(1, i) for i in range(adds)]
+    samples = []
+    for song in songs:
+        start = time.perf_counter()
+        await player.add_to_queue(song)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def write_journal(path: str, guilds: int, queue_length: int) -> None:
+    """Journal the history of many guilds: a playlist, a few edits and a playing song."""
+    journal = QueueJournal(path, tick_interval=0)
+    journal.start()
+    now = time.time()
+    for guild_id in range(1, guilds + 1):
+        songs = [make_song(guild_id, i).to_record() for i in range(queue_length)]
+        journal.record(guild_id, 'extend', songs=songs)
+        journal.record(guild_id, 'popleft')
+        journal.record(guild_id, 'play', song=songs[0], t=now - 60, channel=guild_id * 10)
+        journal.record(guild_id, 'move', i=3, to=1)
+        journal.record(guild_id, 'remove', i=5)
+        journal.record(guild_id, 'add', song=make_song(guild_id, queue_length).to_record())
+    journal.close()
+
+async def restore(path: str) -> None:
+    manager = PlayerManager(FakeBot(asyncio.get_running_loop()), player_factory=OfflineMusicPlayer)
+    manager.extractor = ThreadExtractor(workers=8, ytdl_factory=FakeYoutubeDL)
+    manager.journal = QueueJournal(path)
+    manager.audio_cache = None
+    manager.loudness = None
+    size = os.path.getsize(path)
+    lags: List[float] = []
+    done = asyncio.Event()
+    ticker = asyncio.create_task(measure_lag(0.005, lags, done))
+    with quiet():
+        start = time.perf_counter()
+        restored = await manager.restore()
+        rebuilt = time.perf_counter() - start
+        done.set()
+        await ticker
+        await asyncio.gather(*manager._closing)
+        resumed = time.perf_counter() - start
+    playing = manager.stats()['playing']
+    queued = sum(len(player.queue) for player in manager.players.values())
+    manager.journal.close()
+    manager.extractor.shutdown()
+    print(f"  {size / 2**20:6.1f} MiB journal: {restored} queues ({queued} songs) rebuilt in "
+          f"{rebuilt * 1000:.0f}ms, {playing} guilds playing again after {resumed:.2f}s")
+    print("    " + format_summary("event loop lag", lags))
+
+async def main(guilds: int, queue_length: int, adds: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'queue_journal.jsonl')
+
+        print(f"add_to_queue, {adds} calls")
+        print("  " + format_summary("without journal", await time_adds(None, adds)))
+        journal = QueueJournal(path)
+        journal.start()
+        print("  " + format_summary("with journal", await time_adds(journal, adds)))
+        journal.close()
+
+        print(f"Restore of {guilds} guilds with {queue_length} queued songs each")
+        write_journal(path, guilds, queue_length)
+        await restore(path)
+        # The first restore compacted the journal into one snapshot per guild
+        await restore(path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--guilds', type=int, default=10000)
+    parser.add_argument('--queue-length', type=int, default=20)
+    parser.add_argument('--adds', type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(main(args.guilds, args.queue_length, args.adds))
@@ -0,0 +1,153 @@
+"""
+Measure the local music library: search latency at library scale and incremental scans.
+
+Searches run against a synthetic library of ``--tracks`` tagged tracks, by
+the word and trigram index and, for comparison, by a linear scan that checks
+every track for the query's words. Scans index ``--files`` real audio files
+(copies of one short song made by ffmpeg), then rescan them unchanged and
+after touching a few, which should read only those files again.
+
+Needs ffmpeg on PATH for the scan part; no network access.
+
+    python -m benchmarks.bench_library --tracks 100000 --files 300
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.common import format_summary
+from library import MusicLibrary, TextIndex, tokenize
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'to', 'ne', 'su', 'vi', 'da', 'po', 'ri', 'an', 'el', 'or', 'un', 'be']
+
+def make_words(rng: random.Random, count: int) -> List[str]:
+    return [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(count)]
+
+def make_tracks(size: int, seed: int = 1) -> List[Tuple[str, str, str]]:
+    """Get (title, artist, album) of ``size`` made-up tracks; common words are much more frequent."""
+    rng = random.Random(seed)
+    words = make_words(rng, 20000)
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    artists = [' '.join(make_words(rng, rng.randint(1, 2))).title() for _ in range(max(1, size // 20))]
+    tracks = []
+    for _ in range(size):
+        title = ' '.join(rng.choices(words, weights, k=rng.randint(1, 5))).title()
+        album = ' '.join(rng.choices(words, weights, k=rng.randint(1, 3))).title()
+        tracks.append((title, rng.choice(artists), album))
+    return tracks
+
+def typo_query(query: str, rng: random.Random) -> str:
+    """Swap two adjacent letters inside the longest word of a query."""
+    words = query.split()
+    longest = max(range(len(words)), key=lambda i: len(words[i]))
+    word = words[longest]
+    if len(word) >= 4:
+        i = rng.randrange(1, len(word) - 2)
+        words[longest] = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return ' '.join(words)
+
+def make_queries(tracks: List[Tuple[str, str, str]], count: int,
+                 seed: int = 2) -> Tuple[List[int], Dict[str, List[str]]]:
+    """Get the tracks picked and queries for them of every kind, the n-th query of each for the n-th track."""
+    rng = random.Random(seed)
+    ids = [rng.randrange(len(tracks)) for _ in range(count)]
+    picks = [tracks[doc_id] for doc_id in ids]
+    return ids, {
+        'title': [title for title, _, _ in picks],
+        'artist + title word': [f"{artist} {title.split()[0]}" for title, artist, _ in picks],
+        'prefixes': [' '.join(word[:4] for word in title.split()[:2]) for title, _, _ in picks],
+        'typo (fuzzy)': [typo_query(f"{artist} {title.split()[0]}", rng) for title, artist, _ in picks],
+        'no match': [f"zq{rng.randrange(10 ** 6)}x" for _ in picks],
+    }
+
+def linear_search(documents: List[List[str]], query: str, limit: int = 10) -> List[int]:
+    """Check every track for every query word, as a search without an index would."""
+    words = tokenize(query)
+    matches = []
+    for doc_id, document in enumerate(documents):
+        if all(any(word in candidate for candidate in document) for word in words):
+            matches.append(doc_id)
+            if len(matches) >= limit:
+                break
+    return matches
+
+def timed(run: Callable[[str], object], queries: List[str]) -> List[float]:
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        run(query)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def bench_search(size: int, count: int) -> None:
+    tracks = make_tracks(size)
+    index = TextIndex()
+    start = time.perf_counter()
+    for doc_id, (title, artist, album) in enumerate(tracks):
+        index.add(doc_id, title, f"{artist} {album}")
+    print(f"{size} tracks indexed in {time.perf_counter() - start:.2f}s")
+    documents = [tokenize(f"{title} {artist} {album}") for title, artist, album in tracks]
+    ids, queries = make_queries(tracks, count)
+    found = sum(1 for query in queries['title'] if index.search(query, 1, fuzzy=False))
+    assert found == count, "every title should find a track"
+    for label in ('artist + title word', 'typo (fuzzy)'):
+        hits = sum(1 for doc_id, query in zip(ids, queries[label])
+                   if doc_id in [result for result, _ in index.search(query, 10)])
+        print(f"{label}: the track searched for is among the first 10 results for {hits}/{count} queries")
+    for label, batch in queries.items():
+        samples = timed(lambda query: index.search(query, 10), batch)
+        print(format_summary(f"index: {label}", samples))
+        # A linear scan is slow; a tenth of the queries is enough
+        if label != 'typo (fuzzy)':
+            print(format_summary(f"linear: {label}", timed(lambda query: linear_search(documents, query),
+                                                            batch[:max(1, count // 10)])))
+
+def bench_scan(files: int, workers: int) -> None:
+    if shutil.which('ffmpeg') is None:
+        print("ffmpeg is not on PATH, skipping the scan")
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        music = os.path.join(directory, 'music')
+        os.makedirs(music)
+        song = os.path.join(directory, 'song.mp3')
+        subprocess.run(['ffmpeg', '-hide_banner', '-loglevel', 'error', '-f', 'lavfi', '-i', 'sine=d=5',
+                        '-metadata', 'title=Bench Song', '-metadata', 'artist=Bench Artist', song], check=True)
+        for i in range(files):
+            folder = os.path.join(music, f"album{i // 20}")
+            os.makedirs(folder, exist_ok=True)
+            shutil.copy(song, os.path.join(folder, f"track{i}.mp3"))
+        index_path = os.path.join(directory, 'index.json')
+        library = MusicLibrary([music], index_path, workers)
+        full = library.scan()
+        print(f"full scan of {files} files: {full['seconds']:.2f}s ({workers} workers), {full['added']} added")
+        unchanged = library.scan()
+        print(f"rescan, nothing changed: {unchanged['seconds'] * 1000:.1f}ms, {unchanged['unchanged']} unchanged")
+        touched = sorted(library.tracks)[:10]
+        for path in touched:
+            os.utime(path, (time.time() + 1, time.time() + 1))
+        os.remove(sorted(library.tracks)[-1])
+        partial = library.scan()
+        print(f"rescan, 10 touched and 1 deleted: {partial['seconds'] * 1000:.1f}ms, "
+              f"{partial['updated']} updated, {partial['removed']} removed")
+        restarted = MusicLibrary([music], index_path, workers)
+        loaded = restarted.scan()
+        print(f"restart from the saved index: {len(restarted)} tracks, rescan {loaded['seconds'] * 1000:.1f}ms")
+        assert unchanged['added'] == unchanged['updated'] == 0, "an unchanged library should not be read again"
+        assert partial['updated'] == len(touched) and partial['removed'] == 1
+        assert loaded['added'] == loaded['updated'] == 0, "a restart should not read the files again"
+    print("OK: rescans read only the changed files")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--files', type=int, default=300)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+    bench_search(args.tracks, args.queries)
+    bench_scan(args.files, args.workers)
@@ -0,0 +1,150 @@
+"""
+Measure what the metrics cost: the per-frame hook, recording a sample and serving /metrics.
+
+The first-frame hook is the only instrumentation on the per-frame path;
+frames are read through GaplessAudio with and without it. A scrape of the
+Prometheus endpoint is timed with ``--guilds`` players registered, and the
+frame timing of a playing voice client is compared with and without a
+scrape every ``--scrape-interval`` seconds.
+
+No network access or ffmpeg needed.
+
+    python -m benchmarks.bench_metrics --frames 200000 --guilds 1000
+"""
+import argparse
+import asyncio
+import re
+import statistics
+import time
+from typing import List
+
+from benchmarks.common import format_summary, percentile, quiet
+from benchmarks.fakes import (CadenceVoiceClient, FakeAudioSource, FakeBot, FakeGuild, FakeVoiceChannel,
+                              FakeVoiceClient, FakeYoutubeDL, OfflineMusicPlayer)
+from extraction import ThreadExtractor
+from gapless import GaplessAudio
+import metrics
+from music_player import Song
+from player_manager import PlayerManager
+
+# Per-frame cost allowed for instrumentation, as a share of the 20 ms frame
+FRAME_BUDGET_SHARE = 0.001
+_SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*"\})? \S+$')
+
+def read_frames(frames: int, hooked: bool) -> float:
+    """Get the seconds per frame of reading a song through GaplessAudio."""
+    audio = GaplessAudio(FakeAudioSource(frames), None, None, preload=0,
+                         on_first_frame=(lambda: None) if hooked else None)
+    start = time.perf_counter()
+    while audio.read():
+        pass
+    return (time.perf_counter() - start) / frames
+
+def bench_frame_path(frames: int, rounds: int = 7) -> None:
+    plain: List[float] = []
+    hooked: List[float] = []
+    # Interleaved, so drift in the machine's speed hits both alike
+    for _ in range(rounds):
+        plain.append(read_frames(frames, False))
+        hooked.append(read_frames(frames, True))
+    base, instrumented = statistics.median(plain), statistics.median(hooked)
+    overhead = instrumented - base
+    print(f"GaplessAudio.read: {base * 1e9:.0f}ns/frame without the first-frame hook, "
+          f"{instrumented * 1e9:.0f}ns/frame with it ({overhead * 1e9:+.0f}ns, "
+          f"{overhead / 0.02:.5%} of a 20 ms frame)")
+    start = time.perf_counter()
+    for i in range(frames):
+        metrics.observe('bench_metrics_seconds', i * 1e-6)
+    print(f"metrics.observe: {(time.perf_counter() - start) / frames * 1e9:.0f}ns per sample "
+          f"(per track event, never per frame)")
+    metrics.timings.pop('bench_metrics_seconds')
+    metrics.histograms.pop('bench_metrics_seconds')
+    assert overhead < 0.02 * FRAME_BUDGET_SHARE, "the first-frame hook should cost next to nothing per frame"
+
+async def scrape(port: int) -> bytes:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    response = await reader.read()
+    writer.close()
+    return response
+
+async def frame_jitter(player: OfflineMusicPlayer, seconds: float, port: int, interval: float) -> List[float]:
+    """Play a song for ``seconds``, scraping every ``interval`` seconds if given; get the gaps between frames."""
+    voice = player.voice_client
+    voice.received.clear()
+    player.source_frames = int(seconds / 0.02)
+    await player.add_to_queue(Song("Jitter", "https://www.youtube.com/watch?v=jitter00000", int(seconds) + 1))
+    await player.play_next()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        if interval:
+            await scrape(port)
+        await asyncio.sleep(interval or 0.1)
+    await player.stop()
+    times = [at for at, _ in voice.received]
+    return [later - earlier for earlier, later in zip(times, times[1:])]
+
+async def bench_endpoint(guilds: int, scrapes: int, seconds: float, interval: float) -> None:
+    manager = PlayerManager(FakeBot(asyncio.get_running_loop()), player_factory=OfflineMusicPlayer)
+    manager.extractor = ThreadExtractor(ytdl_factory=FakeYoutubeDL)
+    manager.audio_cache = None
+    manager.loudness = None
+    with quiet():
+        for guild_id in range(1, guilds + 1):
+            player = manager.get(guild_id)
+            player.voice_client = FakeVoiceClient(FakeVoiceChannel(guild_id, FakeGuild(guild_id)))
+            player.queue.extend(Song(f"Song {i}", f"https://www.youtube.com/watch?v=q{guild_id:05d}{i:05d}", 180)
+                                for i in range(5))
+    server = await metrics.serve('127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+
+    samples = []
+    for _ in range(scrapes):
+        start = time.perf_counter()
+        response = await scrape(port)
+        samples.append(time.perf_counter() - start)
+    head, _, body = response.partition(b'\r\n\r\n')
+    assert head.startswith(b'HTTP/1.1 200'), head
+    text = body.decode()
+    bad = [line for line in text.splitlines() if not line.startswith('#') and not _SAMPLE_LINE.match(line)]
+    assert not bad, f"malformed exposition lines: {bad[:3]}"
+    for family in ('musicbot_queue_depth', 'musicbot_voice_clients', 'musicbot_extractor_backlog',
+                   'musicbot_ffmpeg_processes'):
+        assert f"# TYPE {family} gauge" in text, f"{family} is missing"
+    print(f"{guilds} guilds: {len(text.splitlines())} exposition lines, {len(body) / 1024:.1f} KiB")
+    print(format_summary("scrape /metrics", samples))
+
+    # The first frame of a song started by a command is timed
+    with quiet():
+        player = manager.get(guilds + 1)
+        player.voice_client = CadenceVoiceClient(FakeVoiceChannel(guilds + 1, FakeGuild(guilds + 1)))
+        await player.add_to_queue(Song("First frame", "https://www.youtube.com/watch?v=firstframe0", 1))
+        await player.play_next(time.perf_counter())
+        await asyncio.sleep(0.2)
+        await player.stop()
+        await asyncio.sleep(0.05)
+    first_frame = metrics.samples('play_to_first_frame_seconds')
+    assert first_frame, "the first frame of a requested song should be timed"
+    print(format_summary("!play -> first frame", first_frame))
+
+    with quiet():
+        quiet_gaps = await frame_jitter(player, seconds, port, 0)
+        scraped_gaps = await frame_jitter(player, seconds, port, interval)
+    print(format_summary("frame interval", quiet_gaps))
+    print(format_summary(f"frame interval, scrape/{interval * 1000:.0f}ms", scraped_gaps))
+    late = percentile(scraped_gaps, 99) - percentile(quiet_gaps, 99)
+    print(f"p99 frame interval {late * 1000:+.2f}ms while scraping")
+    server.close()
+    manager.extractor.shutdown()
+    print("OK: the frame path is unaffected and /metrics is well-formed")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--frames', type=int, default=200000)
+    parser.add_argument('--guilds', type=int, default=1000)
+    parser.add_argument('--scrapes', type=int, default=50)
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--scrape-interval', type=float, default=0.1)
+    args = parser.parse_args()
+    bench_frame_path(args.frames)
+    asyncio.run(bench_endpoint(args.guilds, args.scrapes, args.seconds, args.scrape_interval))
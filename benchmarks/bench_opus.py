@@ -0,0 +1,140 @@
+"""
+Compare the CPU cost per voice stream of the PCM and Opus playback paths.
+
+Each stream is built by MusicPlayer.create_audio_source from a song served by
+a local HTTP server and read to the end, as discord.py's audio thread reads
+it. The PCM path also pays for PCMVolumeTransformer and discord.py's Opus
+encoder in this process; the Opus paths hand packets over untouched. CPU
+time of this process and of the ffmpeg children is divided by the seconds of
+audio played, so 1% means one stream costs 1% of a core in real time.
+
+Needs ffmpeg on PATH (with libopus) and libopus for discord.py's encoder; no
+network access.
+
+    python -m benchmarks.bench_opus --streams 8 --seconds 60
+"""
+import argparse
+import asyncio
+import ctypes.util
+import functools
+import http.server
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import discord
+from discord.opus import Encoder as OpusEncoder
+
+import music_player
+from benchmarks.common import quiet
+from benchmarks.fakes import FakeBot
+from music_player import MusicPlayer, Song
+
+# (label, playback mode, player volume, codec reported by yt-dlp)
+CASES = [
+    ("pcm, PCMVolumeTransformer", 'pcm', 0.5, 'opus'),
+    ("opus, passthrough", 'opus', 1.0, 'opus'),
+    ("opus, ffmpeg gain", 'opus', 0.125, 'opus'),
+]
+
+def load_opus() -> bool:
+    """Load libopus for discord.py's encoder if it is not loaded yet."""
+    if discord.opus.is_loaded():
+        return True
+    for name in (ctypes.util.find_library('opus'), 'libopus.so.0'):
+        if not name:
+            continue
+        try:
+            discord.opus.load_opus(name)
+            return True
+        except OSError:
+            pass
+    return False
+
+def make_song_file(directory: str, seconds: int) -> str:
+    """Encode a WebM/Opus file like YouTube's itag 251: tones over pink noise, 48 kHz stereo."""
+    path = os.path.join(directory, 'song.webm')
+    subprocess.run(['ffmpeg', '-v', 'error', '-y',
+                    '-f', 'lavfi', '-i', f"anoisesrc=color=pink:amplitude=0.2:duration={seconds}",
+                    '-f', 'lavfi', '-i', f"sine=frequency=330:duration={seconds}",
+                    '-filter_complex', 'amix=inputs=2', '-ac', '2', '-ar', '48000',
+                    '-c:a', 'libopus', '-b:a', '128k', path], check=True)
+    return path
+
+def serve(directory: str, handler_class: Optional[type] = None) -> http.server.ThreadingHTTPServer:
+    handler = functools.partial(handler_class or QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+def play(source: discord.AudioSource, frames: List[int]) -> None:
+    """Read a source to the end the way discord.py's AudioPlayer does, without the sleeps."""
+    encoder = None if source.is_opus() else OpusEncoder()
+    count = 0
+    while True:
+        data = source.read()
+        if not data:
+            break
+        if encoder is not None:
+            encoder.encode(data, OpusEncoder.SAMPLES_PER_FRAME)
+        count += 1
+    source.cleanup()
+    frames.append(count)
+
+def children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+async def run_case(url: str, mode: str, volume: float, codec: str, streams: int) -> Tuple[float, float, float]:
+    """Play ``streams`` songs at once; returns (own CPU, ffmpeg CPU, seconds of audio)."""
+    music_player.PLAYBACK_MODE = mode
+    player = MusicPlayer(FakeBot(asyncio.get_running_loop()))
+    player.volume = volume
+    song = Song("bench", "https://www.youtube.com/watch?v=benchbench0", 60)
+    song.set_stream_url(url, codec=codec)
+    sources = [player.create_audio_source(song) for _ in range(streams)]
+    frames: List[int] = []
+    own_start, child_start = time.process_time(), children_cpu()
+    threads = [threading.Thread(target=play, args=(source, frames)) for source in sources]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    own, child = time.process_time() - own_start, children_cpu() - child_start
+    return own, child, sum(frames) * OpusEncoder.FRAME_LENGTH / 1000
+
+async def main(streams: int, seconds: int) -> None:
+    if shutil.which('ffmpeg') is None:
+        print("ffmpeg is not on PATH, skipping")
+        return
+    have_opus = load_opus()
+    with tempfile.TemporaryDirectory() as directory:
+        make_song_file(directory, seconds)
+        server = serve(directory)
+        url = f"http://127.0.0.1:{server.server_address[1]}/song.webm"
+        print(f"{streams} concurrent streams of {seconds}s WebM/Opus, CPU per stream as % of a core in real time")
+        for label, mode, volume, codec in CASES:
+            if mode == 'pcm' and not have_opus:
+                print(f"  {label:<28} skipped, libopus not found for discord.py's encoder")
+                continue
+            with quiet():
+                own, child, audio = await run_case(url, mode, volume, codec, streams)
+            print(f"  {label:<28} {(own + child) / audio * 100:6.2f}% "
+                  f"(python {own / audio * 100:5.2f}%, ffmpeg {child / audio * 100:5.2f}%)")
+        server.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--streams', type=int, default=8)
+    parser.add_argument('--seconds', type=int, default=60)
+    args = parser.parse_args()
+    asyncio.run(main(args.streams, args.seconds))
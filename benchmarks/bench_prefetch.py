@@ -0,0 +1,65 @@
+"""
+Measure the silence between tracks with and without the lookahead prefetcher.
+
+Queued songs start without a stream URL, and a fake extractor takes
+``--latency`` seconds per resolve, so without prefetching every track change
+waits for a full extraction round trip.
+
+    python -m benchmarks.bench_prefetch --tracks 6 --latency 0.5
+"""
+import argparse
+import asyncio
+import functools
+import types
+
+from benchmarks.common import format_summary, percentile, quiet
+from benchmarks.fakes import FakeGuild, FakeVoiceChannel, FakeVoiceClient, FakeYoutubeDL, OfflineMusicPlayer
+from extraction import ThreadExtractor
+import metrics
+from music_player import Song
+
+# Gap we promise users when prefetching is on
+GAP_BUDGET = 0.3
+
+async def measure_gaps(depth: int, tracks: int, latency: float, track_seconds: float) -> list:
+    metrics.timings.pop('track_gap_seconds', None)
+    bot = types.SimpleNamespace(loop=asyncio.get_running_loop())
+    extractor = ThreadExtractor(ytdl_factory=functools.partial(FakeYoutubeDL, latency=latency))
+    player = OfflineMusicPlayer(bot, guild_id=1, extractor=extractor)
+    player.prefetcher.depth = depth
+    player.voice_client = FakeVoiceClient(FakeVoiceChannel(1, FakeGuild(1)))
+
+    with quiet():
+        for i in range(tracks):
+            await player.add_to_queue(Song(f"Track {i}", f"https://www.youtube.com/watch?v=track{i:06d}", 180))
+        await player.play_next()
+        for _ in range(tracks - 1):
+            await asyncio.sleep(track_seconds)
+            # The track runs out; the after callback starts the next one
+            player.voice_client.stop()
+            while not player.voice_client.is_playing():
+                await asyncio.sleep(0.005)
+        await asyncio.sleep(track_seconds)
+        await player.stop()
+        await asyncio.sleep(0.01)
+    extractor.shutdown()
+    return metrics.samples('track_gap_seconds')
+
+async def main(tracks: int, latency: float, track_seconds: float, depth: int) -> None:
+    cold = await measure_gaps(0, tracks, latency, track_seconds)
+    warm = await measure_gaps(depth, tracks, latency, track_seconds)
+    print(f"Extractor latency {latency * 1000:.0f}ms, {tracks} tracks of {track_seconds:.1f}s")
+    print(format_summary("gap, no prefetch", cold))
+    print(format_summary(f"gap, prefetch depth {depth}", warm))
+    worst = percentile(warm, 100)
+    assert worst < GAP_BUDGET, f"gap {worst * 1000:.0f}ms exceeds {GAP_BUDGET * 1000:.0f}ms budget"
+    print(f"OK: every gap under {GAP_BUDGET * 1000:.0f}ms with prefetching")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=6)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--track-seconds', type=float, default=1.0)
+    parser.add_argument('--depth', type=int, default=2)
+    args = parser.parse_args()
+    asyncio.run(main(args.tracks, args.latency, args.track_seconds, args.depth))
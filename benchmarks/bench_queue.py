@@ -0,0 +1,67 @@
+"""
+Micro-benchmark of queue operations on a plain list versus TrackQueue.
+
+    python -m benchmarks.bench_queue --size 100000
+"""
+import argparse
+import random
+import time
+from typing import Callable, List
+
+from music_player import Song
+from track_queue import TrackQueue
+
+def make_songs(size: int) -> List[Song]:
+    return [Song(f"Song {i}", f"https://www.youtube.com/watch?v={i:011d}", 60 + i % 600) for i in range(size)]
+
+def per_op(ops: int, run: Callable[[], None]) -> float:
+    """Run ``run`` once and return microseconds per operation."""
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    return elapsed / ops * 1e6
+
+def bench_list(songs: List[Song], ops: int, rng: random.Random) -> dict:
+    results = {}
+    queue: List[Song] = []
+    results['append'] = per_op(len(songs), lambda: [queue.append(s) for s in songs])
+    positions = [rng.randrange(len(songs) - ops) for _ in range(ops)]
+    results['insert (middle)'] = per_op(ops, lambda: [queue.insert(p, songs[0]) for p in positions])
+    results['remove (middle)'] = per_op(ops, lambda: [queue.pop(p) for p in positions])
+    moves = [(rng.randrange(len(songs)), rng.randrange(len(songs))) for _ in range(ops)]
+    results['move'] = per_op(ops, lambda: [queue.insert(b, queue.pop(a)) for a, b in moves])
+    results['total duration'] = per_op(1, lambda: sum(s.duration or 0 for s in queue))
+    results['shuffle'] = per_op(1, lambda: rng.shuffle(queue))
+    results['pop head'] = per_op(ops, lambda: [queue.pop(0) for _ in range(ops)])
+    return results
+
+def bench_track_queue(songs: List[Song], ops: int, rng: random.Random) -> dict:
+    results = {}
+    queue = TrackQueue()
+    results['append'] = per_op(len(songs), lambda: [queue.append(s) for s in songs])
+    positions = [rng.randrange(len(songs) - ops) for _ in range(ops)]
+    results['insert (middle)'] = per_op(ops, lambda: [queue.insert(p, songs[0]) for p in positions])
+    results['remove (middle)'] = per_op(ops, lambda: [queue.pop(p) for p in positions])
+    moves = [(rng.randrange(len(songs)), rng.randrange(len(songs))) for _ in range(ops)]
+    results['move'] = per_op(ops, lambda: [queue.move(a, b) for a, b in moves])
+    results['total duration'] = per_op(1, lambda: queue.total_duration)
+    results['shuffle'] = per_op(1, queue.shuffle)
+    results['pop head'] = per_op(ops, lambda: [queue.popleft() for _ in range(ops)])
+    return results
+
+def main(size: int, ops: int) -> None:
+    songs = make_songs(size)
+    baseline = bench_list(songs, ops, random.Random(1))
+    chunked = bench_track_queue(songs, ops, random.Random(1))
+    print(f"{size} queued songs, {ops} operations each (microseconds per operation)")
+    print(f"{'operation':<18}{'list':>12}{'TrackQueue':>12}{'speedup':>10}")
+    for name in baseline:
+        speedup = baseline[name] / chunked[name] if chunked[name] else float('inf')
+        print(f"{name:<18}{baseline[name]:>12.2f}{chunked[name]:>12.2f}{speedup:>9.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--ops', type=int, default=2000)
+    args = parser.parse_args()
+    main(args.size, args.ops)
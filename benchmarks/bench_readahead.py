@@ -0,0 +1,92 @@
+"""
+Measure the stutter a network stall causes with and without the read-ahead buffer.
+
+A child process stands in for ffmpeg: it writes PCM frames to a pipe as fast
+as they are read, then stops writing for ``--stall`` seconds, like ffmpeg
+waiting on ``-reconnect``. A fake voice client reads a frame every 20 ms.
+Without the buffer only the pipe's own buffer (64 KiB, about 0.33 s of PCM)
+stands between the stall and the listener.
+
+    python -m benchmarks.bench_readahead --stall 1.5 --buffer 3
+"""
+import argparse
+import asyncio
+import subprocess
+import sys
+
+import discord
+from discord.opus import Encoder as OpusEncoder
+
+from audio_sources import ReadAheadAudio
+from benchmarks.fakes import CadenceVoiceClient, FakeGuild, FakeVoiceChannel
+
+FRAME = OpusEncoder.FRAME_LENGTH / 1000
+
+CHILD = """
+import sys, time
+frame = bytes([1]) * {size}
+out = sys.stdout.buffer
+for i in range({frames}):
+    if i == {stall_at}:
+        out.flush()
+        time.sleep({stall})
+    out.write(frame)
+out.flush()
+"""
+
+class PipeSource(discord.AudioSource):
+    """PCM frames read from a child process's stdout, like FFmpegPCMAudio."""
+
+    def __init__(self, frames: int, stall_at: int, stall: float):
+        code = CHILD.format(size=OpusEncoder.FRAME_SIZE, frames=frames, stall_at=stall_at, stall=stall)
+        self.process = subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.PIPE)
+
+    def read(self) -> bytes:
+        data = self.process.stdout.read(OpusEncoder.FRAME_SIZE)
+        return data if len(data) == OpusEncoder.FRAME_SIZE else b''
+
+    def read_into(self, buffer: memoryview) -> int:
+        size = self.process.stdout.readinto(buffer[:OpusEncoder.FRAME_SIZE])
+        return size if size == OpusEncoder.FRAME_SIZE else 0
+
+    def cleanup(self) -> None:
+        self.process.kill()
+        self.process.wait()
+
+async def play(source: discord.AudioSource) -> list:
+    done = asyncio.Event()
+    client = CadenceVoiceClient(FakeVoiceChannel(1, FakeGuild(1)))
+    client.play(source, after=lambda error: done.set())
+    await done.wait()
+    return client.received
+
+def stutter(received: list) -> tuple:
+    """Seconds the listener heard nothing: frames that came late, and silence played instead of audio."""
+    late = sum(max(0.0, now - previous - FRAME * 1.5) for (previous, _), (now, _) in zip(received, received[1:]))
+    silent = sum(1 for _, marker in received if marker == 0) * FRAME
+    return late, silent
+
+async def main(seconds: float, stall_at: float, stall: float, buffer: float) -> None:
+    frames = int(seconds / FRAME)
+    at = int(stall_at / FRAME)
+    direct = await play(PipeSource(frames, at, stall))
+    buffered_source = ReadAheadAudio(PipeSource(frames, at, stall), buffer)
+    buffered = await play(buffered_source)
+    print(f"{seconds:g}s of PCM, producer stalls for {stall:g}s after {stall_at:g}s")
+    for label, received in ((" no buffer", direct), (f" {buffer:g}s read-ahead", buffered)):
+        late, silent = stutter(received)
+        print(f"{label:<16} frames={len(received):<5} late={late * 1000:7.0f}ms silence={silent * 1000:7.0f}ms")
+    print(f"Underruns with read-ahead: {buffered_source.underruns}")
+    if stall < buffer:
+        late, silent = stutter(buffered)
+        assert late + silent < FRAME * 5, "a stall shorter than the buffer should not be heard"
+        print("OK: the stall was absorbed by the buffer")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=6.0)
+    parser.add_argument('--stall-at', type=float, default=3.0)
+    parser.add_argument('--stall', type=float, default=1.5)
+    parser.add_argument('--buffer', type=float, default=3.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.seconds, args.stall_at, args.stall, args.buffer))
@@ -0,0 +1,197 @@
+"""
+Measure how much of a song survives its stream dying midway, with and without recovery.
+
+A WebM/Opus song is served by a local HTTP server under a per-URL token, and
+a fake extractor hands out a new token on every resolve. Like a CDN, the
+server sends the first ``BURST`` bytes of each request at once and the rest
+at ``--speed`` times the bitrate. A URL "expires" a
+while after its first request: the connection is cut and every later request
+for it, including ffmpeg's ``-reconnect``, gets 403 Forbidden, as YouTube
+answers an expired ``googlevideo`` URL. A fake voice client plays the song in
+real time.
+
+- no recovery: the song is dropped where ffmpeg died (the old behaviour)
+- recovery: the stream health monitor resumes it on a fresh URL
+- dying stream: every URL dies right away; the retry budget and backoff bound the respawns
+
+Needs ffmpeg on PATH (with libopus); no network access.
+
+    python -m benchmarks.bench_recovery --seconds 40 --lifetime 4
+"""
+import argparse
+import asyncio
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional, Set
+
+from benchmarks.bench_opus import make_song_file, serve
+from benchmarks.bench_seek import RangeHandler
+from benchmarks.common import format_summary, quiet
+from benchmarks.fakes import CadenceVoiceClient, FakeBot, FakeGuild, FakeVoiceChannel
+import metrics
+import music_player
+from music_player import MusicPlayer, Song
+
+FRAME = 0.02
+# Bytes sent between two throttling pauses
+CHUNK = 8192
+# Bytes of each response sent before throttling starts
+BURST = 64 * 1024
+
+class ExpiringHandler(RangeHandler):
+    """
+    Serves ``/<token>/<file>`` at ``rate`` bytes per second.
+
+    The first token expires ``first_lifetime`` seconds after its first
+    request, the others after ``lifetime`` (None: never).
+    """
+
+    rate = 0.0
+    first_lifetime = 0.0
+    lifetime: Optional[float] = None
+    first_seen: Dict[str, float] = {}
+    expired: Set[str] = set()
+    lock = threading.Lock()
+
+    @classmethod
+    def reset(cls, rate: float, first_lifetime: float, lifetime: Optional[float]) -> None:
+        cls.rate, cls.first_lifetime, cls.lifetime = rate, first_lifetime, lifetime
+        cls.first_seen.clear()
+        cls.expired.clear()
+
+    def do_GET(self) -> None:
+        match = re.match(r'/([^/]+)(/.*)', self.path)
+        if not match or self.is_expired(match.group(1)):
+            self.send_error(403)
+            return
+        self.path = match.group(2)
+        self.wfile = _Throttle(self.wfile, self, match.group(1))
+        super().do_GET()
+
+    def is_expired(self, token: str) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            first_seen = self.first_seen.setdefault(token, now)
+            lifetime = self.first_lifetime if token == 'token1' else self.lifetime
+            if lifetime is not None and now - first_seen > lifetime:
+                self.expired.add(token)
+            return token in self.expired
+
+class _Throttle:
+    """File wrapper that paces writes and cuts the connection once the token expires."""
+
+    def __init__(self, wfile: Any, handler: ExpiringHandler, token: str):
+        self.wfile = wfile
+        self.handler = handler
+        self.token = token
+        self.started = time.monotonic()
+        self.written = 0
+
+    def write(self, data: bytes) -> int:
+        for offset in range(0, len(data), CHUNK):
+            if self.handler.is_expired(self.token):
+                raise BrokenPipeError("stream URL expired")
+            chunk = data[offset:offset + CHUNK]
+            self.wfile.write(chunk)
+            self.written += len(chunk)
+            if self.written > BURST:
+                time.sleep(max(0.0, self.started + (self.written - BURST) / self.handler.rate - time.monotonic()))
+        return len(data)
+
+    def flush(self) -> None:
+        self.wfile.flush()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.wfile, name)
+
+class TokenExtractor:
+    """Resolves every song to the served file under a new token, like a fresh signed URL."""
+
+    def __init__(self, base: str, seconds: int):
+        self.base = base
+        self.seconds = seconds
+        self.resolves = 0
+
+    async def extract(self, query: str) -> Optional[Dict[str, Any]]:
+        self.resolves += 1
+        return {'title': 'bench', 'duration': self.seconds, 'acodec': 'opus',
+                'url': f"{self.base}/token{self.resolves}/song.webm"}
+
+    def shutdown(self) -> None:
+        pass
+
+async def play(base: str, seconds: int, retries: int, backoff: float) -> Dict[str, Any]:
+    """Play one song until it ends or is given up, and report what was heard."""
+    for name in ('stream_recoveries', 'premature_stream_ends', 'stream_recovery_failures'):
+        metrics.counters.pop(name, None)
+    metrics.timings.pop('stream_recovery_seconds', None)
+    extractor = TokenExtractor(base, seconds)
+    player = MusicPlayer(FakeBot(asyncio.get_running_loop()), extractor=extractor)
+    player.health.retries = retries
+    player.health.backoff = backoff
+    player.voice_client = CadenceVoiceClient(FakeVoiceChannel(1, FakeGuild(1)))
+    song = Song("bench", "https://www.youtube.com/watch?v=benchrecov0", seconds)
+    started = time.perf_counter()
+    reached = 0.0
+    with quiet():
+        await player.play_song(song)
+        deadline = started + seconds * 2 + 30
+        while player.current_song is song and time.perf_counter() < deadline:
+            reached = max(reached, player.position())
+            await asyncio.sleep(0.05)
+        await player.stop()
+    received = player.voice_client.received
+    playing = received[-1][0] - received[0][0] + FRAME if received else 0.0
+    return {
+        'reached': reached,
+        # Underrun silence and pauses between sources, while the song was on
+        'silence': max(0.0, playing - reached),
+        'resolves': extractor.resolves,
+        'elapsed': time.perf_counter() - started,
+        'recovery': metrics.samples('stream_recovery_seconds'),
+        'counters': {name: metrics.counters.get(name, 0) for name in
+                     ('premature_stream_ends', 'stream_recoveries', 'stream_recovery_failures')},
+    }
+
+async def main(seconds: int, lifetime: float, speed: float, retries: int) -> None:
+    if shutil.which('ffmpeg') is None:
+        print("ffmpeg is not on PATH, skipping")
+        return
+    music_player.PLAYBACK_MODE = 'pcm'
+    with tempfile.TemporaryDirectory() as directory:
+        path = make_song_file(directory, seconds)
+        server = serve(directory, ExpiringHandler)
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        rate = os.path.getsize(path) / seconds * speed
+        print(f"{seconds}s song served at {speed:g}x its bitrate; the first stream URL expires after {lifetime:g}s")
+        results = {}
+        for label, first_lifetime, later_lifetime, case_retries in (
+                ("no recovery", lifetime, None, 0), ("recovery", lifetime, None, retries),
+                ("dying stream", 0.3, 0.3, retries)):
+            ExpiringHandler.reset(rate, first_lifetime, later_lifetime)
+            results[label] = result = await play(base, seconds, case_retries, 0.5)
+            counters = result['counters']
+            print(f"  {label:<13} played to {result['reached']:5.1f}s, silence {result['silence']:4.1f}s, "
+                  f"{result['resolves']} resolves, {counters['premature_stream_ends']} early ends, "
+                  f"{counters['stream_recoveries']} recovered, {counters['stream_recovery_failures']} given up, "
+                  f"{result['elapsed']:.1f}s")
+        print(format_summary("recovery time", results["recovery"]['recovery']))
+        server.shutdown()
+    assert results["no recovery"]['reached'] < seconds - 2, "the stream should have died before the end"
+    assert results["recovery"]['reached'] >= seconds - 2, "the recovered song should play to its end"
+    dying = results["dying stream"]['counters']
+    assert dying['premature_stream_ends'] == retries + 1, "a dying stream should be retried exactly the budget"
+    print(f"OK: the song was resumed to its end; a dying stream was given up after {retries} retries")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=int, default=40)
+    parser.add_argument('--lifetime', type=float, default=4.0)
+    parser.add_argument('--speed', type=float, default=4.0)
+    parser.add_argument('--retries', type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.seconds, args.lifetime, args.speed, args.retries))
@@ -0,0 +1,101 @@
+"""
+Measure how long ``!play`` takes to find a song for each kind of query, routed and unrouted.
+
+Every query is looked up twice: by the query router, which picks the
+cheapest path for its kind (library, song cache, flat listing or full
+extraction), and the old way, a full yt-dlp extraction of whatever the user
+typed. A fake extractor sleeps ``--latency`` seconds per full extraction and
+``--flat-latency`` per flat listing; the library is a synthetic index.
+
+No network access or ffmpeg needed.
+
+    python -m benchmarks.bench_router --queries 20 --latency 0.4 --flat-latency 0.1
+"""
+import argparse
+import asyncio
+import functools
+import tempfile
+import time
+import types
+from typing import Awaitable, Callable, List, Tuple
+
+from benchmarks.common import format_summary, percentile, quiet
+from benchmarks.fakes import FakeYoutubeDL, OfflineMusicPlayer
+from extraction import ThreadExtractor
+from library import LibraryTrack, MusicLibrary
+import metrics
+from music_player import Song
+from query_router import classify_query
+
+def make_library(directory: str, size: int = 1000) -> MusicLibrary:
+    library = MusicLibrary([directory], f"{directory}/index.json")
+    library._apply([LibraryTrack(f"{directory}/track{i}.mp3", 0, 0, f"Local Tune {i}", "Bench Artist",
+                                 "Bench Album", 180, 'mp3') for i in range(size)])
+    return library
+
+async def timed(lookup: Callable[[str], Awaitable[object]], queries: List[str]) -> Tuple[List[float], int]:
+    """Look up queries one after another; get the latencies and the number of yt-dlp jobs run."""
+    before = metrics.snapshot().get('extractions', 0)
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        result = await lookup(query)
+        samples.append(time.perf_counter() - start)
+        assert result, f"nothing found for {query!r}"
+    return samples, metrics.snapshot().get('extractions', 0) - before
+
+async def main(count: int, latency: float, flat_latency: float) -> None:
+    bot = types.SimpleNamespace(loop=asyncio.get_running_loop())
+    extractor = ThreadExtractor(ytdl_factory=functools.partial(FakeYoutubeDL, latency=latency,
+                                                               flat_latency=flat_latency))
+    with tempfile.TemporaryDirectory() as directory:
+        player = OfflineMusicPlayer(bot, guild_id=1, extractor=extractor, library=make_library(directory))
+        playing = Song("Now playing", "https://www.youtube.com/watch?v=nowplaying0", 180)
+
+        async def routed(query: str, busy: bool = False) -> object:
+            player.current_song = playing if busy else None
+            return await player.extract_song_info(query)
+
+        async def unrouted(query: str) -> object:
+            return await player.extractor.extract(query)
+
+        cached = [f"https://www.youtube.com/watch?v=cached{i:05d}" for i in range(count)]
+        with quiet():
+            for url in cached:
+                await routed(url)
+        scenarios = [
+            ("video, cached", [f"https://youtu.be/cached{i:05d}" for i in range(count)], routed),
+            ("video, new", [f"https://www.youtube.com/watch?v=fresh{i:06d}" for i in range(count)], routed),
+            ("search, idle", [f"idle search {i}" for i in range(count)], routed),
+            ("search, playing", [f"busy search {i}" for i in range(count)], functools.partial(routed, busy=True)),
+            ("playlist", [f"https://www.youtube.com/playlist?list=PLbench{i}" for i in range(count)], routed),
+            ("library", [f"local tune {i}" for i in range(count)], routed),
+            ("other site", [f"https://example.com/track/{i}" for i in range(count)], routed),
+        ]
+        print(f"Full extraction {latency * 1000:.0f}ms, flat listing {flat_latency * 1000:.0f}ms, "
+              f"{count} queries per kind")
+        speedups = {}
+        for label, queries, lookup in scenarios:
+            with quiet():
+                fast, fast_jobs = await timed(lookup, queries)
+                # The old way: every query is a full extraction of what was typed
+                slow, slow_jobs = await timed(unrouted, [f"old {query}" if classify_query(query).kind == 'search'
+                                                         else query + '#old' for query in queries])
+            print(format_summary(f"routed: {label}", fast) + f" yt-dlp jobs={fast_jobs}")
+            print(format_summary(f"full: {label}", slow) + f" yt-dlp jobs={slow_jobs}")
+            speedups[label] = percentile(slow, 50) / max(percentile(fast, 50), 1e-6)
+        for kind, seconds in sorted((name, samples) for name, samples in metrics.timings.items()
+                                    if name.startswith('route_')):
+            print(format_summary(kind, seconds))
+    extractor.shutdown()
+    assert speedups["video, cached"] > 10 and speedups["library"] > 10, "cache and library hits should skip yt-dlp"
+    assert speedups["search, playing"] > 1.5 and speedups["playlist"] > 1.5, "flat listings should be quicker"
+    print("OK: cached, library and flat lookups are faster than full extraction")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.4)
+    parser.add_argument('--flat-latency', type=float, default=0.1)
+    args = parser.parse_args()
+    asyncio.run(main(args.queries, args.latency, args.flat_latency))
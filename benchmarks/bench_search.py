@@ -0,0 +1,115 @@
+"""
+Measure !search: flat result listings, the result cache, and queueing the result picked.
+
+A scripted user runs ``!search`` through the bot's command callback and
+replies with a pick. Searches are answered by a flat listing (``--flat-latency``
+seconds), repeated searches from the cache, and the pick is queued from the
+listed metadata without another extraction; the prefetcher resolves its
+stream (``--latency`` seconds) while the current song plays. For
+comparison, finding a song by trial and error with ``!play`` costs a full
+extraction per attempt.
+
+    python -m benchmarks.bench_search --searches 10 --latency 0.4 --flat-latency 0.1
+"""
+import argparse
+import asyncio
+import functools
+import time
+from typing import List
+
+from benchmarks.common import format_summary, quiet
+from benchmarks.fakes import FakeContext, FakeMessage, FakeYoutubeDL, OfflineMusicPlayer
+
+with quiet():
+    import bot as bot_module
+from extraction import ThreadExtractor
+import metrics
+from player_manager import PlayerManager
+
+class ScriptedUser:
+    """Stands in for ``bot.wait_for``: replies to every pick prompt with the same choice."""
+
+    def __init__(self, ctx: FakeContext, choice: str):
+        self.ctx = ctx
+        self.choice = choice
+        self.replied_at = 0.0
+
+    async def wait_for(self, event: str, *, check, timeout: float) -> FakeMessage:
+        reply = FakeMessage(self.choice, author=self.ctx.author, channel=self.ctx.channel)
+        assert event == 'message' and check(reply), "the pick should be accepted"
+        self.replied_at = time.perf_counter()
+        return reply
+
+def extractions() -> int:
+    return metrics.snapshot().get('extractions', 0)
+
+async def main(searches: int, latency: float, flat_latency: float) -> None:
+    bot_module.bot.loop = asyncio.get_running_loop()
+    manager = PlayerManager(bot_module.bot, player_factory=OfflineMusicPlayer)
+    manager.extractor = ThreadExtractor(ytdl_factory=functools.partial(FakeYoutubeDL, latency=latency,
+                                                                       flat_latency=flat_latency))
+    manager.audio_cache = None
+    manager.loudness = None
+    bot_module.players = manager
+    ctx = FakeContext(1)
+    user = ScriptedUser(ctx, '3')
+    bot_module.bot.wait_for = user.wait_for
+    player = manager.get(1)
+
+    first: List[float] = []
+    repeat: List[float] = []
+    queued: List[float] = []
+    with quiet():
+        await bot_module.join_voice_channel.callback(ctx)
+        # Start a song so the picks below are queued behind it
+        await bot_module.play_music.callback(ctx, query="warm up song")
+        before = extractions()
+        for i in range(searches):
+            for samples in (first, repeat):
+                start = time.perf_counter()
+                await bot_module.search.callback(ctx, query=f"Search  Number {i}" if samples is first
+                                                 else f"search number {i}")
+                end = time.perf_counter()
+                # Time until the user was asked to pick, then from the pick until the song was queued
+                samples.append(user.replied_at - start)
+                queued.append(end - user.replied_at)
+        search_jobs = extractions() - before
+        # Let the prefetcher resolve the head of the queue
+        await asyncio.sleep(latency * 2 + 0.2)
+    resolved = sum(1 for song in list(player.queue)[:player.prefetcher.depth] if song.stream_url)
+
+    # Trial and error with !play: every attempt is a full extraction of its top result
+    player.current_song = None
+    attempts: List[float] = []
+    before = extractions()
+    with quiet():
+        for i in range(searches):
+            start = time.perf_counter()
+            await player.extract_song_info(f"attempt {i}")
+            attempts.append(time.perf_counter() - start)
+    play_jobs = extractions() - before
+
+    print(f"Full extraction {latency * 1000:.0f}ms, flat listing {flat_latency * 1000:.0f}ms, {searches} searches")
+    print(format_summary("search, first time", first))
+    print(format_summary("search, cached", repeat))
+    print(format_summary("pick -> queued", queued))
+    print(format_summary("!play attempt", attempts))
+    cache = manager.song_cache.stats()['searches']
+    # The picks' jobs are the prefetcher resolving their streams in the background
+    print(f"yt-dlp jobs: {search_jobs} for {searches * 2} searches and {searches * 2} picks, "
+          f"{play_jobs} for {searches} !play attempts")
+    print(f"result cache: {cache['hits']} hits, {cache['misses']} misses")
+    print(f"{resolved}/{player.prefetcher.depth} picked songs at the head of the queue were resolved by the prefetcher")
+    manager.extractor.shutdown()
+    assert cache['misses'] == cache['hits'] == searches, "only the first of each search should reach yt-dlp"
+    assert max(queued) < 0.05, "a pick should be queued without an extraction"
+    assert resolved == player.prefetcher.depth, "the prefetcher should resolve picked songs"
+    print("OK: repeated searches are cached and picks are queued instantly")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--searches', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.4)
+    parser.add_argument('--flat-latency', type=float, default=0.1)
+    args = parser.parse_args()
+    asyncio.run(main(args.searches, args.latency, args.flat_latency))
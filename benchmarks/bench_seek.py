@@ -0,0 +1,190 @@
+"""
+Measure seek latency and accuracy for streamed and cached songs.
+
+A WebM/Opus song is served by a local HTTP server that honours Range
+requests, like YouTube's CDN, and remuxed into Ogg as the audio cache stores
+it. For each target time the benchmark reports how long ffmpeg takes to
+produce the first frame and how far that frame is from the target:
+
+- stream, input -ss: ffmpeg seeks with a range request (what ``!seek`` does)
+- stream, output -ss: ffmpeg decodes from the start and discards audio
+- cached, page index: the Ogg page index jumps to the right page (what ``!seek`` does)
+- cached, pipe -ss: ffmpeg reads through the piped file up to the target
+
+Then ``MusicPlayer.seek`` is timed end to end, from the command until the
+new source is primed and swapped in, on a fake voice client.
+
+Needs ffmpeg on PATH (with libopus); no network access.
+
+    python -m benchmarks.bench_seek --minutes 10
+"""
+import argparse
+import asyncio
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import List, Optional, Tuple
+
+from discord.opus import Encoder as OpusEncoder
+
+from audio_cache import AudioCache
+from audio_sources import MappedFFmpegPCMAudio, StreamFFmpegPCMAudio, page_index
+from benchmarks.bench_opus import QuietHandler, make_song_file, serve
+from benchmarks.common import format_summary, quiet
+from benchmarks.fakes import CadenceVoiceClient, FakeBot, FakeGuild, FakeVoiceChannel
+from config import FFMPEG_OPTIONS
+from dsp import np
+import metrics
+import music_player
+from music_player import MusicPlayer, Song
+
+RATE = OpusEncoder.SAMPLING_RATE
+# Samples compared when locating the first frame in the reference decode
+MATCH_SAMPLES = 4800
+
+class RangeHandler(QuietHandler):
+    """Serves byte ranges, as a CDN does, so ffmpeg can seek inside streams."""
+
+    def do_GET(self) -> None:
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        size = os.path.getsize(path)
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        start = int(match.group(1)) if match else 0
+        end = int(match.group(2)) if match and match.group(2) else size - 1
+        self.send_response(206 if match else 200)
+        self.send_header('Content-Type', 'audio/webm')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        if match:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        try:
+            with open(path, 'rb') as f:
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = f.read(min(65536, remaining))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+def reference(path: str) -> Optional['np.ndarray']:
+    """Decode the left channel of a whole file, from the start, as the ground truth."""
+    if np is None:
+        return None
+    pcm = subprocess.run(['ffmpeg', '-v', 'error', '-i', path, '-f', 's16le', '-ar', str(RATE), '-ac', '2', '-'],
+                         capture_output=True, check=True).stdout
+    return np.frombuffer(pcm, dtype=np.int16)[::2]
+
+def offset_error(ref: Optional['np.ndarray'], target: float, pcm: bytes) -> Optional[float]:
+    """Seconds between the target and where the decoded audio really starts."""
+    if ref is None:
+        return None
+    got = np.frombuffer(pcm, dtype=np.int16)[::2].astype(np.float32)[:MATCH_SAMPLES]
+    base = int(target * RATE)
+    search = RATE // 2
+    window = ref[base - search:base + search + len(got)].astype(np.float32)
+    scores = [float(np.dot(window[lag:lag + len(got)], got)) for lag in range(len(window) - len(got))]
+    return (int(np.argmax(scores)) - search) / RATE
+
+def first_frames(make, frames: int = 12) -> Tuple[float, bytes]:
+    started = time.perf_counter()
+    source = make()
+    data = [source.read()]
+    latency = time.perf_counter() - started
+    data.extend(source.read() for _ in range(frames - 1))
+    source.cleanup()
+    return latency, b''.join(data)
+
+def source_cases(url: str, ogg: str) -> List[tuple]:
+    reconnect = FFMPEG_OPTIONS['before_options']
+    return [
+        ("stream, input -ss", lambda t: StreamFFmpegPCMAudio(
+            url, before_options=f"-ss {t:.3f} {reconnect}", options='-vn')),
+        ("stream, output -ss", lambda t: StreamFFmpegPCMAudio(
+            url, before_options=reconnect, options=f"-ss {t:.3f} -vn")),
+        ("cached, page index", lambda t: MappedFFmpegPCMAudio(ogg, start=t, options='-vn')),
+        ("cached, pipe -ss", lambda t: MappedFFmpegPCMAudio(
+            ogg, before_options=f"-ss {t:.3f}", options='-vn')),
+    ]
+
+async def player_seeks(song: Song, audio_cache: Optional[AudioCache], targets: List[float]) -> List[float]:
+    """Time MusicPlayer.seek while a song plays on a fake voice client."""
+    metrics.timings.pop('seek_seconds', None)
+    player = MusicPlayer(FakeBot(asyncio.get_running_loop()), audio_cache=audio_cache)
+    player.voice_client = CadenceVoiceClient(FakeVoiceChannel(1, FakeGuild(1)))
+    with quiet():
+        await player.play_song(song)
+        await asyncio.sleep(0.5)
+        for target in targets:
+            assert await player.seek(target), f"seek to {target} failed"
+            await asyncio.sleep(0.3)
+            drift = player.position() - target
+            assert 0 <= drift < 0.5, f"position {player.position():.2f}s after seeking to {target}s"
+        await player.stop()
+        await asyncio.sleep(0.1)
+    player.extractor.shutdown()
+    return metrics.samples('seek_seconds')
+
+async def main(minutes: float) -> None:
+    if shutil.which('ffmpeg') is None:
+        print("ffmpeg is not on PATH, skipping")
+        return
+    seconds = int(minutes * 60)
+    targets = [30.0, seconds / 2, seconds - 30.0]
+    music_player.PLAYBACK_MODE = 'pcm'
+    with tempfile.TemporaryDirectory() as directory:
+        webm = make_song_file(directory, seconds)
+        ogg = os.path.join(directory, 'song.ogg')
+        # Remuxed the way the audio cache tee writes it
+        subprocess.run(['ffmpeg', '-v', 'error', '-y', '-i', webm, '-map', '0:a:0', '-c:a', 'copy',
+                        '-f', 'ogg', ogg], check=True)
+        server = serve(directory, RangeHandler)
+        url = f"http://127.0.0.1:{server.server_address[1]}/song.webm"
+        started = time.perf_counter()
+        index = page_index(ogg)
+        print(f"{minutes:g} min WebM/Opus song; Ogg page index of the cached copy: "
+              f"{len(index.offsets)} pages in {(time.perf_counter() - started) * 1000:.1f}ms")
+        # The WebM and its Ogg remux hold the same packets; Ogg trims the
+        # Opus pre-skip at the start as RFC 7845 asks, WebM decoding does not
+        truth = reference(ogg)
+        print("Time to the first frame after seeking, and its distance from the target:")
+        for label, make in source_cases(url, ogg):
+            results = []
+            for target in targets:
+                latency, pcm = first_frames(lambda: make(target))
+                error = offset_error(truth, target, pcm)
+                accuracy = f"{error * 1000:+7.1f}ms" if error is not None else "    n/a"
+                results.append(f"{format_time(target)} {latency * 1000:6.0f}ms ({accuracy})")
+            print(f"  {label:<20} " + "  ".join(results))
+
+        song = Song("bench", "https://www.youtube.com/watch?v=benchseek00", seconds)
+        song.set_stream_url(url, codec='opus')
+        stream = await player_seeks(song, None, targets)
+        cache = AudioCache(os.path.join(directory, 'cache'))
+        tmp_path = cache.reserve(song.url)
+        shutil.copyfile(ogg, tmp_path)
+        cache.commit(song.url, tmp_path, True)
+        cached = await player_seeks(song, cache, targets)
+        print("MusicPlayer.seek until the new source is primed and playing:")
+        print(format_summary("  stream", stream))
+        print(format_summary("  cached", cached))
+        server.shutdown()
+
+def format_time(seconds: float) -> str:
+    return f"{int(seconds // 60)}:{int(seconds % 60):02d}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--minutes', type=float, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.minutes))
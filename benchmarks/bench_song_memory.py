@@ -0,0 +1,79 @@
+"""
+Measure the memory cost of each queued track.
+
+Compares a replica of the previous dict-backed Song, which kept the requesting
+Member object alive, with the current slotted Song that keeps only the
+requester ID and rebuilds YouTube URLs from the video ID.
+
+    python -m benchmarks.bench_song_memory --size 100000
+"""
+import argparse
+import gc
+import random
+import tracemalloc
+from typing import Any, Callable, List, Optional
+
+from benchmarks.fakes import FakeGuild, FakeMember
+from music_player import Song
+from track_queue import TrackQueue
+
+class LegacySong:
+    """The Song record as it was before it was slotted."""
+
+    def __init__(self, title: str, url: str, duration: Optional[int] = None,
+                 thumbnail: Optional[str] = None, requester: Any = None):
+        self.title = title
+        self.url = url
+        self.duration = duration
+        self.thumbnail = thumbnail
+        self.requester = requester
+        self.stream_url: Optional[str] = None
+        self.stream_expires_at: Optional[float] = None
+        self.stream_retries = 0
+
+def make_video_ids(size: int, rng: random.Random) -> List[str]:
+    alphabet = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-'
+    return [''.join(rng.choice(alphabet) for _ in range(11)) for _ in range(size)]
+
+def build_queue(song_class: Callable[..., Any], video_ids: List[str], requesters: List[Any]) -> TrackQueue:
+    queue = TrackQueue()
+    for i, video_id in enumerate(video_ids):
+        # Each track is built from freshly decoded strings, as yt-dlp returns them
+        queue.append(song_class(
+            f"Artist {i % 500} - Track title number {i}",
+            f"https://www.youtube.com/watch?v={video_id}",
+            120 + i % 400,
+            f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+            requesters[i % len(requesters)],
+        ))
+    return queue
+
+def bytes_per_track(song_class: Callable[..., Any], video_ids: List[str], requesters: List[Any]) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    queue = build_queue(song_class, video_ids, requesters)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(queue) == len(video_ids)
+    return (after - before) / len(video_ids)
+
+def main(size: int, requester_count: int) -> None:
+    rng = random.Random(1)
+    video_ids = make_video_ids(size, rng)
+    # Songs only referenced their members, so requesters are allocated up front
+    guild = FakeGuild(1)
+    requesters = [FakeMember(10**17 + i, guild) for i in range(requester_count)]
+    legacy = bytes_per_track(LegacySong, video_ids, requesters)
+    compact = bytes_per_track(Song, video_ids, requesters)
+    print(f"{size} queued tracks from {requester_count} requesters")
+    print(f"{'legacy Song':<14}{legacy:>10.0f} bytes/track")
+    print(f"{'slotted Song':<14}{compact:>10.0f} bytes/track ({1 - compact / legacy:.0%} smaller)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--requesters', type=int, default=50)
+    args = parser.parse_args()
+    main(args.size, args.requesters)
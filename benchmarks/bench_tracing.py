@@ -0,0 +1,154 @@
+"""
+Trace a !play from the command to the first audio frame, and measure what tracing costs.
+
+``!play`` runs through the bot's before/after invoke hooks, as discord.py
+would run it, against a fake voice channel that reads frames every 20 ms.
+The trace must reach into the extraction thread (the yt-dlp span) and the
+voice thread (the first frame), and every finished span must arrive both in
+the JSONL file and at a local stand-in for an OTLP/HTTP collector. The cost
+of a span is timed inside and outside of a trace.
+
+No network access or ffmpeg needed.
+
+    python -m benchmarks.bench_tracing --latency 0.3 --spans 100000
+"""
+import argparse
+import asyncio
+import functools
+import http.server
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from benchmarks.common import quiet
+from benchmarks.fakes import CadenceVoiceClient, FakeContext, FakeYoutubeDL, OfflineMusicPlayer
+
+with quiet():
+    import bot as bot_module
+from extraction import ThreadExtractor
+from player_manager import PlayerManager
+import tracing
+
+# Stages a !play of a new song goes through, by span name
+PLAY_STAGES = ('join', 'voice.connect', 'sleep.after_join', 'discord.send', 'extract', 'extractor',
+               'extractor.run', 'yt-dlp', 'discord.edit', 'play_next', 'resolve_stream', 'ffmpeg.spawn',
+               'voice.first_frame')
+
+class Collector(http.server.BaseHTTPRequestHandler):
+    """Stand-in for an OTLP/HTTP collector: counts the spans posted to it."""
+
+    spans: List[Dict] = []
+
+    def do_POST(self) -> None:
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        for resource in body['resourceSpans']:
+            for scope in resource['scopeSpans']:
+                Collector.spans.extend(scope['spans'])
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args) -> None:
+        pass
+
+async def invoke(ctx: FakeContext, command, **kwargs) -> None:
+    """Run a command the way discord.py does: in a task of its own, between the invoke hooks."""
+    async def run() -> None:
+        ctx.command = command
+        ctx.args = [ctx]
+        ctx.kwargs = kwargs
+        await bot_module.start_command_trace(ctx)
+        try:
+            await command.callback(ctx, **kwargs)
+        finally:
+            await bot_module.end_command_trace(ctx)
+    await asyncio.create_task(run())
+
+def span_cost(count: int, traced: bool) -> float:
+    """Get the seconds one ``with tracing.span(...)`` block takes."""
+    root = tracing.start_trace('bench') if traced else None
+    start = time.perf_counter()
+    for _ in range(count):
+        with tracing.span('stage', kind='bench'):
+            pass
+    elapsed = time.perf_counter() - start
+    if root is not None:
+        tracing.end_trace(root)
+        tracing._traces.pop(root.trace_id)
+    return elapsed / count
+
+async def main(latency: float, spans: int) -> None:
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Collector)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    directory = tempfile.TemporaryDirectory()
+    path = os.path.join(directory.name, 'traces.jsonl')
+    tracing.start_exporter(path, f"http://127.0.0.1:{server.server_address[1]}/v1/traces")
+
+    bot_module.bot.loop = asyncio.get_running_loop()
+    manager = PlayerManager(bot_module.bot, player_factory=OfflineMusicPlayer)
+    manager.extractor = ThreadExtractor(ytdl_factory=functools.partial(FakeYoutubeDL, latency=latency,
+                                                                       duration=1))
+    manager.audio_cache = None
+    manager.loudness = None
+    bot_module.players = manager
+    ctx = FakeContext(1)
+    ctx.author.voice.channel.client_class = CadenceVoiceClient
+    player = manager.get(1)
+    # Short songs, so the first ends and the next starts from the voice thread
+    player.source_frames = 50
+
+    with quiet():
+        await invoke(ctx, bot_module.play_music, query="traced song one")
+        await invoke(ctx, bot_module.play_music, query="traced song two")
+        await asyncio.sleep(latency + 2.5)
+    played = tracing.last_trace(1)
+    with quiet():
+        await invoke(ctx, bot_module.show_trace, which='last')
+    print(ctx.sent[-1].content)
+
+    first = [spans for spans in tracing._traces.values() if spans[0].attributes.get('args') == 'traced song one'][0]
+    print("First !play, which joined and started playback:")
+    print('\n'.join(tracing.format_breakdown(sorted(first, key=lambda span: span.start))))
+    names = {span.name for span in first}
+    missing = [stage for stage in PLAY_STAGES if stage not in names]
+    by_id = {span.span_id: span for span in first}
+    ytdlp = next(span for span in first if span.name == 'yt-dlp')
+    track_ends = [spans for spans in tracing._traces.values() if spans[0].name == 'track_end']
+    assert played is not None and played[0].attributes.get('args') == 'traced song two', \
+        "!trace last should show the last command, not itself"
+    assert not missing, f"stages missing from the trace: {missing}"
+    assert by_id[ytdlp.parent_id].name == 'extractor.run', "yt-dlp should be traced from the extraction thread"
+    assert all(span.end is not None for span in first), "every stage should have ended"
+    assert track_ends and track_ends[0][0].attributes.get('previous_trace'), \
+        "the next song should be traced from the voice thread and linked to the last one"
+
+    tracing.stop_exporter()
+    finished = sum(1 for spans in tracing._traces.values() for span in spans if span.end is not None)
+    with open(path, encoding='utf-8') as f:
+        exported = [json.loads(line) for line in f]
+    print(f"{len(tracing._traces)} traces, {finished} spans: {len(exported)} written to JSONL, "
+          f"{len(Collector.spans)} received by the collector")
+    assert len(exported) == len(Collector.spans) == finished, "every finished span should be exported"
+    server.shutdown()
+    directory.cleanup()
+    await player.stop()
+    manager.extractor.shutdown()
+
+    # Cost of a stage: a no-op outside of a trace, a span record inside of one
+    untraced = min(span_cost(spans, False) for _ in range(3))
+    traced = min(span_cost(spans, True) for _ in range(3))
+    command = first[0].duration
+    print(f"span: {untraced * 1e9:.0f}ns when not tracing, {traced * 1e6:.2f}us when tracing")
+    print(f"!play of a new song: {len(first)} spans, {len(first) * traced * 1e6:.0f}us of "
+          f"{command * 1000:.0f}ms ({len(first) * traced / command:.4%})")
+    assert len(first) * traced < command * 0.001, "tracing should cost under 0.1% of a command"
+    print("OK: !play is traced end to end across threads and exported")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.3)
+    parser.add_argument('--spans', type=int, default=100000)
+    args = parser.parse_args()
+    asyncio.run(main(args.latency, args.spans))
@@ -0,0 +1,44 @@
+import contextlib
+import io
+import statistics
+from typing import Dict, Iterator, Sequence
+
+def percentile(samples: Sequence[float], pct: float) -> float:
+    """
+    Get the nearest-rank percentile of a list of samples.
+    
+    Args:
+        samples (Sequence[float]): Measured values
+        pct (float): Percentile between 0 and 100
+        
+    Returns:
+        float: The percentile value, 0.0 for an empty list
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+def summarize(samples: Sequence[float]) -> Dict[str, float]:
+    """Summarize latency samples (in seconds) as milliseconds."""
+    return {
+        'count': len(samples),
+        'mean_ms': statistics.fmean(samples) * 1000 if samples else 0.0,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'max_ms': max(samples) * 1000 if samples else 0.0,
+    }
+
+def format_summary(name: str, samples: Sequence[float]) -> str:
+    """Format latency samples as a single report line."""
+    s = summarize(samples)
+    return (f"{name:<24} n={s['count']:<7} mean={s['mean_ms']:8.3f}ms "
+            f"p50={s['p50_ms']:8.3f}ms p99={s['p99_ms']:8.3f}ms max={s['max_ms']:8.3f}ms")
+
+@contextlib.contextmanager
+def quiet() -> Iterator[io.StringIO]:
+    """Swallow the bot's print() chatter while a benchmark runs."""
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        yield buffer
@@ -0,0 +1,526 @@
+"""In-process stand-ins for Discord, yt-dlp and YouTube's CDN so benchmarks run without network access."""
+import asyncio
+import datetime
+import hashlib
+import http.server
+import itertools
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+import discord
+from discord.ext import commands
+from discord.opus import Encoder as OpusEncoder
+from yt_dlp.utils import DownloadError
+from gapless import cleanup_later
+from music_player import MusicPlayer, Song
+from utils import extract_youtube_id
+
+SILENCE_FRAME = b'\x00' * OpusEncoder.FRAME_SIZE
+
+def burn_cpu(seconds: float) -> None:
+    """Spend roughly ``seconds`` of CPU time in GIL-holding Python, like yt-dlp's parsing."""
+    deadline = time.thread_time() + seconds
+    payload = '{"formats": [' + ','.join(['{"itag": 251, "url": "https://example/v?sig=abc"}'] * 20) + ']}'
+    while time.thread_time() < deadline:
+        json.loads(payload)
+        re.findall(r'"itag": (\d+)', payload)
+
+class FakeYoutubeDL:
+    """
+    Mimics ``yt_dlp.YoutubeDL.extract_info``.
+
+    ``latency`` is spent sleeping (network wait), ``cpu_work`` is spent
+    burning CPU while holding the GIL (signature and JSON handling).
+    Flat listings sleep ``flat_latency`` instead when it is given, as they
+    skip the player page and signature work.
+
+    With ``latency_sigma`` the wait is log-normally distributed around a
+    median of ``latency``, and ``failure_rate`` of the full extractions fail
+    with yt-dlp's DownloadError after waiting, like unavailable videos. Both are drawn from ``seed`` and the
+    query, so a query waits and fails the same way in every run, whatever
+    order the workers pick queries up in. Stream URLs point at ``cdn``
+    (see FakeCDN) when it is given.
+    """
+
+    def __init__(self, params: Optional[Dict[str, Any]] = None, latency: float = 0.0,
+                 cpu_work: float = 0.0, duration: int = 180, playlist_size: int = 200,
+                 flat_latency: Optional[float] = None, latency_sigma: float = 0.0,
+                 failure_rate: float = 0.0, seed: int = 0, cdn: Optional[str] = None):
+        self.params = params or {}
+        self.playlist_size = playlist_size
+        self.latency = latency
+        self.flat_latency = flat_latency
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self.cpu_work = cpu_work
+        self.duration = duration
+        self.cdn = cdn
+        self.calls = 0
+
+    def extract_info(self, query: str, download: bool = False) -> Dict[str, Any]:
+        self.calls += 1
+        flat = bool(self.params.get('extract_flat'))
+        draw = random.Random(f"{self.seed}/{flat}/{query}")
+        spread = math.exp(draw.gauss(0.0, self.latency_sigma)) if self.latency_sigma else 1.0
+        if flat and self.flat_latency is not None:
+            time.sleep(self.flat_latency * spread)
+        else:
+            if self.latency:
+                time.sleep(self.latency * spread)
+            if self.cpu_work:
+                burn_cpu(self.cpu_work)
+        if not flat and draw.random() < self.failure_rate:
+            raise DownloadError(f"ERROR: [youtube] {query}: Video unavailable")
+        search = re.match(r'ytsearch(\d*):(.*)', query)
+        if search:
+            return self._search(search.group(2), int(search.group(1) or 1), flat)
+        if flat and 'list=' in query:
+            return self._flat_playlist(query)
+        return self._video(query)
+
+    def _video(self, query: str) -> Dict[str, Any]:
+        video_id = extract_youtube_id(query) or hashlib.sha1(query.encode()).hexdigest()[:11]
+        expire = int(time.time()) + 6 * 3600
+        stream = (f"{self.cdn}/{video_id}.wav?expire={expire}" if self.cdn else
+                  f"https://rr1---sn-fake.googlevideo.com/videoplayback?expire={expire}&id={video_id}")
+        return {
+            'id': video_id,
+            'title': f"Fake song {video_id}",
+            'webpage_url': f"https://www.youtube.com/watch?v={video_id}",
+            'duration': self.duration,
+            'thumbnail': f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+            'url': stream,
+        }
+
+    def _search(self, words: str, count: int, flat: bool) -> Dict[str, Any]:
+        entries = []
+        for i in range(count):
+            video_id = hashlib.sha1(f"{words}/{i}".encode()).hexdigest()[:11]
+            url = f"https://www.youtube.com/watch?v={video_id}"
+            if flat:
+                entries.append({'_type': 'url', 'id': video_id, 'url': url,
+                                'title': f"Fake song {video_id}", 'duration': self.duration})
+            else:
+                entries.append(self._video(url))
+        return {'_type': 'playlist', 'id': words, 'title': words, 'entries': entries}
+
+    def _flat_playlist(self, query: str) -> Dict[str, Any]:
+        playlist_id = query.rpartition('list=')[2]
+        entries = []
+        for i in range(self.playlist_size):
+            video_id = hashlib.sha1(f"{playlist_id}/{i}".encode()).hexdigest()[:11]
+            entries.append({
+                '_type': 'url',
+                'id': video_id,
+                'url': f"https://www.youtube.com/watch?v={video_id}",
+                'title': f"Fake playlist entry {i}",
+                'duration': self.duration,
+            })
+        return {'_type': 'playlist', 'id': playlist_id, 'title': f"Fake playlist {playlist_id}", 'entries': entries}
+
+def make_wav(seconds: float, sample_rate: int = 16000, frequency: int = 500) -> bytes:
+    """Render a mono 16-bit WAV file of a sine tone."""
+    period = [int(8000 * math.sin(2 * math.pi * i * frequency / sample_rate))
+              for i in range(sample_rate // frequency)]
+    cycle = struct.pack(f"<{len(period)}h", *period)
+    data = cycle * int(seconds * frequency)
+    header = struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + len(data), b'WAVE', b'fmt ', 16, 1, 1,
+                         sample_rate, sample_rate * 2, 2, 16, b'data', len(data))
+    return header + data
+
+class FakeCDN:
+    """
+    Local HTTP server standing in for YouTube's CDN.
+
+    Any ``/<video id>.wav`` is answered with a ``duration`` second tone, and
+    byte ranges are honoured, so ffmpeg can stream, reconnect and seek as it
+    would against googlevideo.com. Each response waits ``latency`` seconds
+    before the first byte. Pass ``url`` to FakeYoutubeDL as its ``cdn``.
+    """
+
+    def __init__(self, duration: float = 180, latency: float = 0.0):
+        self.latency = latency
+        self.audio = make_wav(duration)
+        self.requests = 0
+        self.bytes_sent = 0
+        cdn = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                cdn._respond(self, body=True)
+
+            def do_HEAD(self) -> None:
+                cdn._respond(self, body=False)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'FakeCDN':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-cdn', daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _respond(self, handler: http.server.BaseHTTPRequestHandler, body: bool) -> None:
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if not handler.path.split('?')[0].endswith('.wav'):
+            handler.send_error(404)
+            return
+        size = len(self.audio)
+        start, end = 0, size - 1
+        requested = re.match(r'bytes=(\d*)-(\d*)', handler.headers.get('Range', ''))
+        if requested and requested.group(1):
+            start = int(requested.group(1))
+            end = min(int(requested.group(2)), end) if requested.group(2) else end
+        if start >= size:
+            handler.send_response(416)
+            handler.send_header('Content-Range', f"bytes */{size}")
+            handler.end_headers()
+            return
+        handler.send_response(206 if requested else 200)
+        handler.send_header('Content-Type', 'audio/wav')
+        handler.send_header('Accept-Ranges', 'bytes')
+        handler.send_header('Content-Length', str(end - start + 1))
+        if requested:
+            handler.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        handler.end_headers()
+        if not body:
+            return
+        try:
+            for offset in range(start, end + 1, 65536):
+                chunk = self.audio[offset:min(offset + 65536, end + 1)]
+                handler.wfile.write(chunk)
+                self.bytes_sent += len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg was stopped (skip, seek) before the file was read to the end
+            pass
+
+class FakeAudioSource(discord.AudioSource):
+    """
+    PCM source producing a fixed number of 20 ms frames.
+
+    ``startup`` seconds are slept before the first frame, like ffmpeg
+    connecting and probing its input; ``marker`` fills the frames so a
+    listener can tell sources apart.
+    """
+
+    def __init__(self, frames: int = 50, startup: float = 0.0, marker: int = 0):
+        self.frames = frames
+        self.startup = startup
+        self.frame = bytes([marker]) * OpusEncoder.FRAME_SIZE if marker else SILENCE_FRAME
+        self.read_count = 0
+        self.cleaned_up = False
+
+    def read(self) -> bytes:
+        if self.read_count >= self.frames:
+            return b''
+        if self.read_count == 0 and self.startup:
+            time.sleep(self.startup)
+        self.read_count += 1
+        return self.frame
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self) -> None:
+        self.cleaned_up = True
+
+class FakeVoiceClient:
+    """Voice client that accepts sources but never sends audio."""
+
+    def __init__(self, channel: 'FakeVoiceChannel'):
+        self.channel = channel
+        self.source: Optional[discord.AudioSource] = None
+        self._after: Optional[Callable[[Optional[Exception]], Any]] = None
+        self._connected = True
+        self._playing = False
+        self._paused = False
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def is_playing(self) -> bool:
+        return self._playing
+
+    def is_paused(self) -> bool:
+        return self._paused
+
+    def play(self, source: discord.AudioSource, *, after=None) -> None:
+        self.source = source
+        self._after = after
+        self._playing = True
+        self._paused = False
+
+    def pause(self) -> None:
+        self._paused = True
+
+    def resume(self) -> None:
+        self._paused = False
+
+    def stop(self) -> None:
+        if not (self._playing or self._paused):
+            return
+        self._playing = self._paused = False
+        after, self._after = self._after, None
+        if after:
+            # discord.py calls ``after`` from the audio player thread
+            asyncio.get_running_loop().call_soon(after, None)
+        if self.source:
+            # and then cleans up the source there, never on the event loop
+            cleanup_later(self.source)
+
+    async def move_to(self, channel: 'FakeVoiceChannel') -> None:
+        self.channel = channel
+
+    async def disconnect(self, *, force: bool = False) -> None:
+        self.stop()
+        self._connected = False
+
+class CadenceVoiceClient(FakeVoiceClient):
+    """
+    Voice client that reads its source every 20 ms in a thread, like discord.py's AudioPlayer.
+
+    Every frame read is recorded as ``(time.perf_counter(), first byte)`` in
+    ``received``; a read that ran late is not caught up on, so slow sources
+    show up as gaps between timestamps. With a ``speed`` above 1 frames are
+    read that many times faster, e.g. a 3 minute song plays in 18 seconds at
+    10x.
+    """
+
+    def __init__(self, channel: 'FakeVoiceChannel', speed: float = 1.0):
+        super().__init__(channel)
+        self.speed = speed
+        self.received: List[tuple] = []
+        self._thread: Optional[threading.Thread] = None
+        self._end = threading.Event()
+        self._loop = asyncio.get_running_loop()
+
+    def play(self, source: discord.AudioSource, *, after=None) -> None:
+        super().play(source, after=after)
+        self._end = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(source, after, self._end), daemon=True)
+        self._thread.start()
+
+    def _run(self, source: discord.AudioSource, after, end: threading.Event) -> None:
+        delay = OpusEncoder.FRAME_LENGTH / 1000 / self.speed
+        next_frame = time.perf_counter()
+        while not end.is_set():
+            if self._paused:
+                time.sleep(delay)
+                next_frame = time.perf_counter()
+                continue
+            source = self.source
+            data = source.read()
+            if not data:
+                break
+            now = time.perf_counter()
+            self.received.append((now, data[0]))
+            next_frame = max(next_frame + delay, now)
+            time.sleep(max(0.0, next_frame - time.perf_counter()))
+        if not end.is_set():
+            self._playing = False
+        # Like discord.py, call ``after`` and clean up the source playing at the
+        # end (which may have been swapped in) from this thread, stopped or not
+        if after:
+            self._loop.call_soon_threadsafe(after, None)
+        source.cleanup()
+
+    def stop(self) -> None:
+        if not (self._playing or self._paused):
+            return
+        self._playing = self._paused = False
+        self._end.set()
+
+class FakeVoiceChannel:
+    # Voice client class connecting returns, e.g. CadenceVoiceClient to read the audio
+    client_class = FakeVoiceClient
+
+    def __init__(self, channel_id: int, guild: 'FakeGuild'):
+        self.id = channel_id
+        self.name = f"voice-{channel_id}"
+        self.guild = guild
+        self.members: List[FakeMember] = []
+
+    async def connect(self) -> FakeVoiceClient:
+        return self.client_class(self)
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+        self.name = f"guild-{guild_id}"
+
+    def get_channel(self, channel_id: int) -> FakeVoiceChannel:
+        return FakeVoiceChannel(channel_id, self)
+
+class FakeTextChannel:
+    def __init__(self, channel_id: int, guild: FakeGuild):
+        self.id = channel_id
+        self.name = f"text-{channel_id}"
+        self.guild = guild
+
+class FakeVoiceState:
+    def __init__(self, channel: FakeVoiceChannel):
+        self.channel = channel
+
+class FakeMember:
+    def __init__(self, member_id: int, guild: FakeGuild, channel: Optional[FakeVoiceChannel] = None):
+        self.id = member_id
+        self.guild = guild
+        self.bot = False
+        self.display_name = f"member-{member_id}"
+        self.mention = f"<@{member_id}>"
+        self.voice = FakeVoiceState(channel) if channel else None
+
+_message_ids = itertools.count(1)
+
+class FakeMessage:
+    def __init__(self, content: Optional[str] = None, embed: Optional[discord.Embed] = None,
+                 author: Optional[FakeMember] = None, channel: Optional[FakeTextChannel] = None):
+        self.id = next(_message_ids)
+        self.content = content
+        self.embed = embed
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild if channel is not None else None
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.attachments: List[Any] = []
+        # Connection state commands.Context keeps a reference to; nothing reads it here
+        self._state = None
+
+    async def edit(self, *, content: Optional[str] = None, embed: Optional[discord.Embed] = None) -> None:
+        self.content = content
+        if embed is not None:
+            self.embed = embed
+
+class FakeContext:
+    """Just enough of ``commands.Context`` for the command callbacks in bot.py."""
+
+    def __init__(self, guild_id: int, member_id: Optional[int] = None):
+        self.guild = FakeGuild(guild_id)
+        channel = FakeVoiceChannel(guild_id * 10, self.guild)
+        self.author = FakeMember(member_id or guild_id * 100, self.guild, channel)
+        channel.members.append(self.author)
+        self.channel = FakeTextChannel(guild_id * 10 + 1, self.guild)
+        self.sent: List[FakeMessage] = []
+
+    async def send(self, content: Optional[str] = None, *, embed: Optional[discord.Embed] = None) -> FakeMessage:
+        message = FakeMessage(content, embed, channel=self.channel)
+        self.sent.append(message)
+        return message
+
+class FakeCommandContext(commands.Context):
+    """``commands.Context`` whose replies are recorded in ``sent`` instead of posted to Discord."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.sent: List[FakeMessage] = []
+        self.done_at: Optional[float] = None
+
+    async def send(self, content: Optional[str] = None, *, embed: Optional[discord.Embed] = None,
+                   **kwargs) -> FakeMessage:
+        message = FakeMessage(content, embed, author=self.bot.user, channel=self.channel)
+        self.sent.append(message)
+        return message
+
+class FakeGateway:
+    """
+    Delivers messages to a ``commands.Bot`` the way discord.py does once connected, without connecting.
+
+    Commands go through ``Bot.get_context`` and ``Bot.invoke``, so prefix
+    and argument parsing, checks, invoke hooks and ``on_command_error`` all
+    run; each message is handled in a task of its own, like an event from
+    the gateway. Other messages are dispatched as ``message`` events, which
+    is what ``bot.wait_for('message')`` sees. Members are in a voice channel
+    whose client reads frames at ``speed`` times the real cadence.
+    """
+
+    def __init__(self, bot: commands.Bot, speed: float = 1.0):
+        self.bot = bot
+        self.speed = speed
+        bot.loop = asyncio.get_running_loop()
+        # The bot's own account; get_context ignores messages it sent
+        bot._connection.user = FakeMember(1, None)
+        bot._connection.user.bot = True
+        self.contexts: List[FakeCommandContext] = []
+
+    def member(self, guild_id: int, member_id: Optional[int] = None) -> FakeMember:
+        """Get a new member of a guild, in one of its voice channels."""
+        guild = FakeGuild(guild_id)
+        channel = FakeVoiceChannel(guild_id * 10, guild)
+        channel.client_class = lambda channel: CadenceVoiceClient(channel, self.speed)
+        member = FakeMember(member_id or guild_id * 100, guild, channel)
+        channel.members.append(member)
+        member.text_channel = FakeTextChannel(guild_id * 10 + 1, guild)
+        return member
+
+    async def send(self, author: FakeMember, content: str) -> Optional[FakeCommandContext]:
+        """
+        Post a message as a member and wait until the bot has handled it.
+
+        Args:
+            author (FakeMember): Member from ``member``
+            content (str): Message text, e.g. '!play never gonna give you up'
+
+        Returns:
+            Optional[FakeCommandContext]: The command's context, with its replies; None if it was no command
+        """
+        message = FakeMessage(content, author=author, channel=author.text_channel)
+        return await asyncio.get_running_loop().create_task(self._receive(message))
+
+    async def _receive(self, message: FakeMessage) -> Optional[FakeCommandContext]:
+        ctx = await self.bot.get_context(message, cls=FakeCommandContext)
+        if ctx.prefix is None:
+            self.bot.dispatch('message', message)
+            return None
+        self.contexts.append(ctx)
+        await self.bot.invoke(ctx)
+        ctx.done_at = time.perf_counter()
+        return ctx
+
+class FakeBot:
+    """Just enough of ``commands.Bot`` for PlayerManager; every guild exists."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    def get_guild(self, guild_id: int) -> FakeGuild:
+        return FakeGuild(guild_id)
+
+class OfflineMusicPlayer(MusicPlayer):
+    """
+    MusicPlayer that plays fake sources instead of spawning ffmpeg.
+
+    Sources have ``source_frames`` frames and take ``source_startup``
+    seconds to produce the first one. Consecutive sources carry different
+    marker bytes, so a listener can tell where one ends and the next begins.
+    """
+
+    source_frames = 50
+    source_startup = 0.0
+    sources_created = 0
+
+    def _fake_source(self, song: Song) -> discord.AudioSource:
+        self.sources_created += 1
+        return FakeAudioSource(self.source_frames, self.source_startup, 1 + self.sources_created % 255)
+
+    def create_audio_source(self, song: Song, start: float = 0.0, cache: bool = False) -> discord.AudioSource:
+        return self._fake_source(song)
+
+    def create_cached_audio_source(self, song: Song, path: str, start: float = 0.0) -> discord.AudioSource:
+        return self._fake_source(song)
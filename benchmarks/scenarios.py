@@ -0,0 +1,319 @@
+"""
+Repeatable end-to-end scenarios: users typing commands into many guilds, played to fake voice channels.
+
+Messages go through a fake gateway into the bot's own command handling
+(bot.py), extraction through a fake yt-dlp with seeded latency and failure
+distributions, and audio to voice clients reading frames at ``speed`` times
+the 20 ms cadence. Sources are fake PCM unless ``ffmpeg`` is set, in which
+case real ffmpeg processes stream songs from a local stand-in for YouTube's
+CDN. Nothing touches the network, so a run with the same options repeats.
+
+Each scenario returns a Report: throughput, p50/p99 latency per measured
+step, CPU use of the bot (and of ffmpeg) and event-loop lag.
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import random
+import time
+from collections import Counter
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from benchmarks.common import format_summary, quiet, summarize
+from benchmarks.fakes import FakeCDN, FakeCommandContext, FakeGateway, FakeMember, FakeYoutubeDL, OfflineMusicPlayer
+
+with quiet():
+    import bot as bot_module
+from extraction import ThreadExtractor
+from music_player import MusicPlayer
+from player_manager import PlayerManager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+class Report:
+    """Latency samples, counts, throughput and CPU use of one scenario run."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.samples: Dict[str, List[float]] = {}
+        self.counts: Counter = Counter()
+        self.operations = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.child_cpu = 0.0
+        self.loop_lag: List[float] = []
+
+    def add(self, step: str, seconds: float) -> None:
+        self.samples.setdefault(step, []).append(seconds)
+
+    @contextlib.asynccontextmanager
+    async def measure(self) -> AsyncIterator[None]:
+        """Time the block: wall clock, CPU of this process and of exited children, and event-loop lag."""
+        stop = asyncio.Event()
+        watcher = asyncio.get_running_loop().create_task(self._watch_loop(stop))
+        children = resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.wall = time.perf_counter() - wall
+            self.cpu = time.process_time() - cpu
+            if children is not None:
+                usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+                self.child_cpu = (usage.ru_utime + usage.ru_stime) - (children.ru_utime + children.ru_stime)
+            stop.set()
+            await watcher
+
+    async def _watch_loop(self, stop: asyncio.Event, interval: float = 0.01) -> None:
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag.append(time.perf_counter() - start - interval)
+
+    def lines(self) -> List[str]:
+        """Format the report for printing."""
+        throughput = self.operations / self.wall if self.wall else 0.0
+        lines = [f"== {self.name}: {self.operations} operations in {self.wall:.2f}s, {throughput:.1f}/s",
+                 f"CPU: bot {self.cpu / self.wall:.1%} of a core" if self.wall else "CPU: -"]
+        if self.wall and self.child_cpu:
+            lines[-1] += f", ffmpeg {self.child_cpu / self.wall:.1%}"
+        if self.operations:
+            lines[-1] += f", {self.cpu / self.operations * 1000:.2f}ms bot CPU per operation"
+        lines.extend(format_summary(step, samples) for step, samples in self.samples.items())
+        lines.append(format_summary("event loop lag", self.loop_lag))
+        if self.counts:
+            lines.append(', '.join(f"{name}: {count}" for name, count in sorted(self.counts.items())))
+        return lines
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Get the report as JSON-serializable data, to compare runs."""
+        return {
+            'scenario': self.name,
+            'operations': self.operations,
+            'wall_seconds': self.wall,
+            'throughput_per_second': self.operations / self.wall if self.wall else 0.0,
+            'cpu_seconds': self.cpu,
+            'ffmpeg_cpu_seconds': self.child_cpu,
+            'latency': {step: summarize(samples) for step, samples in self.samples.items()},
+            'loop_lag': summarize(self.loop_lag),
+            'counts': dict(self.counts),
+        }
+
+class Bench:
+    """The bot wired to the fakes, with a fresh player manager (and caches) per scenario."""
+
+    def __init__(self, options: argparse.Namespace):
+        self.options = options
+        self.gateway = FakeGateway(bot_module.bot, options.speed)
+        self.cdn = FakeCDN(options.duration, options.cdn_latency).start() if options.ffmpeg else None
+        self.manager: Optional[PlayerManager] = None
+
+    def start(self, playlist_size: int = 200) -> PlayerManager:
+        """Set up a new player manager; playlists have ``playlist_size`` entries."""
+        options = self.options
+        self.manager = PlayerManager(bot_module.bot, player_factory=self._make_player)
+        self.manager.extractor.shutdown()
+        self.manager.extractor = ThreadExtractor(workers=options.workers, ytdl_factory=functools.partial(
+            FakeYoutubeDL, latency=options.latency, latency_sigma=options.latency_sigma,
+            flat_latency=options.flat_latency, failure_rate=options.failure_rate, seed=options.seed,
+            duration=int(options.duration), playlist_size=playlist_size,
+            cdn=self.cdn.url if self.cdn else None))
+        self.manager.audio_cache = None
+        self.manager.loudness = None
+        self.manager.journal = None
+        bot_module.players = self.manager
+        return self.manager
+
+    def _make_player(self, *args, **kwargs) -> MusicPlayer:
+        if self.options.ffmpeg:
+            return MusicPlayer(*args, **kwargs)
+        player = OfflineMusicPlayer(*args, **kwargs)
+        # As long as the song's duration says, so a song that ends is not taken for a dead stream
+        player.source_frames = int(self.options.duration * 50)
+        return player
+
+    async def stop(self) -> None:
+        pool = self.manager.extractor._pool
+        await self.manager.close()
+        if pool is not None:
+            # Extractions still running call back into the loop when they finish
+            await asyncio.to_thread(pool.shutdown)
+        # Let the last after-callbacks run before the next scenario
+        await asyncio.sleep(0.1)
+
+    def close(self) -> None:
+        if self.cdn is not None:
+            self.cdn.close()
+
+    async def command(self, report: Report, member: FakeMember, content: str,
+                      step: Optional[str] = None) -> FakeCommandContext:
+        """Send a command as a member and time it until the bot is done with it."""
+        start = time.perf_counter()
+        ctx = await self.gateway.send(member, content)
+        report.add(step or content.split()[0], ctx.done_at - start)
+        report.operations += 1
+        if any(message.content and message.content.startswith('❌') for message in ctx.sent):
+            report.counts[f"{content.split()[0]} failed"] += 1
+        return ctx
+
+    def voice(self, member: FakeMember):
+        player = self.manager.players.get(member.guild.id)
+        return player.voice_client if player is not None else None
+
+    async def first_frame_after(self, member: FakeMember, start: float, timeout: float = 10.0) -> Optional[float]:
+        """Wait for the member's voice client to read a frame after ``start``; get the time it did."""
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            voice = self.voice(member)
+            if voice is not None and voice.received and voice.received[-1][0] >= start:
+                first = voice.received[-1][0]
+                for at, _ in reversed(voice.received):
+                    if at < start:
+                        break
+                    first = at
+                return first
+            await asyncio.sleep(0.002)
+        return None
+
+def succeeded(ctx: FakeCommandContext) -> bool:
+    return bool(ctx.sent) and ctx.sent[-1].embed is not None
+
+async def play(bench: Bench, report: Report) -> None:
+    """Every guild joins, then all at once play a song: time to the reply and to the first frame heard."""
+    bench.start()
+    members = [bench.gateway.member(guild_id) for guild_id in range(1, bench.options.guilds + 1)]
+    await asyncio.gather(*(bench.command(Report('join'), member, '!join') for member in members))
+
+    async def play_one(member: FakeMember) -> None:
+        start = time.perf_counter()
+        ctx = await bench.command(report, member, f"!play scenario song {member.guild.id}", '!play -> reply')
+        if not succeeded(ctx):
+            return
+        heard = await bench.first_frame_after(member, start)
+        if heard is None:
+            report.counts['never heard'] += 1
+        else:
+            report.add('!play -> first frame', heard - start)
+
+    async with report.measure():
+        await asyncio.gather(*(play_one(member) for member in members))
+    await bench.stop()
+
+async def skip_storm(bench: Bench, report: Report) -> None:
+    """A playlist is queued and skipped through as fast as a user can type: the player must keep up."""
+    options = bench.options
+    bench.start(playlist_size=options.songs)
+    member = bench.gateway.member(options.guilds + 1)
+    await bench.command(Report('join'), member, '!join')
+    await bench.command(report, member, "!playlist https://www.youtube.com/playlist?list=PLstorm")
+    player = bench.manager.get(member.guild.id)
+    await bench.first_frame_after(member, 0.0)
+
+    skips: List[float] = []
+    async with report.measure():
+        tasks = []
+        for _ in range(options.songs - 1):
+            skips.append(time.perf_counter())
+            tasks.append(asyncio.get_running_loop().create_task(bench.command(report, member, '!skip')))
+            await asyncio.sleep(options.skip_interval)
+        await asyncio.gather(*tasks)
+        # The storm is over once a song is heard again
+        await bench.first_frame_after(member, time.perf_counter())
+
+    voice = bench.voice(member)
+    if not options.ffmpeg:
+        # Offline sources fill their frames with a marker per source: audio changes hands where it changes
+        markers = [marker for _, marker in voice.received]
+        runs = [marker for i, marker in enumerate(markers) if i == 0 or markers[i - 1] != marker]
+        report.counts['songs heard'] = len(runs)
+        report.counts['songs heard twice'] = len(runs) - len(set(runs))
+        for skipped_at in skips:
+            before = [marker for at, marker in voice.received if at < skipped_at]
+            after = next((at for at, marker in voice.received if at >= skipped_at and before
+                          and marker != before[-1]), None)
+            if after is not None:
+                report.add('!skip -> new song heard', after - skipped_at)
+    report.counts['left in queue'] = len(player.queue)
+    times = [at for at, _ in voice.received]
+    report.counts['longest silence ms'] = int(max((b - a for a, b in zip(times, times[1:])), default=0) * 1000)
+    await bench.stop()
+
+async def big_queue(bench: Bench, report: Report) -> None:
+    """Queue commands against a queue of ``queue_size`` songs."""
+    options = bench.options
+    bench.start(playlist_size=options.queue_size)
+    member = bench.gateway.member(options.guilds + 2)
+    await bench.command(Report('join'), member, '!join')
+    draw = random.Random(options.seed)
+    async with report.measure():
+        await bench.command(report, member, "!playlist https://www.youtube.com/playlist?list=PLbig",
+                            f"!playlist ({options.queue_size} songs)")
+        await bench.first_frame_after(member, 0.0)
+        for _ in range(options.rounds):
+            size = len(bench.manager.get(member.guild.id).queue)
+            for content in ("!queue", f"!move {draw.randint(1, size)} {draw.randint(1, size)}",
+                            f"!remove {draw.randint(1, size)}", "!shuffle", "!skip", "!nowplaying"):
+                await bench.command(report, member, content)
+    report.counts['queued'] = len(bench.manager.get(member.guild.id).queue)
+    await bench.stop()
+
+async def many_guilds(bench: Bench, report: Report) -> None:
+    """Every guild runs a short session at once, with seeded think time between commands."""
+    options = bench.options
+    bench.start()
+    first = options.guilds + 10
+    members = [bench.gateway.member(guild_id) for guild_id in range(first, first + options.many_guilds)]
+
+    async def session(member: FakeMember) -> None:
+        draw = random.Random(f"{options.seed}/{member.guild.id}")
+        guild_id = member.guild.id
+        for content in ("!join", f"!play session song {guild_id} a", f"!play session song {guild_id} b",
+                        "!queue", "!volume 50", "!skip", "!nowplaying", "!stop", "!leave"):
+            await asyncio.sleep(draw.uniform(0, options.think_time))
+            start = time.perf_counter()
+            ctx = await bench.command(report, member, content)
+            if content.endswith(' a') and succeeded(ctx):
+                heard = await bench.first_frame_after(member, start)
+                if heard is not None:
+                    report.add('!play -> first frame', heard - start)
+
+    async with report.measure():
+        await asyncio.gather(*(session(member) for member in members))
+    report.counts['players'] = len(bench.manager)
+    await bench.stop()
+
+SCENARIOS: Dict[str, Callable[[Bench, Report], Awaitable[None]]] = {
+    'play': play,
+    'skip_storm': skip_storm,
+    'big_queue': big_queue,
+    'many_guilds': many_guilds,
+}
+
+async def run(names: List[str], options: argparse.Namespace) -> List[Report]:
+    """
+    Run scenarios one after another.
+
+    Args:
+        names (List[str]): Scenario names, keys of SCENARIOS
+        options (argparse.Namespace): Options of ``python -m benchmarks``
+
+    Returns:
+        List[Report]: A report per scenario, in order
+    """
+    bench = Bench(options)
+    reports = []
+    try:
+        for name in names:
+            report = Report(name)
+            # Silenced as a whole: commands run concurrently, so stdout cannot be swapped per command
+            with quiet():
+                await SCENARIOS[name](bench, report)
+            reports.append(report)
+            print('\n'.join(report.lines()), flush=True)
+    finally:
+        bench.close()
+    return reports
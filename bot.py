@@ -2,10 +2,14 @@ import discord
 from discord.ext import commands
 import asyncio
 import os
+import time
 from typing import Optional
-from config import DISCORD_TOKEN, COMMAND_PREFIX
+from config import DISCORD_TOKEN, COMMAND_PREFIX, SEARCH_PICK_TIMEOUT
 from music_player import MusicPlayer, Song
-from utils import is_valid_youtube_url, format_duration, truncate_text, safe_disconnect
+from player_manager import PlayerManager
+import tracing
+from utils import (is_valid_youtube_url, is_playlist_url, format_duration, truncate_text, safe_disconnect,
+                   parse_timestamp)
 
 # Set up bot intents
 intents = discord.Intents.default()
@@ -47,8 +51,38 @@ load_opus()
 # Create bot instance
 bot = commands.Bot(command_prefix=COMMAND_PREFIX, intents=intents)
 
-# Global music player instance
-music_player = MusicPlayer(bot)
+# Per-guild music players, created on first use
+players = PlayerManager(bot)
+
+@bot.check
+async def guild_only(ctx):
+    """Music commands only make sense inside a server."""
+    if ctx.guild is None:
+        raise commands.NoPrivateMessage()
+    return True
+
+# Commands that are not traced, so !trace last shows the command before it
+UNTRACED_COMMANDS = {'trace'}
+
+@bot.before_invoke
+async def start_command_trace(ctx):
+    """Trace every command; the stages it awaits become spans of the trace."""
+    if ctx.command.name in UNTRACED_COMMANDS:
+        return
+    message = getattr(ctx, 'message', None)
+    created_at = getattr(message, 'created_at', None)
+    # Time from Discord receiving the message to the command starting (includes clock skew)
+    receipt_delay = (time.time() - created_at.timestamp()) * 1000 if created_at else None
+    tracing.start_trace(f"{COMMAND_PREFIX}{ctx.command.name}", ctx.guild.id, command=True,
+                        args=truncate_text(' '.join(str(arg) for arg in [*ctx.args[1:], *ctx.kwargs.values()]),
+                                           100) or None,
+                        receipt_delay_ms=round(receipt_delay) if receipt_delay is not None else None)
+
+@bot.after_invoke
+async def end_command_trace(ctx):
+    root = tracing.current_span()
+    if root is not None and root.parent_id is None:
+        tracing.end_trace(root)
 
 @bot.event
 async def on_ready():
@@ -56,6 +90,14 @@ async def on_ready():
     print(f"{bot.user} has connected to Discord!")
     print(f"Bot is ready to play music!")
     
+    # Bring back the queues journaled before the last shutdown or crash
+    restored = await players.restore()
+    if restored:
+        print(f"Restored {restored} guild queues")
+    
+    # Start evicting idle guild players
+    players.start()
+    
     # Set bot status
     await bot.change_presence(
         activity=discord.Activity(
@@ -71,6 +113,8 @@ async def on_command_error(ctx, error):
         await ctx.send(f"❌ Unknown command. Use `{COMMAND_PREFIX}musichelp` for available commands.")
     elif isinstance(error, commands.MissingRequiredArgument):
         await ctx.send(f"❌ Missing required argument. Use `{COMMAND_PREFIX}musichelp` for command usage.")
+    elif isinstance(error, commands.NoPrivateMessage):
+        await ctx.send("❌ Music commands can only be used in a server.")
     elif isinstance(error, commands.BadArgument):
         await ctx.send(f"❌ Invalid argument provided. Use `{COMMAND_PREFIX}musichelp` for command usage.")
     else:
@@ -80,6 +124,8 @@ async def on_command_error(ctx, error):
 @bot.command(name='join', aliases=['connect'])
 async def join_voice_channel(ctx):
     """Join the voice channel of the user."""
+    music_player = players.get(ctx.guild.id)
+    
     if not ctx.author.voice:
         await ctx.send("❌ You need to be in a voice channel to use this command!")
         return
@@ -87,15 +133,17 @@ async def join_voice_channel(ctx):
     channel = ctx.author.voice.channel
     
     if music_player.voice_client and music_player.voice_client.is_connected():
-        await music_player.voice_client.move_to(channel)
-        await ctx.send(f"🔄 Moved to **{channel.name}**")
+        await tracing.traced('voice.move', music_player.voice_client.move_to(channel))
+        await tracing.traced('discord.send', ctx.send(f"🔄 Moved to **{channel.name}**"))
     else:
-        music_player.voice_client = await channel.connect()
-        await ctx.send(f"✅ Joined **{channel.name}**")
+        music_player.voice_client = await tracing.traced('voice.connect', channel.connect())
+        await tracing.traced('discord.send', ctx.send(f"✅ Joined **{channel.name}**"))
 
 @bot.command(name='leave', aliases=['disconnect'])
 async def leave_voice_channel(ctx):
     """Leave the current voice channel."""
+    music_player = players.get(ctx.guild.id)
+    
     if not music_player.voice_client:
         await ctx.send("❌ Bot is not connected to a voice channel!")
         return
@@ -108,25 +156,34 @@ async def leave_voice_channel(ctx):
 @bot.command(name='play', aliases=['p'])
 async def play_music(ctx, *, query: str):
     """Play music from YouTube URL or search query."""
+    # Start of the wait for the first frame, when the song plays right away
+    requested_at = time.perf_counter()
+    music_player = players.get(ctx.guild.id)
+    
     # Check if user is in voice channel
     if not ctx.author.voice:
         await ctx.send("❌ You need to be in a voice channel to play music!")
         return
     
+    # Playlists are imported entry by entry instead of resolved as one song
+    if is_playlist_url(query):
+        await play_playlist(ctx, url=query)
+        return
+    
     # Join voice channel if not already connected
     if not music_player.voice_client or not music_player.voice_client.is_connected():
-        await join_voice_channel(ctx)
+        await tracing.traced('join', join_voice_channel(ctx))
         # Wait a moment for connection to stabilize
-        await asyncio.sleep(1)
+        await tracing.traced('sleep.after_join', asyncio.sleep(1))
     
     # Show loading message
-    loading_msg = await ctx.send("🔍 Searching for song...")
+    loading_msg = await tracing.traced('discord.send', ctx.send("🔍 Searching for song..."))
     
     # Extract song information
     song = await music_player.extract_song_info(query)
     
     if not song:
-        await loading_msg.edit(content="❌ Could not find or load the requested song! This might be due to:\n• The video being DRM protected\n• The video being unavailable\n• Network issues\n\nTry searching for a different song or using a different YouTube video.")
+        await tracing.traced('discord.edit', loading_msg.edit(content="❌ Could not find or load the requested song! This might be due to:\n• The video being DRM protected\n• The video being unavailable\n• Network issues\n\nTry searching for a different song or using a different YouTube video."))
         return
     
     # Set requester
@@ -143,21 +200,121 @@ async def play_music(ctx, *, query: str):
     )
     
     embed.add_field(name="Duration", value=format_duration(song.duration or 0), inline=True)
-    embed.add_field(name="Requested by", value=song.requester.mention, inline=True)
+    embed.add_field(name="Requested by", value=song.requester_mention, inline=True)
     embed.add_field(name="Position in queue", value=len(music_player.queue), inline=True)
     
     if song.thumbnail:
         embed.set_thumbnail(url=song.thumbnail)
     
-    await loading_msg.edit(content="", embed=embed)
+    await tracing.traced('discord.edit', loading_msg.edit(content="", embed=embed))
     
     # Start playing if not already playing
+    if not music_player.is_playing and music_player.voice_client and not music_player.voice_client.is_playing():
+        await music_player.play_next(requested_at)
+
+@bot.command(name='search', aliases=['find'])
+async def search(ctx, *, query: str):
+    """Show the top results for a search and queue the one picked."""
+    music_player = players.get(ctx.guild.id)
+    
+    if not ctx.author.voice:
+        await ctx.send("❌ You need to be in a voice channel to play music!")
+        return
+    
+    loading_msg = await ctx.send("🔍 Searching...")
+    results = await music_player.search(query)
+    if not results:
+        await loading_msg.edit(content="❌ No results found!")
+        return
+    
+    embed = discord.Embed(
+        title=f"🔎 Results for: {truncate_text(query, 200)}",
+        description="\n".join(f"**{i}.** {truncate_text(song.title, 80)} ({format_duration(song.duration or 0)})"
+                              for i, song in enumerate(results, 1)),
+        color=discord.Color.blue()
+    )
+    embed.set_footer(text=f"Reply with a number from 1 to {len(results)} within {SEARCH_PICK_TIMEOUT}s, or 'cancel'")
+    await loading_msg.edit(content="", embed=embed)
+    
+    choices = {str(i) for i in range(1, len(results) + 1)}
+    def is_pick(message):
+        return (message.author == ctx.author and message.channel == ctx.channel
+                and message.content.strip().lower() in choices | {'cancel'})
+    
+    try:
+        reply = await bot.wait_for('message', check=is_pick, timeout=SEARCH_PICK_TIMEOUT)
+    except asyncio.TimeoutError:
+        await loading_msg.edit(content="⌛ Search timed out, nothing was queued.", embed=None)
+        return
+    if reply.content.strip().lower() == 'cancel':
+        await loading_msg.edit(content="Search cancelled.", embed=None)
+        return
+    
+    # The result is queued as it is; its stream is resolved when it nears the head of the queue
+    song = results[int(reply.content.strip()) - 1]
+    song.requester = ctx.author
+    
+    if not music_player.voice_client or not music_player.voice_client.is_connected():
+        await join_voice_channel(ctx)
+        await asyncio.sleep(1)
+    
+    await music_player.add_to_queue(song)
+    await ctx.send(f"✅ Added **{song.title}** to the queue (position {len(music_player.queue)})")
+    
     if not music_player.is_playing and music_player.voice_client and not music_player.voice_client.is_playing():
         await music_player.play_next()
 
+@bot.command(name='playlist', aliases=['pl'])
+async def play_playlist(ctx, *, url: str):
+    """Queue every song of a playlist."""
+    music_player = players.get(ctx.guild.id)
+    
+    if not ctx.author.voice:
+        await ctx.send("❌ You need to be in a voice channel to play music!")
+        return
+    
+    if not music_player.voice_client or not music_player.voice_client.is_connected():
+        await join_voice_channel(ctx)
+        await asyncio.sleep(1)
+    
+    loading_msg = await ctx.send("📜 Loading playlist...")
+    started = False
+    last_update = 0.0
+    
+    async def report_progress(queued: int, total: int) -> None:
+        nonlocal started, last_update
+        # Start playing as soon as the first batch is queued
+        if not started and not music_player.is_playing and music_player.voice_client and not music_player.voice_client.is_playing():
+            started = True
+            bot.loop.create_task(music_player.play_next())
+        # Stay well below Discord's message edit rate limit
+        now = time.monotonic()
+        if queued < total and now - last_update < 1.0:
+            return
+        last_update = now
+        await loading_msg.edit(content=f"📜 Queued {queued}/{total} songs...")
+    
+    count = await music_player.import_playlist(url, ctx.author, report_progress)
+    
+    if not count:
+        await loading_msg.edit(content="❌ Could not load the playlist! Make sure it is public and the URL is correct.")
+        return
+    
+    embed = discord.Embed(
+        title="📜 Playlist Added to Queue",
+        description=f"Queued **{count}** songs",
+        color=discord.Color.green()
+    )
+    embed.add_field(name="Requested by", value=ctx.author.mention, inline=True)
+    embed.add_field(name="Songs in queue", value=len(music_player.queue), inline=True)
+    
+    await loading_msg.edit(content="", embed=embed)
+
 @bot.command(name='pause')
 async def pause_music(ctx):
     """Pause the current song."""
+    music_player = players.get(ctx.guild.id)
+    
     if await music_player.pause():
         await ctx.send("⏸️ Music paused!")
     else:
@@ -166,6 +323,8 @@ async def pause_music(ctx):
 @bot.command(name='resume', aliases=['unpause'])
 async def resume_music(ctx):
     """Resume the paused song."""
+    music_player = players.get(ctx.guild.id)
+    
     if await music_player.resume():
         await ctx.send("▶️ Music resumed!")
     else:
@@ -174,6 +333,8 @@ async def resume_music(ctx):
 @bot.command(name='stop')
 async def stop_music(ctx):
     """Stop the music and clear the queue."""
+    music_player = players.get(ctx.guild.id)
+    
     if await music_player.stop():
         await ctx.send("⏹️ Music stopped and queue cleared!")
     else:
@@ -182,14 +343,60 @@ async def stop_music(ctx):
 @bot.command(name='skip', aliases=['next'])
 async def skip_song(ctx):
     """Skip the current song."""
+    music_player = players.get(ctx.guild.id)
+    
     if await music_player.skip():
         await ctx.send("⏭️ Song skipped!")
     else:
         await ctx.send("❌ Nothing is currently playing!")
 
+@bot.command(name='remove', aliases=['rm'])
+async def remove_song(ctx, position: int):
+    """Remove a song from the queue by its position."""
+    music_player = players.get(ctx.guild.id)
+    
+    song = music_player.remove_from_queue(position - 1)
+    if song:
+        await ctx.send(f"🗑️ Removed {song} from the queue!")
+    else:
+        await ctx.send(f"❌ Position must be between 1 and {len(music_player.queue)}!")
+
+@bot.command(name='move', aliases=['mv'])
+async def move_song(ctx, source: int, destination: int):
+    """Move a song to another position in the queue."""
+    music_player = players.get(ctx.guild.id)
+    
+    song = music_player.move_in_queue(source - 1, destination - 1)
+    if song:
+        await ctx.send(f"↕️ Moved {song} to position {destination}!")
+    else:
+        await ctx.send(f"❌ Positions must be between 1 and {len(music_player.queue)}!")
+
+@bot.command(name='shuffle')
+async def shuffle_queue(ctx):
+    """Shuffle the queue."""
+    music_player = players.get(ctx.guild.id)
+    
+    if music_player.shuffle_queue():
+        await ctx.send("🔀 Queue shuffled!")
+    else:
+        await ctx.send("❌ Not enough songs in the queue to shuffle!")
+
+@bot.command(name='skipto', aliases=['jump'])
+async def skip_to_song(ctx, position: int):
+    """Skip to a position in the queue."""
+    music_player = players.get(ctx.guild.id)
+    
+    if await music_player.skip_to(position - 1):
+        await ctx.send(f"⏭️ Skipped to position {position}!")
+    else:
+        await ctx.send(f"❌ Position must be between 1 and {len(music_player.queue)}!")
+
 @bot.command(name='queue', aliases=['q'])
 async def show_queue(ctx):
     """Show the current queue."""
+    music_player = players.get(ctx.guild.id)
+    
     queue_info = music_player.get_queue_info()
     
     embed = discord.Embed(
@@ -222,8 +429,11 @@ async def show_queue(ctx):
         if len(queue_info['queue']) > 10:
             queue_text += f"... and {len(queue_info['queue']) - 10} more songs"
         
+        remaining = format_duration(queue_info['total_duration'])
+        if queue_info['unknown_durations']:
+            remaining += "+"
         embed.add_field(
-            name=f"Up Next ({queue_info['queue_length']} songs)",
+            name=f"Up Next ({queue_info['queue_length']} songs, {remaining})",
             value=queue_text,
             inline=False
         )
@@ -246,6 +456,8 @@ async def show_queue(ctx):
 @bot.command(name='volume', aliases=['vol'])
 async def set_volume(ctx, volume: int):
     """Set the volume (0-100)."""
+    music_player = players.get(ctx.guild.id)
+    
     if not 0 <= volume <= 100:
         await ctx.send("❌ Volume must be between 0 and 100!")
         return
@@ -257,9 +469,136 @@ async def set_volume(ctx, volume: int):
     else:
         await ctx.send("❌ Could not set volume!")
 
+@bot.command(name='seek')
+async def seek_song(ctx, *, timestamp: str):
+    """Jump to a time in the current song (seconds, MM:SS or HH:MM:SS; +/- for relative)."""
+    music_player = players.get(ctx.guild.id)
+    
+    song = music_player.current_song
+    if not song:
+        await ctx.send("❌ Nothing is currently playing!")
+        return
+    
+    timestamp = timestamp.strip()
+    relative = timestamp[:1] in ('+', '-')
+    seconds = parse_timestamp(timestamp[1:] if relative else timestamp)
+    if seconds is None:
+        await ctx.send("❌ Use a time like `90`, `1:30` or `+15`!")
+        return
+    if relative:
+        sign = 1 if timestamp[0] == '+' else -1
+        seconds = max(0.0, music_player.position() + sign * seconds)
+        if song.duration:
+            # Skipping forward past the end lands on the last second
+            seconds = min(seconds, max(0.0, song.duration - 1))
+    
+    if await music_player.seek(seconds):
+        await ctx.send(f"⏩ Jumped to {format_duration(int(seconds))}!")
+    else:
+        await ctx.send(f"❌ Could not seek there! The song is {format_duration(song.duration or 0)} long.")
+
+@bot.command(name='broadcast')
+async def start_broadcast(ctx, name: str, *, query: str):
+    """Broadcast a song that other servers can tune in to with listen."""
+    music_player = players.get(ctx.guild.id)
+    
+    if not ctx.author.voice:
+        await ctx.send("❌ You need to be in a voice channel to broadcast!")
+        return
+    
+    if players.broadcasts.get(name):
+        await ctx.send(f"❌ A broadcast called **{name}** is already on air!")
+        return
+    
+    if not music_player.voice_client or not music_player.voice_client.is_connected():
+        await join_voice_channel(ctx)
+        await asyncio.sleep(1)
+    
+    loading_msg = await ctx.send("🔍 Searching for song...")
+    song = await music_player.extract_song_info(query)
+    if not song:
+        await loading_msg.edit(content="❌ Could not find or load the requested song!")
+        return
+    song.requester = ctx.author
+    
+    broadcast = await music_player.start_broadcast(players.broadcasts, name, song)
+    if broadcast and not await music_player.listen(broadcast):
+        broadcast.stop()
+        broadcast = None
+    if not broadcast:
+        await loading_msg.edit(content="❌ Could not start the broadcast!")
+        return
+    
+    await loading_msg.edit(content=f"📡 Broadcasting **{song.title}** as **{broadcast.name}**! "
+                                   f"Other servers can tune in with `{COMMAND_PREFIX}listen {broadcast.name}`")
+
+@bot.command(name='listen', aliases=['tune'])
+async def listen_broadcast(ctx, name: str):
+    """Tune in to a broadcast instead of this server's queue."""
+    music_player = players.get(ctx.guild.id)
+    
+    if not ctx.author.voice:
+        await ctx.send("❌ You need to be in a voice channel to listen!")
+        return
+    
+    broadcast = players.broadcasts.get(name)
+    if not broadcast:
+        await ctx.send(f"❌ There is no broadcast called **{name}**! Use `{COMMAND_PREFIX}broadcasts` to see what is on air.")
+        return
+    
+    if not music_player.voice_client or not music_player.voice_client.is_connected():
+        await join_voice_channel(ctx)
+        await asyncio.sleep(1)
+    
+    if await music_player.listen(broadcast):
+        await ctx.send(f"📡 Tuned in to **{broadcast.name}**: {broadcast.song}")
+    else:
+        await ctx.send("❌ Could not tune in!")
+
+@bot.command(name='broadcasts', aliases=['stations'])
+async def list_broadcasts(ctx):
+    """List the broadcasts on air."""
+    on_air = list(players.broadcasts.broadcasts.values())
+    if not on_air:
+        await ctx.send(f"📡 Nothing is on air. Start a broadcast with `{COMMAND_PREFIX}broadcast <name> <song>`")
+        return
+    
+    embed = discord.Embed(title="📡 Broadcasts", color=discord.Color.blue())
+    for broadcast in on_air[:25]:
+        embed.add_field(name=broadcast.name,
+                        value=f"{broadcast.song} · {len(broadcast.subscribers)} listening",
+                        inline=False)
+    await ctx.send(embed=embed)
+
+@bot.command(name='trace')
+async def show_trace(ctx, which: str = 'last'):
+    """Show where the time of this server's last command went."""
+    if which != 'last':
+        await ctx.send(f"❌ Usage: `{COMMAND_PREFIX}trace last`")
+        return
+    
+    spans = tracing.last_trace(ctx.guild.id)
+    if not spans:
+        await ctx.send("❌ No command has been traced in this server yet!")
+        return
+    
+    root = spans[0]
+    summary = f"**{root.name}**"
+    if root.attributes.get('args'):
+        summary += f" {root.attributes['args']}"
+    first_frame = next((span for span in spans if span.name == 'voice.first_frame' and span.end is not None), None)
+    if first_frame is not None:
+        summary += f": first audio frame after {(first_frame.end - root.start) * 1000:.0f}ms"
+    elif root.end is not None:
+        summary += f": took {(root.end - root.start) * 1000:.0f}ms"
+    breakdown = truncate_text('\n'.join(tracing.format_breakdown(spans)), 1800)
+    await ctx.send(f"{summary}\n```\n{breakdown}\n```")
+
 @bot.command(name='nowplaying', aliases=['np'])
 async def now_playing(ctx):
     """Show information about the currently playing song."""
+    music_player = players.get(ctx.guild.id)
+    
     if not music_player.current_song:
         await ctx.send("❌ Nothing is currently playing!")
         return
@@ -272,8 +611,9 @@ async def now_playing(ctx):
         color=discord.Color.green()
     )
     
-    embed.add_field(name="Duration", value=format_duration(song.duration or 0), inline=True)
-    embed.add_field(name="Requested by", value=song.requester.mention if song.requester else "Unknown", inline=True)
+    position = format_duration(int(music_player.position()))
+    embed.add_field(name="Position", value=f"{position} / {format_duration(song.duration or 0)}", inline=True)
+    embed.add_field(name="Requested by", value=song.requester_mention, inline=True)
     embed.add_field(name="Volume", value=f"{int(music_player.volume * 100)}%", inline=True)
     
     status = "⏸️ Paused" if music_player.is_paused else "▶️ Playing"
@@ -287,7 +627,9 @@ async def now_playing(ctx):
 @bot.command(name='clear')
 async def clear_queue(ctx):
     """Clear the queue."""
-    music_player.queue.clear()
+    music_player = players.get(ctx.guild.id)
+    
+    music_player.clear_queue()
     await ctx.send("🗑️ Queue cleared!")
 
 @bot.command(name='musichelp', aliases=['commands'])
@@ -300,14 +642,25 @@ async def show_help(ctx):
     )
     
     commands_list = [
-        (f"`{COMMAND_PREFIX}play <song/url>`", "Play a song from YouTube"),
+        (f"`{COMMAND_PREFIX}play <song/url>`", "Play a song from the music library or YouTube"),
+        (f"`{COMMAND_PREFIX}search <query>`", "Show the top results and pick one to queue"),
+        (f"`{COMMAND_PREFIX}playlist <url>`", "Queue every song of a playlist"),
         (f"`{COMMAND_PREFIX}pause`", "Pause the current song"),
         (f"`{COMMAND_PREFIX}resume`", "Resume the paused song"),
         (f"`{COMMAND_PREFIX}stop`", "Stop music and clear queue"),
         (f"`{COMMAND_PREFIX}skip`", "Skip the current song"),
         (f"`{COMMAND_PREFIX}queue`", "Show the current queue"),
+        (f"`{COMMAND_PREFIX}remove <position>`", "Remove a song from the queue"),
+        (f"`{COMMAND_PREFIX}move <from> <to>`", "Move a song in the queue"),
+        (f"`{COMMAND_PREFIX}shuffle`", "Shuffle the queue"),
+        (f"`{COMMAND_PREFIX}skipto <position>`", "Skip to a song in the queue"),
         (f"`{COMMAND_PREFIX}volume <0-100>`", "Set the volume"),
+        (f"`{COMMAND_PREFIX}seek <time>`", "Jump to a time in the current song (e.g. 1:30 or +15)"),
         (f"`{COMMAND_PREFIX}nowplaying`", "Show current song info"),
+        (f"`{COMMAND_PREFIX}broadcast <name> <song>`", "Broadcast a song other servers can tune in to"),
+        (f"`{COMMAND_PREFIX}listen <name>`", "Tune in to a broadcast"),
+        (f"`{COMMAND_PREFIX}broadcasts`", "List the broadcasts on air"),
+        (f"`{COMMAND_PREFIX}trace last`", "Show where the time of the last command went"),
         (f"`{COMMAND_PREFIX}clear`", "Clear the queue"),
         (f"`{COMMAND_PREFIX}join`", "Join your voice channel"),
         (f"`{COMMAND_PREFIX}leave`", "Leave the voice channel"),
@@ -327,6 +680,10 @@ async def on_voice_state_update(member, before, after):
     if member == bot.user:
         return
     
+    music_player = players.peek(member.guild.id)
+    if not music_player:
+        return
+    
     if music_player.voice_client and music_player.voice_client.channel:
         channel = music_player.voice_client.channel
         members = [m for m in channel.members if not m.bot]
@@ -337,9 +694,16 @@ async def on_voice_state_update(member, before, after):
             if music_player.voice_client and music_player.voice_client.channel:
                 members = [m for m in music_player.voice_client.channel.members if not m.bot]
                 if len(members) == 0:
-                    await music_player.stop()
-                    await safe_disconnect(music_player.voice_client)
-                    music_player.voice_client = None
+                    await players.remove(member.guild.id)
+
+async def run_bot(token: str) -> None:
+    """Run the bot until it is stopped, then close every player and write out the journal."""
+    async with bot:
+        try:
+            await bot.start(token)
+        finally:
+            # Still on the bot's loop, so the players' tasks and voice clients can be shut down
+            await players.close()
 
 # Run the bot
 if __name__ == "__main__":
@@ -348,4 +712,9 @@ if __name__ == "__main__":
         print("You can get a bot token from: https://discord.com/developers/applications")
     else:
         print("🤖 Starting Discord Music Bot...")
-        bot.run(DISCORD_TOKEN)
+        # What bot.run() would set up, with the players closed before the loop is
+        discord.utils.setup_logging()
+        try:
+            asyncio.run(run_bot(DISCORD_TOKEN))
+        except KeyboardInterrupt:
+            pass
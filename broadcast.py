@@ -0,0 +1,239 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+import discord
+from discord.opus import Encoder as OpusEncoder
+from discord.player import OPUS_SILENCE
+import metrics
+
+FRAME_SECONDS = OpusEncoder.FRAME_LENGTH / 1000
+
+class Broadcast:
+    """
+    One song decoded and encoded once, fanned out to many voice clients.
+
+    A producer thread reads the song's source in real time, encodes it to
+    Opus once if it is PCM, and appends each packet to a ring of recent
+    frames. Every subscriber is an Opus source with its own cursor into that
+    ring, so all of them send the very same ``bytes`` objects and none of
+    them costs a decoder or an encoder.
+
+    Subscribers start ``delay`` seconds behind the live edge so that the
+    clocks of their voice threads and the producer's can drift a little
+    without running dry. A subscriber that runs dry anyway plays silence; one
+    that falls more than ``max_lag`` seconds behind (a stalled voice thread)
+    skips ahead to the live edge, dropping the frames it missed.
+
+    Args:
+        name (str): Name subscribers tune in by
+        song (Any): The song, for display
+        source (discord.AudioSource): Started source of the song, PCM or Opus
+        delay (float): Seconds subscribers trail the live edge by
+        max_lag (float): Seconds a subscriber may fall behind before it skips ahead
+        on_end (Optional[Callable[['Broadcast'], None]]): Called once the broadcast is over
+    """
+
+    def __init__(self, name: str, song: Any, source: discord.AudioSource, delay: float = 0.1,
+                 max_lag: float = 1.0, on_end: Optional[Callable[['Broadcast'], None]] = None):
+        self.name = name
+        self.song = song
+        self.source = source
+        self.delay_frames = max(1, int(delay / FRAME_SECONDS))
+        self.lag_frames = max(self.delay_frames + 1, int(max_lag / FRAME_SECONDS))
+        self.on_end = on_end
+        # Recent packets by frame number modulo the capacity
+        self.capacity = self.lag_frames + self.delay_frames
+        self._ring: List[bytes] = [b''] * self.capacity
+        # Frames produced so far
+        self.head = 0
+        self.subscribers: List['BroadcastSubscriber'] = []
+        self._encoder = None if source.is_opus() else OpusEncoder()
+        self._cond = threading.Condition()
+        self._ended = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._produce, name=f'broadcast-{name}', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    @property
+    def position(self) -> float:
+        """Seconds of the song produced so far."""
+        return self.head * FRAME_SECONDS
+
+    @property
+    def ended(self) -> bool:
+        return self._ended or self._closed
+
+    def _produce(self) -> None:
+        next_frame = time.perf_counter()
+        try:
+            while not self._closed:
+                data = self.source.read()
+                if not data:
+                    break
+                if self._encoder is not None:
+                    data = self._encoder.encode(data, OpusEncoder.SAMPLES_PER_FRAME)
+                with self._cond:
+                    self._ring[self.head % self.capacity] = data
+                    self.head += 1
+                    self._cond.notify_all()
+                next_frame += FRAME_SECONDS
+                now = time.perf_counter()
+                if next_frame < now - self.lag_frames * FRAME_SECONDS:
+                    # Far behind (ffmpeg was slow to start); do not burst to catch up
+                    next_frame = now
+                time.sleep(max(0.0, next_frame - now))
+        except Exception as e:
+            if not self._closed:
+                print(f"Error producing broadcast {self.name}: {e}")
+        with self._cond:
+            self._ended = True
+            self._cond.notify_all()
+        self._finish()
+
+    def subscribe(self) -> 'BroadcastSubscriber':
+        """
+        Get a new Opus source that follows the broadcast.
+
+        Returns:
+            BroadcastSubscriber: Source to play on a voice client
+        """
+        subscriber = BroadcastSubscriber(self)
+        with self._cond:
+            self.subscribers.append(subscriber)
+        metrics.increment('broadcast_subscriptions')
+        return subscriber
+
+    def unsubscribe(self, subscriber: 'BroadcastSubscriber') -> None:
+        """Remove a subscriber; the broadcast stops once the last one has left."""
+        with self._cond:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+            last = not self.subscribers
+        if last:
+            self.stop()
+
+    def _read(self, subscriber: 'BroadcastSubscriber') -> bytes:
+        with self._cond:
+            if subscriber.cursor is None:
+                subscriber.cursor = max(0, self.head - self.delay_frames)
+            behind = self.head - subscriber.cursor
+            if behind > self.lag_frames:
+                skipped = behind - self.delay_frames
+                subscriber.cursor += skipped
+                subscriber.dropped += skipped
+                metrics.increment('broadcast_frames_dropped', skipped)
+            if subscriber.cursor >= self.head:
+                # The producer's clock is a little behind this voice thread's
+                self._cond.wait_for(lambda: self.head > subscriber.cursor or self.ended, FRAME_SECONDS)
+                if subscriber.cursor >= self.head:
+                    if self.ended:
+                        return b''
+                    subscriber.underruns += 1
+                    metrics.increment('broadcast_underruns')
+                    return OPUS_SILENCE
+            data = self._ring[subscriber.cursor % self.capacity]
+            subscriber.cursor += 1
+            return data
+
+    def stop(self) -> None:
+        """Stop producing; subscribers play out what they have and end."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if not self._thread.is_alive():
+            self._finish()
+
+    def _finish(self) -> None:
+        """Release the source once the producer is done. Runs once."""
+        with self._cond:
+            source, self.source = self.source, None
+        if source is None:
+            return
+        source.cleanup()
+        if self.on_end is not None:
+            self.on_end(self)
+
+class BroadcastSubscriber(discord.AudioSource):
+    """
+    A voice client's view of a broadcast: Opus packets shared with every other subscriber.
+
+    Attributes:
+        cursor (Optional[int]): Next frame to play, None until the first read
+        dropped (int): Frames skipped after falling too far behind
+        underruns (int): Silent frames played because the next frame was not produced yet
+    """
+
+    def __init__(self, broadcast: Broadcast):
+        self.broadcast = broadcast
+        self.cursor: Optional[int] = None
+        self.dropped = 0
+        self.underruns = 0
+
+    def read(self) -> bytes:
+        return self.broadcast._read(self)
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self) -> None:
+        self.broadcast.unsubscribe(self)
+
+class BroadcastHub:
+    """Broadcasts by name, shared by every guild."""
+
+    def __init__(self):
+        self.broadcasts: Dict[str, Broadcast] = {}
+        # Broadcasts remove themselves from the producer thread while the loop reads them
+        self._lock = threading.Lock()
+
+    def start(self, name: str, song: Any, source: discord.AudioSource,
+              on_end: Optional[Callable[[Broadcast], None]] = None) -> Optional[Broadcast]:
+        """
+        Start broadcasting a song under a name.
+
+        Args:
+            name (str): Name to tune in by
+            song (Any): The song
+            source (discord.AudioSource): Started source of the song
+            on_end (Optional[Callable[[Broadcast], None]]): Called once the broadcast is over
+
+        Returns:
+            Optional[Broadcast]: The broadcast, None if the name is taken (the source is left alone)
+        """
+        name = name.lower()
+
+        def ended(broadcast: Broadcast) -> None:
+            with self._lock:
+                if self.broadcasts.get(name) is broadcast:
+                    del self.broadcasts[name]
+            if on_end is not None:
+                on_end(broadcast)
+
+        broadcast = Broadcast(name, song, source, on_end=ended)
+        with self._lock:
+            if name in self.broadcasts:
+                return None
+            self.broadcasts[name] = broadcast
+        broadcast.start()
+        metrics.increment('broadcasts_started')
+        return broadcast
+
+    def get(self, name: str) -> Optional[Broadcast]:
+        broadcast = self.broadcasts.get(name.lower())
+        return broadcast if broadcast is not None and not broadcast.ended else None
+
+    def stop_all(self) -> None:
+        with self._lock:
+            broadcasts = list(self.broadcasts.values())
+        for broadcast in broadcasts:
+            broadcast.stop()
+
+    def stats(self) -> Dict[str, int]:
+        """Get the number of subscribers of each broadcast."""
+        with self._lock:
+            broadcasts = list(self.broadcasts.items())
+        return {name: len(broadcast.subscribers) for name, broadcast in broadcasts}
@@ -30,11 +30,166 @@ YTDL_OPTIONS = {
     'source_address': '0.0.0.0'
 }
 
+# yt-dlp options for flat (metadata only) playlist extraction
+YTDL_FLAT_OPTIONS = {
+    **YTDL_OPTIONS,
+    'noplaylist': False,
+    'extract_flat': 'in_playlist',
+    'ignoreerrors': True,
+}
+
 # FFmpeg options for audio streaming
 FFMPEG_OPTIONS = {
     'before_options': '-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
-    'options': '-vn -filter:a "volume=0.25"'
+    'options': '-vn'
 }
 
-# Default volume (0.0 to 1.0)
-DEFAULT_VOLUME = 0.5
+# Audio pipeline
+# 'pcm' decodes to PCM and scales the volume in Python; 'opus' sends Opus straight
+# from ffmpeg, copying Opus streams through untouched while the volume is 100%
+PLAYBACK_MODE = os.getenv("PLAYBACK_MODE", "pcm")
+# Gain applied in 'pcm' mode along with the player's volume (YouTube audio is mastered loud)
+BASE_GAIN = float(os.getenv("BASE_GAIN", "0.25"))
+
+# PCM processing (NumPy, optional; without it only the volume is applied)
+# Peak limiter ceiling in dBFS for PCM playback (0 disables the limiter)
+DSP_LIMITER_CEILING_DB = float(os.getenv("DSP_LIMITER_CEILING_DB", "-1.0"))
+# Seconds the limiter takes to recover from a peak
+DSP_LIMITER_RELEASE = float(os.getenv("DSP_LIMITER_RELEASE", "0.2"))
+# Bass (100 Hz) and treble (8 kHz) shelf gains in dB for PCM playback (needs SciPy; 0 disables)
+DSP_BASS_DB = float(os.getenv("DSP_BASS_DB", "0"))
+DSP_TREBLE_DB = float(os.getenv("DSP_TREBLE_DB", "0"))
+
+# Loudness normalization, measured once per cached song with ffmpeg's ebur128 filter
+# Integrated loudness (LUFS) songs are normalized to before the volume is applied (empty disables)
+LOUDNESS_TARGET = float(os.getenv("LOUDNESS_TARGET", "-14")) if os.getenv("LOUDNESS_TARGET", "-14") else None
+# Loudness analyses run at once
+LOUDNESS_CONCURRENCY = int(os.getenv("LOUDNESS_CONCURRENCY", "2"))
+# Seconds before a loudness analysis is abandoned
+LOUDNESS_TIMEOUT = float(os.getenv("LOUDNESS_TIMEOUT", "120"))
+# In 'opus' mode, corrections smaller than this many dB are skipped so the stream can pass through
+LOUDNESS_PASSTHROUGH_DB = float(os.getenv("LOUDNESS_PASSTHROUGH_DB", "1.0"))
+
+# Read-ahead buffer of streamed songs
+# Seconds of audio read ahead of playback to ride out network stalls (0 disables the buffer)
+READAHEAD_SECONDS = float(os.getenv("READAHEAD_SECONDS", "3"))
+# Seconds buffered again before playback resumes after the buffer ran dry
+READAHEAD_RESUME_SECONDS = float(os.getenv("READAHEAD_RESUME_SECONDS", "0.2"))
+
+# Gapless playback
+# Seconds before a song ends at which the next song's ffmpeg is started (0 disables gapless playback)
+GAPLESS_PRELOAD_SECONDS = float(os.getenv("GAPLESS_PRELOAD_SECONDS", "5"))
+# Frames (20 ms each) of the next song read ahead before the switch
+GAPLESS_PREBUFFER_FRAMES = int(os.getenv("GAPLESS_PREBUFFER_FRAMES", "25"))
+# Seconds consecutive songs are crossfaded over (PCM playback with NumPy only; 0 switches directly)
+CROSSFADE_SECONDS = float(os.getenv("CROSSFADE_SECONDS", "0"))
+
+# Recovery of songs whose stream dies before they end
+# Times a song is resumed after ffmpeg exited early (0 drops the song, as before)
+STREAM_RECOVERY_RETRIES = int(os.getenv("STREAM_RECOVERY_RETRIES", "3"))
+# Seconds before the second resume attempt, doubled for each further one
+STREAM_RECOVERY_BACKOFF = float(os.getenv("STREAM_RECOVERY_BACKOFF", "1.0"))
+# Seconds a streamed song may play silence with an empty read-ahead buffer before its stream
+# is treated as dead and resumed (0 waits for ffmpeg's own reconnect attempts to give up)
+STREAM_STALL_TIMEOUT = float(os.getenv("STREAM_STALL_TIMEOUT", "2.0"))
+# Seconds short of the song's duration an end still counts as normal
+STREAM_END_TOLERANCE = float(os.getenv("STREAM_END_TOLERANCE", "2.0"))
+
+# Default volume (0.0 to 1.0); in 'opus' mode 1.0 is the source level and needs no re-encoding
+DEFAULT_VOLUME = float(os.getenv("DEFAULT_VOLUME", "1.0" if PLAYBACK_MODE == "opus" else "0.5"))
+
+# Per-guild player registry
+# Seconds a player may sit idle (not playing) before it is disconnected and evicted
+PLAYER_IDLE_TIMEOUT = int(os.getenv("PLAYER_IDLE_TIMEOUT", "300"))
+# How often the idle player reaper runs, in seconds
+PLAYER_REAP_INTERVAL = int(os.getenv("PLAYER_REAP_INTERVAL", "60"))
+# Soft cap on live players; least recently used idle players are evicted first
+MAX_PLAYERS = int(os.getenv("MAX_PLAYERS", "10000"))
+
+# Song metadata cache in front of yt-dlp
+# Maximum cached songs (and search query aliases)
+SONG_CACHE_SIZE = int(os.getenv("SONG_CACHE_SIZE", "5000"))
+# Seconds song metadata stays cached
+SONG_CACHE_TTL = int(os.getenv("SONG_CACHE_TTL", "21600"))
+# Seconds a search query keeps resolving to the same song
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "3600"))
+# Results shown by !search
+SEARCH_RESULTS = int(os.getenv("SEARCH_RESULTS", "5"))
+# Maximum cached !search result lists
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1000"))
+# Seconds a !search query keeps its result list
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "900"))
+# Seconds !search waits for the requester to pick a result
+SEARCH_PICK_TIMEOUT = int(os.getenv("SEARCH_PICK_TIMEOUT", "30"))
+# Seconds a resolved stream URL is reused when it does not carry its own expiry
+STREAM_URL_TTL = int(os.getenv("STREAM_URL_TTL", "1800"))
+# Seconds of validity a stream URL must have left (beyond the song's duration) to be reused
+STREAM_URL_EXPIRY_MARGIN = int(os.getenv("STREAM_URL_EXPIRY_MARGIN", "300"))
+
+# Number of upcoming queued songs whose stream URLs are resolved ahead of time
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", "2"))
+
+# yt-dlp extraction workers
+# 'process' runs extraction in worker processes, 'thread' in a thread pool
+EXTRACTOR_BACKEND = os.getenv("EXTRACTOR_BACKEND", "process")
+# Maximum concurrent extractions
+EXTRACTOR_WORKERS = int(os.getenv("EXTRACTOR_WORKERS", "4"))
+# Seconds before an extraction job is abandoned; its worker pool is replaced so a hung job frees its worker
+EXTRACTOR_TIMEOUT = int(os.getenv("EXTRACTOR_TIMEOUT", "30"))
+# Worker processes are replaced after this many jobs (0 disables recycling)
+EXTRACTOR_MAX_JOBS_PER_WORKER = int(os.getenv("EXTRACTOR_MAX_JOBS_PER_WORKER", "200"))
+
+# Playlist import
+# Maximum number of entries imported from one playlist
+PLAYLIST_MAX_ENTRIES = int(os.getenv("PLAYLIST_MAX_ENTRIES", "5000"))
+# Entries added to the queue between progress updates
+PLAYLIST_BATCH_SIZE = int(os.getenv("PLAYLIST_BATCH_SIZE", "100"))
+
+# Crash-safe queue journal
+# Append-only file the queues are journaled to and restored from on start-up (empty disables it)
+QUEUE_JOURNAL_PATH = os.getenv("QUEUE_JOURNAL_PATH", "data/queue_journal.jsonl")
+# Maximum seconds of journaled queue changes that can be lost in a crash
+JOURNAL_FSYNC_INTERVAL = float(os.getenv("JOURNAL_FSYNC_INTERVAL", "1.0"))
+# Seconds between playback position ticks written while anything is playing
+JOURNAL_TICK_INTERVAL = float(os.getenv("JOURNAL_TICK_INTERVAL", "5.0"))
+# The journal is compacted into one snapshot per guild once it grows past this many bytes
+JOURNAL_COMPACT_BYTES = int(os.getenv("JOURNAL_COMPACT_BYTES", str(64 * 1024 * 1024)))
+# Voice channels reconnected at once while restoring queues after a restart
+RESTORE_CONCURRENCY = int(os.getenv("RESTORE_CONCURRENCY", "5"))
+
+# On-disk audio cache
+# Directory played songs are cached in as Ogg/Opus files (empty disables the cache)
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "data/audio_cache")
+# Maximum total size of cached audio; least recently played songs are evicted first
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# Songs longer than this many seconds (and live streams) are never cached
+AUDIO_CACHE_MAX_DURATION = int(os.getenv("AUDIO_CACHE_MAX_DURATION", "1200"))
+
+# Prometheus metrics endpoint
+# Address the /metrics endpoint listens on; keep it local unless a firewall is in front of it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Port of the /metrics endpoint (0 disables it)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+
+# Command tracing
+# JSONL file finished trace spans are appended to (empty disables it)
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "data/traces.jsonl")
+# The trace file is moved to <path>.1 once it grows past this many bytes
+TRACE_EXPORT_MAX_BYTES = int(os.getenv("TRACE_EXPORT_MAX_BYTES", str(64 * 1024 * 1024)))
+# OTLP/HTTP JSON collector spans are also posted to, e.g. http://127.0.0.1:4318/v1/traces (empty disables it)
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")
+# Seconds finished spans are batched for before being exported
+TRACE_FLUSH_INTERVAL = float(os.getenv("TRACE_FLUSH_INTERVAL", "1.0"))
+# Most recent traces kept in memory for !trace
+TRACE_KEEP = int(os.getenv("TRACE_KEEP", "500"))
+
+# Local music library
+# Directories of local audio files that !play searches before YouTube, separated by
+# os.pathsep (':', ';' on Windows); empty disables the library
+LIBRARY_DIRS = [directory for directory in os.getenv("LIBRARY_DIRS", "").split(os.pathsep) if directory]
+# File the tags and durations of library files are indexed in, so restarts only probe changed files
+LIBRARY_INDEX_PATH = os.getenv("LIBRARY_INDEX_PATH", "data/library_index.json")
+# Seconds between rescans for added, changed and removed files (0 scans only on start-up)
+LIBRARY_SCAN_INTERVAL = int(os.getenv("LIBRARY_SCAN_INTERVAL", "3600"))
+# Files whose tags are read at once during a scan
+LIBRARY_SCAN_WORKERS = int(os.getenv("LIBRARY_SCAN_WORKERS", "4"))
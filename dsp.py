@@ -0,0 +1,229 @@
+import ctypes
+import math
+from typing import List, Optional, Sequence
+import discord
+from discord.opus import Encoder as OpusEncoder
+from config import DSP_LIMITER_CEILING_DB, DSP_LIMITER_RELEASE, DSP_BASS_DB, DSP_TREBLE_DB
+
+# NumPy (and SciPy for the equalizer) are optional; without them PCM volume
+# falls back to discord.py's audioop-based scaling
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    from scipy.signal import sosfilt
+except ImportError:
+    sosfilt = None
+
+if (DSP_BASS_DB or DSP_TREBLE_DB) and (np is None or sosfilt is None):
+    print("NumPy and SciPy are needed for DSP_BASS_DB/DSP_TREBLE_DB, the equalizer is disabled")
+
+SAMPLE_RATE = OpusEncoder.SAMPLING_RATE
+CHANNELS = OpusEncoder.CHANNELS
+FRAME_SECONDS = OpusEncoder.FRAME_LENGTH / 1000
+
+class GainStage:
+    """
+    Scales samples by ``gain * volume``.
+
+    A change is ramped linearly across the next frame instead of applied as
+    a step, so ``!volume`` takes effect immediately without a click.
+    """
+
+    def __init__(self, volume: float = 1.0, gain: float = 1.0):
+        self.volume = volume
+        self.gain = gain
+        self._applied = self.level
+
+    @property
+    def level(self) -> float:
+        return self.gain * self.volume
+
+    def process(self, samples: 'np.ndarray') -> None:
+        target = self.level
+        if target == self._applied:
+            if target != 1.0:
+                samples *= target
+            return
+        ramp = np.linspace(self._applied, target, len(samples), dtype=np.float32)
+        samples *= ramp[:, None]
+        self._applied = target
+
+class Equalizer:
+    """
+    Bass and treble shelving filters (RBJ cookbook biquads), filtered with SciPy.
+
+    Filter state is carried from frame to frame, so frame boundaries are seamless.
+    """
+
+    def __init__(self, bass_db: float = 0.0, treble_db: float = 0.0,
+                 bass_hz: float = 100.0, treble_hz: float = 8000.0):
+        sections = []
+        if bass_db:
+            sections.append(self.shelf(bass_hz, bass_db, high=False))
+        if treble_db:
+            sections.append(self.shelf(treble_hz, treble_db, high=True))
+        self.sos = np.array(sections, dtype=np.float64)
+        self._state = np.zeros((len(sections), 2, CHANNELS))
+
+    @staticmethod
+    def shelf(freq: float, gain_db: float, high: bool) -> List[float]:
+        """Get the normalized second-order section of a shelving filter with a slope of 1."""
+        a = 10 ** (gain_db / 40)
+        w0 = 2 * math.pi * freq / SAMPLE_RATE
+        alpha = math.sin(w0) / math.sqrt(2)
+        cos_w0 = math.cos(w0)
+        root = 2 * math.sqrt(a) * alpha
+        sign = 1 if high else -1
+        b0 = a * ((a + 1) + sign * (a - 1) * cos_w0 + root)
+        b1 = -2 * sign * a * ((a - 1) + sign * (a + 1) * cos_w0)
+        b2 = a * ((a + 1) + sign * (a - 1) * cos_w0 - root)
+        a0 = (a + 1) - sign * (a - 1) * cos_w0 + root
+        a1 = 2 * sign * ((a - 1) - sign * (a + 1) * cos_w0)
+        a2 = (a + 1) - sign * (a - 1) * cos_w0 - root
+        return [b0 / a0, b1 / a0, b2 / a0, 1.0, a1 / a0, a2 / a0]
+
+    def process(self, samples: 'np.ndarray') -> None:
+        filtered, self._state = sosfilt(self.sos, samples, axis=0, zi=self._state)
+        samples[:] = filtered
+
+class Limiter:
+    """
+    Peak limiter that keeps samples under a ceiling.
+
+    Gain reduction starts on the frame whose peak exceeds the ceiling and
+    recovers exponentially with the release time, ramped across each frame.
+    Anything still over the ceiling is clipped by the final conversion.
+    """
+
+    def __init__(self, ceiling_db: float = DSP_LIMITER_CEILING_DB, release: float = DSP_LIMITER_RELEASE):
+        self.ceiling = 32767 * 10 ** (ceiling_db / 20)
+        self.recovery = 1 - math.exp(-FRAME_SECONDS / release) if release > 0 else 1.0
+        self.reduction = 1.0
+
+    def process(self, samples: 'np.ndarray') -> None:
+        peak = max(float(samples.max()), -float(samples.min())) if len(samples) else 0.0
+        previous = self.reduction
+        # Release towards unity, but never above what this frame's peak allows
+        reduction = previous + (1.0 - previous) * self.recovery
+        if peak * reduction > self.ceiling:
+            reduction = self.ceiling / peak
+        self.reduction = reduction
+        if previous == reduction == 1.0:
+            return
+        if previous == reduction:
+            samples *= reduction
+        else:
+            samples *= np.linspace(previous, reduction, len(samples), dtype=np.float32)[:, None]
+
+class DSPAudio(discord.AudioSource):
+    """
+    Runs the PCM frames of another source through a chain of NumPy stages.
+
+    Frames are viewed in place as int16 samples and processed in a float32
+    buffer reused for every frame, and written back into a frame buffer that
+    is also reused: a frame returned is only valid until the next ``read``,
+    which is as long as discord.py's player needs it (it encodes each frame
+    right away). The buffer is a ctypes array, as discord.py's Opus encoder
+    casts frames with ctypes, which takes bytes but not a bytearray or
+    memoryview. ``volume`` behaves like
+    PCMVolumeTransformer's, but changes are ramped instead of stepped.
+
+    Args:
+        original (discord.AudioSource): PCM source to process
+        volume (float): Player volume
+        gain (float): Fixed gain applied along with the volume
+        stages (Optional[Sequence]): Extra stages, each with a
+            ``process(samples)`` method working in place on a float32
+            (samples x channels) array; run after the gain and before the limiter
+        limiter (bool): Keep peaks under ``DSP_LIMITER_CEILING_DB``
+    """
+
+    def __init__(self, original: discord.AudioSource, volume: float = 1.0, gain: float = 1.0,
+                 stages: Optional[Sequence] = None, limiter: bool = True):
+        if original.is_opus():
+            raise discord.ClientException('AudioSource must not be Opus encoded.')
+        self.original = original
+        self.gain_stage = GainStage(max(volume, 0.0), gain)
+        self.stages = [self.gain_stage, *(stages or ())]
+        if limiter:
+            self.stages.append(Limiter())
+        samples = OpusEncoder.SAMPLES_PER_FRAME
+        self._buffer = np.empty((samples, CHANNELS), dtype=np.float32)
+        self._frame = (ctypes.c_ubyte * OpusEncoder.FRAME_SIZE)()
+        self._output = np.frombuffer(self._frame, dtype=np.int16).reshape(samples, CHANNELS)
+
+    @property
+    def volume(self) -> float:
+        return self.gain_stage.volume
+
+    @volume.setter
+    def volume(self, value: float) -> None:
+        self.gain_stage.volume = max(value, 0.0)
+
+    def read(self) -> 'ctypes.Array[ctypes.c_ubyte]':
+        data = self.original.read()
+        if not data:
+            return data
+        pcm = np.frombuffer(data, dtype=np.int16).reshape(-1, CHANNELS)
+        if len(pcm) != len(self._buffer):
+            # A short last frame
+            buffer = pcm.astype(np.float32)
+            for stage in self.stages:
+                stage.process(buffer)
+            return np.clip(buffer, -32768, 32767).astype(np.int16).tobytes()
+        np.copyto(self._buffer, pcm)
+        for stage in self.stages:
+            stage.process(self._buffer)
+        np.clip(self._buffer, -32768, 32767, out=self._output, casting='unsafe')
+        return self._frame
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self) -> None:
+        self.original.cleanup()
+
+class GainVolumeTransformer(discord.PCMVolumeTransformer):
+    """PCMVolumeTransformer with a fixed gain on top of the volume, used when NumPy is missing."""
+
+    def __init__(self, original: discord.AudioSource, volume: float = 1.0, gain: float = 1.0):
+        self.gain = gain
+        super().__init__(original, volume)
+
+    @property
+    def volume(self) -> float:
+        return self._player_volume
+
+    @volume.setter
+    def volume(self, value: float) -> None:
+        self._player_volume = max(value, 0.0)
+        # What the inherited read() scales by
+        self._volume = self._player_volume * self.gain
+
+def create_equalizer() -> Optional[Equalizer]:
+    """Get the equalizer configured by ``DSP_BASS_DB``/``DSP_TREBLE_DB``, if any and if SciPy is installed."""
+    if not (DSP_BASS_DB or DSP_TREBLE_DB) or np is None or sosfilt is None:
+        return None
+    return Equalizer(DSP_BASS_DB, DSP_TREBLE_DB)
+
+def create_pcm_transformer(original: discord.AudioSource, volume: float = 1.0,
+                           gain: float = 1.0) -> discord.AudioSource:
+    """
+    Wrap a PCM source so its volume can be changed while it plays.
+
+    Args:
+        original (discord.AudioSource): PCM source
+        volume (float): Player volume
+        gain (float): Fixed gain applied along with the volume
+
+    Returns:
+        discord.AudioSource: DSPAudio with the configured stages, or an
+            audioop-based transformer if NumPy is not installed
+    """
+    if np is None:
+        return GainVolumeTransformer(original, volume, gain)
+    equalizer = create_equalizer()
+    return DSPAudio(original, volume, gain, stages=[equalizer] if equalizer else None,
+                    limiter=DSP_LIMITER_CEILING_DB < 0)
@@ -0,0 +1,298 @@
+from abc import ABC, abstractmethod
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+import yt_dlp
+from config import (YTDL_OPTIONS, YTDL_FLAT_OPTIONS, EXTRACTOR_BACKEND, EXTRACTOR_WORKERS, EXTRACTOR_TIMEOUT,
+                    EXTRACTOR_MAX_JOBS_PER_WORKER)
+import metrics
+import tracing
+from utils import canonical_query_key
+
+YoutubeDLFactory = Callable[[Dict[str, Any]], Any]
+
+class ExtractionTimeout(Exception):
+    """Raised when a yt-dlp job takes longer than the per-job timeout."""
+
+# Warm YoutubeDL instance owned by the current worker process or thread
+_worker_state = threading.local()
+
+def _init_worker(options: Dict[str, Any], flat_options: Dict[str, Any],
+                 ytdl_factory: YoutubeDLFactory) -> None:
+    """Build the worker's YoutubeDL instances once so jobs skip extractor setup."""
+    _worker_state.ytdl = ytdl_factory(options)
+    _worker_state.flat_ytdl = ytdl_factory(flat_options)
+
+def _extract_in_worker(query: str, flat: bool = False) -> Optional[Dict[str, Any]]:
+    """Run one extraction on the worker's own YoutubeDL."""
+    ytdl = _worker_state.flat_ytdl if flat else _worker_state.ytdl
+    # Part of the requester's trace when the job was submitted with its context (thread workers)
+    with tracing.span('yt-dlp', worker=threading.current_thread().name):
+        data = ytdl.extract_info(query, download=False)
+    # Strip non-picklable values before the result crosses the process boundary
+    sanitize = getattr(ytdl, 'sanitize_info', None)
+    return sanitize(data) if sanitize and data else data
+
+class Extractor(ABC):
+    """
+    Runs yt-dlp extractions on a dedicated pool of warm workers.
+
+    Concurrency is bounded to the number of workers, so a burst of requests
+    queues on the event loop instead of piling up inside the pool, and each
+    job is given at most ``timeout`` seconds. A job that times out gives its
+    worker slot back and the pool is replaced, so a hung yt-dlp call cannot
+    hold on to a worker.
+    """
+
+    backend = 'base'
+
+    def __init__(self, workers: int = EXTRACTOR_WORKERS, timeout: float = EXTRACTOR_TIMEOUT,
+                 options: Optional[Dict[str, Any]] = None,
+                 ytdl_factory: YoutubeDLFactory = yt_dlp.YoutubeDL,
+                 flat_options: Optional[Dict[str, Any]] = None):
+        self.workers = workers
+        self.timeout = timeout
+        self.options = options or YTDL_OPTIONS
+        self.flat_options = flat_options or YTDL_FLAT_OPTIONS
+        self.ytdl_factory = ytdl_factory
+        self.pending = 0
+        # Jobs waiting for a free worker
+        self.backlog = 0
+        self._slots = asyncio.Semaphore(workers)
+        self._pool: Optional[Executor] = None
+        # canonical key -> shared extraction task for identical concurrent requests
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    @abstractmethod
+    def _create_pool(self) -> Executor:
+        """Create the worker pool; called when the first job is submitted."""
+
+    def _recycle_pool(self, pool: Executor) -> None:
+        """
+        Replace a pool one of whose workers is stuck on a timed-out job.
+
+        Jobs already running on the old pool are left to finish there.
+
+        Args:
+            pool (Executor): The pool the job was submitted to
+        """
+        if self._pool is pool:
+            self._pool = None
+        pool.shutdown(wait=False)
+
+    def _submit(self, query: str, flat: bool) -> Future:
+        """Start one extraction job on the pool."""
+        return self.pool.submit(_extract_in_worker, query, flat)
+
+    @property
+    def pool(self) -> Executor:
+        if self._pool is None:
+            self._pool = self._create_pool()
+        return self._pool
+
+    async def extract(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        Extract information for a URL or search query without downloading.
+
+        Concurrent calls for the same video or search share a single job.
+        Cancelling one caller does not cancel the job for the others.
+
+        Args:
+            query (str): URL or search query passed to ``YoutubeDL.extract_info``
+
+        Returns:
+            Optional[Dict[str, Any]]: yt-dlp info dict
+
+        Raises:
+            ExtractionTimeout: The job did not finish within the timeout
+        """
+        return await self._extract_shared(query, flat=False)
+
+    async def extract_flat(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        Extract a playlist or search listing without resolving each entry.
+
+        Entries only carry what the listing page provides (ID, URL, title and
+        usually duration), which is enough to queue them as placeholders.
+
+        Args:
+            query (str): Playlist URL or search query
+
+        Returns:
+            Optional[Dict[str, Any]]: yt-dlp info dict with flat ``entries``
+        """
+        return await self._extract_shared(query, flat=True)
+
+    async def _extract_shared(self, query: str, flat: bool) -> Optional[Dict[str, Any]]:
+        key = canonical_query_key(query)
+        if flat:
+            key = f"flat:{key}"
+        task = self._inflight.get(key)
+        with tracing.span('extractor', flat=flat, coalesced=task is not None):
+            if task is None:
+                # The job's spans belong to the trace of the request that started it
+                task = asyncio.get_running_loop().create_task(self._run_job(query, flat))
+                self._inflight[key] = task
+                task.add_done_callback(functools.partial(self._job_done, key))
+                metrics.increment('extractions')
+            else:
+                metrics.increment('extractions_coalesced')
+            return await asyncio.shield(task)
+
+    def _job_done(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the error as retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def _run_job(self, query: str, flat: bool = False) -> Optional[Dict[str, Any]]:
+        """Run one extraction on the pool, bounded by the worker slots and the timeout."""
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            self.backlog += 1
+            try:
+                with tracing.span('extractor.wait', backlog=self.backlog):
+                    await self._slots.acquire()
+            finally:
+                self.backlog -= 1
+            released = False
+
+            def release(*_: Any) -> None:
+                nonlocal released
+                if not released:
+                    released = True
+                    self._slots.release()
+
+            try:
+                pool = self.pool
+                job = tracing.start_span('extractor.run', backend=self.backend, flat=flat)
+                with tracing.activate(job):
+                    future = self._submit(query, flat)
+            except Exception:
+                release()
+                raise
+            # The slot is freed when the job finishes, or when it times out, whichever comes first
+            loop = asyncio.get_running_loop()
+            # A job that timed out can finish after the bot has shut down
+            future.add_done_callback(lambda _: loop.is_closed() or loop.call_soon_threadsafe(release))
+            if job is not None:
+                future.add_done_callback(lambda done: job.finish(None if done.cancelled() else done.exception()))
+            try:
+                data = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+            except asyncio.TimeoutError:
+                metrics.increment('extraction_timeouts')
+                release()
+                self._recycle_pool(pool)
+                raise ExtractionTimeout(f"Extraction took longer than {self.timeout}s: {query}")
+            # Waiting for a worker included, as the requester experiences it
+            metrics.observe('extraction_flat_seconds' if flat else 'extraction_seconds', time.perf_counter() - started)
+            return data
+        finally:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        """Stop the worker pool without waiting for running jobs."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+class ThreadExtractor(Extractor):
+    """Extractor backed by threads, each with its own YoutubeDL instance."""
+
+    backend = 'thread'
+
+    def _create_pool(self) -> Executor:
+        return ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix='ytdl',
+            initializer=_init_worker,
+            initargs=(self.options, self.flat_options, self.ytdl_factory),
+        )
+
+    def _submit(self, query: str, flat: bool) -> Future:
+        # The worker thread runs the job in the requester's context, so its span joins the trace
+        return self.pool.submit(contextvars.copy_context().run, _extract_in_worker, query, flat)
+
+class ProcessExtractor(Extractor):
+    """
+    Extractor backed by worker processes, keeping yt-dlp's CPU work off the
+    bot's GIL. Workers are replaced after ``max_jobs_per_worker`` jobs to cap
+    memory growth, and extraction falls back to threads if the pool breaks.
+    """
+
+    backend = 'process'
+
+    def __init__(self, *args: Any, max_jobs_per_worker: int = EXTRACTOR_MAX_JOBS_PER_WORKER, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.fallback: Optional[ThreadExtractor] = None
+        # Pools killed because a job timed out; jobs they broke are run again
+        self.recycled = 0
+
+    def _create_pool(self) -> Executor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            # Forking a process that runs discord.py's threads is unsafe
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.options, self.flat_options, self.ytdl_factory),
+            max_tasks_per_child=self.max_jobs_per_worker or None,
+        )
+
+    def _recycle_pool(self, pool: Executor) -> None:
+        """Kill the workers of a pool with a stuck job; the process running it is not known."""
+        # Shutting the pool down drops its list of processes
+        processes = list((getattr(pool, '_processes', None) or {}).values())
+        super()._recycle_pool(pool)
+        self.recycled += 1
+        for process in processes:
+            process.kill()
+
+    async def _run_job(self, query: str, flat: bool = False) -> Optional[Dict[str, Any]]:
+        if self.fallback is None:
+            recycled = self.recycled
+            try:
+                self.pool
+                return await super()._run_job(query, flat)
+            except (BrokenProcessPool, OSError) as e:
+                if isinstance(e, BrokenProcessPool) and self.recycled != recycled:
+                    # Killed along with a worker stuck on another job, not a broken pool
+                    return await self._run_job(query, flat)
+                # OSError can only come from starting the pool; job errors are DownloadErrors
+                print(f"Extraction process pool failed, falling back to threads: {e}")
+                metrics.increment('extraction_pool_fallbacks')
+                self.shutdown()
+                self.fallback = ThreadExtractor(self.workers, self.timeout, self.options,
+                                                self.ytdl_factory, self.flat_options)
+        return await self.fallback._run_job(query, flat)
+
+    def shutdown(self) -> None:
+        super().shutdown()
+        if self.fallback is not None:
+            self.fallback.shutdown()
+
+def create_extractor(backend: str = EXTRACTOR_BACKEND, **kwargs: Any) -> Extractor:
+    """
+    Create the extraction backend named in the configuration.
+
+    Args:
+        backend (str): 'process' or 'thread'
+        **kwargs: Passed to the extractor constructor
+
+    Returns:
+        Extractor: The extraction backend
+    """
+    if backend == 'process':
+        return ProcessExtractor(**kwargs)
+    if backend != 'thread':
+        print(f"Unknown extractor backend '{backend}', using threads")
+    kwargs.pop('max_jobs_per_worker', None)
+    return ThreadExtractor(**kwargs)
@@ -0,0 +1,291 @@
+import threading
+from typing import Any, Callable, List, Optional
+import discord
+from discord.opus import Encoder as OpusEncoder
+from audio_sources import ReadAheadAudio, find_source
+from dsp import np
+
+FRAME_SECONDS = OpusEncoder.FRAME_LENGTH / 1000
+
+def cleanup_later(source: discord.AudioSource) -> None:
+    """Clean up a source off the audio thread; killing ffmpeg (or a cache tee's wait) can take a while."""
+    threading.Thread(target=source.cleanup, name='audio-cleanup', daemon=True).start()
+
+class PrimedAudio(discord.AudioSource):
+    """
+    Wraps a source whose first frames can be read ahead of playback.
+
+    ``prime`` blocks while ffmpeg starts, probes its input and produces the
+    first frames, so it is meant to run in a worker thread before the source
+    is needed.
+    """
+
+    def __init__(self, original: discord.AudioSource):
+        self.original = original
+        self._primed: List[bytes] = []
+
+    def prime(self, frames: int) -> int:
+        """
+        Read up to ``frames`` frames ahead.
+
+        Returns:
+            int: Number of frames buffered
+        """
+        while len(self._primed) < frames:
+            data = self.original.read()
+            if not data:
+                break
+            # Sources may hand out one reused frame buffer (e.g. DSPAudio)
+            self._primed.append(bytes(data))
+        return len(self._primed)
+
+    @property
+    def volume(self) -> Optional[float]:
+        return getattr(self.original, 'volume', None)
+
+    @volume.setter
+    def volume(self, value: float) -> None:
+        if hasattr(self.original, 'volume'):
+            self.original.volume = value
+
+    def read(self) -> bytes:
+        if self._primed:
+            return self._primed.pop(0)
+        return self.original.read()
+
+    def is_opus(self) -> bool:
+        return self.original.is_opus()
+
+    def cleanup(self) -> None:
+        self.original.cleanup()
+
+class GaplessAudio(discord.AudioSource):
+    """
+    Plays one song after another without handing control back between them.
+
+    Frames read are counted, which gives the playback position of the current
+    song to the frame (silence played while a read-ahead buffer refilled is
+    not counted). Once fewer than ``preload`` seconds of the song's duration
+    are left, ``on_near_end`` is called (from the audio thread) so the next
+    song's source can be started and primed. When
+    the current source runs out, the next one continues on the very next
+    frame and ``on_advance`` is called with its song. With ``crossfade``
+    seconds set and both sources PCM, the songs are mixed with a linear fade
+    over the end of the current one.
+
+    If no next source has been handed over in time, ``read`` returns b'' and
+    playback ends the usual way, through the voice client's ``after``;
+    ``ended`` then tells that apart from playback being stopped.
+
+    Args:
+        source (discord.AudioSource): Source of the first song
+        song (Any): First song, passed back to ``on_advance`` style callbacks
+        duration (Optional[float]): Duration of the first song, None if unknown
+        start (float): Offset in the first song the source starts at
+        preload (float): Seconds before the end at which ``on_near_end`` is
+            called, 0 to never call it
+        crossfade (float): Seconds the songs overlap
+        on_near_end (Optional[Callable[[], None]]): Called once per song, from the audio thread
+        on_advance (Optional[Callable[[Any], None]]): Called with the new song, from the audio thread
+        on_first_frame (Optional[Callable[[], None]]): Called once, when the first frame has
+            been read, from the audio thread
+    """
+
+    def __init__(self, source: discord.AudioSource, song: Any, duration: Optional[float] = None,
+                 start: float = 0.0, preload: float = 5.0, crossfade: float = 0.0,
+                 on_near_end: Optional[Callable[[], None]] = None,
+                 on_advance: Optional[Callable[[Any], None]] = None,
+                 on_first_frame: Optional[Callable[[], None]] = None):
+        self.preload_frames = int(preload / FRAME_SECONDS)
+        self.crossfade_frames = int(crossfade / FRAME_SECONDS) if np is not None else 0
+        self.on_near_end = on_near_end
+        self.on_advance = on_advance
+        self.on_first_frame = on_first_frame
+        self._lock = threading.Lock()
+        self._next: Optional[discord.AudioSource] = None
+        self._next_song: Any = None
+        self._next_duration: Optional[float] = None
+        self._next_frames = 0
+        # Switch to the next source asked for by skip, made by the next read
+        self._switch = False
+        self._closed = False
+        self._set_current(source, song, duration, start)
+
+    def _set_current(self, source: discord.AudioSource, song: Any, duration: Optional[float],
+                     start: float = 0.0, frames: int = 0) -> None:
+        self.current = source
+        self.song = song
+        self.duration = duration
+        # Offset in the song the current source started at, and frames read from it since
+        self.start = start
+        self.frames = frames
+        self._buffer = find_source(source, ReadAheadAudio)
+        self._near_end_sent = False
+        # Whether the current source ran out of audio
+        self.ended = False
+
+    def position(self) -> float:
+        """Seconds into the current song that have been played."""
+        frames = self.frames
+        if self._buffer is not None:
+            frames -= self._buffer.underrun_frames
+        return self.start + max(0, frames) * FRAME_SECONDS
+
+    def remaining_frames(self) -> Optional[int]:
+        """Frames left in the current song according to its duration, None if unknown."""
+        if not self.duration:
+            return None
+        return max(0, round((self.duration - self.position()) / FRAME_SECONDS))
+
+    def set_next(self, source: discord.AudioSource, song: Any, duration: Optional[float]) -> bool:
+        """
+        Hand over the source of the song to play next.
+
+        Args:
+            source (discord.AudioSource): Started (ideally primed) source
+            song (Any): The song, passed to ``on_advance`` when it starts
+            duration (Optional[float]): Seconds of audio the source will produce
+
+        Returns:
+            bool: False if playback has already ended; the source is cleaned up then
+        """
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                old = self._next
+                self._next, self._next_song, self._next_duration = source, song, duration
+                self._next_frames = 0
+        if closed:
+            cleanup_later(source)
+            return False
+        if old is not None:
+            cleanup_later(old)
+        return True
+
+    def clear_next(self) -> None:
+        """Drop the next source, e.g. because the queue changed."""
+        with self._lock:
+            old, self._next, self._next_song = self._next, None, None
+        if old is not None:
+            cleanup_later(old)
+
+    @property
+    def next_song(self) -> Any:
+        return self._next_song
+
+    def replace_current(self, source: discord.AudioSource, start: float) -> None:
+        """
+        Swap the current song's source, e.g. for one restarted at another position.
+
+        Args:
+            source (discord.AudioSource): The new source
+            start (float): Offset in the song the new source starts at
+        """
+        with self._lock:
+            old = self.current
+            self._set_current(source, self.song, self.duration, start)
+        cleanup_later(old)
+
+    def skip(self) -> bool:
+        """
+        Switch to the next song at the next frame.
+
+        The switch is left to the audio thread, so the caller does not wait
+        for a frame that is being read (e.g. from a slow ffmpeg).
+
+        Returns:
+            bool: False if no next song is ready, or a switch is already on its way
+        """
+        if self._next is None or self._switch:
+            return False
+        self._switch = True
+        return True
+
+    @property
+    def switching(self) -> bool:
+        """Whether a skip to the next song has not been made yet."""
+        return self._switch
+
+    def _advance(self) -> None:
+        """Make the next source current. Called with the lock held."""
+        old = self.current
+        self._set_current(self._next, self._next_song, self._next_duration, frames=self._next_frames)
+        self._next = self._next_song = None
+        cleanup_later(old)
+        if self.on_advance is not None:
+            self.on_advance(self.song)
+
+    @property
+    def volume(self) -> Optional[float]:
+        return getattr(self.current, 'volume', None)
+
+    @volume.setter
+    def volume(self, value: float) -> None:
+        with self._lock:
+            for source in (self.current, self._next):
+                if source is not None and hasattr(source, 'volume'):
+                    source.volume = value
+
+    def read(self) -> bytes:
+        with self._lock:
+            if self._switch:
+                self._switch = False
+                if self._next is None:
+                    # The next song was dropped after the skip; end as if stopped
+                    return b''
+                self._advance()
+            remaining = self.remaining_frames()
+            if (remaining is not None and remaining <= self.preload_frames and not self._near_end_sent
+                    and self.on_near_end is not None and self.preload_frames > 0):
+                self._near_end_sent = True
+                self.on_near_end()
+            if (self._next is not None and remaining is not None and remaining < self.crossfade_frames
+                    and not self.current.is_opus() and not self._next.is_opus()):
+                return self._read_crossfade(remaining)
+            data = self.current.read()
+            if not data and self._next is not None:
+                self._advance()
+                data = self.current.read()
+            if data:
+                self.frames += 1
+                if self.on_first_frame is not None:
+                    on_first_frame, self.on_first_frame = self.on_first_frame, None
+                    on_first_frame()
+            else:
+                self.ended = True
+            return data
+
+    def _read_crossfade(self, remaining: int) -> bytes:
+        outgoing = self.current.read()
+        incoming = self._next.read()
+        if incoming:
+            self._next_frames += 1
+        if not outgoing:
+            self._advance()
+            return incoming
+        self.frames += 1
+        if not incoming or len(incoming) != len(outgoing):
+            return outgoing
+        # Linear fade from where the previous frame left off to where this one ends
+        start = 1 - (remaining + 1) / self.crossfade_frames
+        end = 1 - remaining / self.crossfade_frames
+        a = np.frombuffer(outgoing, dtype=np.int16).reshape(-1, OpusEncoder.CHANNELS)
+        b = np.frombuffer(incoming, dtype=np.int16).reshape(-1, OpusEncoder.CHANNELS)
+        fade = np.linspace(max(start, 0.0), end, len(a), dtype=np.float32)[:, None]
+        mixed = a * (1 - fade) + b * fade
+        if remaining == 0:
+            # The current song should be over; the next one takes it from here
+            self._advance()
+        return np.clip(mixed, -32768, 32767).astype(np.int16).tobytes()
+
+    def is_opus(self) -> bool:
+        return self.current.is_opus()
+
+    def cleanup(self) -> None:
+        with self._lock:
+            sources = [self.current, self._next]
+            self._next = self._next_song = None
+            self._closed = True
+        for source in sources:
+            if source is not None:
+                source.cleanup()
@@ -0,0 +1,558 @@
+import bisect
+import heapq
+import itertools
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+from config import LIBRARY_DIRS, LIBRARY_INDEX_PATH, LIBRARY_SCAN_WORKERS
+import metrics
+
+# mutagen reads tags in-process and is optional; without it ffmpeg is asked for them
+try:
+    import mutagen
+except ImportError:
+    mutagen = None
+
+AUDIO_EXTENSIONS = frozenset({'.mp3', '.flac', '.ogg', '.oga', '.opus', '.m4a', '.aac', '.wav',
+                              '.webm', '.mka', '.wma', '.aif', '.aiff', '.alac'})
+LOCAL_URL_PREFIX = 'file://'
+INDEX_VERSION = 1
+# Seconds before reading a file's tags with ffmpeg is abandoned
+PROBE_TIMEOUT = 30
+# Tracks added to the search index at a time during a scan, so searches are not held up
+SCAN_BATCH = 200
+# Share of a query's trigrams a track must have to be a fuzzy match
+FUZZY_MIN_SHARED = 0.5
+# Candidates ranked at most per search; a query of common words matches too many tracks to rank them all
+MAX_RANKED = 2000
+
+_EMPTY: Set[int] = frozenset()
+
+_WORD_PATTERN = re.compile(r'\w+')
+_DURATION_PATTERN = re.compile(r'Duration: (\d+):(\d\d):(\d\d(?:\.\d+)?)')
+_CODEC_PATTERN = re.compile(r'Stream #\S+.*?: Audio: (\w+)')
+_TAG_PATTERN = re.compile(r'^\s+(title|artist|album)\s*: (.+)$', re.IGNORECASE | re.MULTILINE)
+# mutagen file types whose audio ffmpeg can copy as Opus
+_MUTAGEN_OPUS_TYPES = {'OggOpus'}
+
+def is_local_url(url: str) -> bool:
+    """Check whether a song URL points to a local library file."""
+    return url.startswith(LOCAL_URL_PREFIX)
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into search words, ignoring case and accents.
+
+    Args:
+        text (str): Title, artist, query...
+
+    Returns:
+        List[str]: Casefolded words without diacritics
+    """
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return _WORD_PATTERN.findall(stripped.casefold())
+
+def trigrams(word: str) -> Set[str]:
+    """Get the three-letter substrings of a word."""
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+def word_trigrams(word: str) -> Set[str]:
+    """Get the trigrams a word is indexed under, including its start and end (' he', 'lo ')."""
+    return trigrams(f" {word} ")
+
+class TextIndex:
+    """
+    In-memory word and trigram index over short documents (a track's tags).
+
+    Every query word must match a word of the document exactly, as a prefix
+    or as a substring: words of three letters or more are looked up by their
+    trigrams, shorter ones by prefix in the sorted vocabulary, and the
+    postings of all of them are intersected rarest first. Exact matches rank
+    before prefixes and substrings, and title words before the other words;
+    when a query of common words matches thousands of documents, only whole
+    word matches are ranked. When no document matches every word, documents
+    sharing most of the query's trigrams (counting the start and end of each
+    word) are returned as fuzzy matches, which catches typos.
+    """
+
+    def __init__(self):
+        # doc ID -> (words, number of leading title words)
+        self.documents: Dict[int, Tuple[Tuple[str, ...], int]] = {}
+        self._by_word: Dict[str, Set[int]] = {}
+        self._by_trigram: Dict[str, Set[int]] = {}
+        # Sorted vocabulary for prefix lookups of short words, rebuilt when stale
+        self._vocabulary: List[str] = []
+        self._vocabulary_stale = False
+
+    def add(self, doc_id: int, title: str, other: str = '') -> None:
+        """
+        Index a document.
+
+        Args:
+            doc_id (int): ID returned by searches
+            title (str): Text whose words rank highest
+            other (str): Further searchable text, e.g. artist and album
+        """
+        title_words = tokenize(title)
+        words = tuple(sys.intern(word) for word in title_words + tokenize(other))
+        self.documents[doc_id] = (words, len(title_words))
+        for word in set(words):
+            postings = self._by_word.get(word)
+            if postings is None:
+                postings = self._by_word[word] = set()
+                self._vocabulary_stale = True
+            postings.add(doc_id)
+            for trigram in word_trigrams(word):
+                self._by_trigram.setdefault(trigram, set()).add(doc_id)
+
+    def remove(self, doc_id: int) -> None:
+        """Drop a document from the index."""
+        document = self.documents.pop(doc_id, None)
+        if document is None:
+            return
+        for word in set(document[0]):
+            postings = self._by_word[word]
+            postings.discard(doc_id)
+            if not postings:
+                del self._by_word[word]
+                self._vocabulary_stale = True
+            for trigram in word_trigrams(word):
+                postings = self._by_trigram.get(trigram)
+                if postings is not None:
+                    postings.discard(doc_id)
+                    if not postings:
+                        del self._by_trigram[trigram]
+
+    def _postings(self, word: str) -> List[Set[int]]:
+        """Get sets of documents whose intersection has every document that may contain a word."""
+        if len(word) >= 3:
+            return [self._by_trigram.get(trigram, _EMPTY) for trigram in trigrams(word)]
+        if self._vocabulary_stale:
+            self._vocabulary = sorted(self._by_word)
+            self._vocabulary_stale = False
+        candidates: Set[int] = set()
+        index = bisect.bisect_left(self._vocabulary, word)
+        while index < len(self._vocabulary) and self._vocabulary[index].startswith(word):
+            candidates |= self._by_word[self._vocabulary[index]]
+            index += 1
+        return [candidates]
+
+    @staticmethod
+    def _word_score(word: str, words: Sequence[str], title_count: int) -> float:
+        """Score the best match of a query word among a document's words, 0 if none."""
+        best = 0.0
+        for position, candidate in enumerate(words):
+            if candidate == word:
+                score = 3.0
+            elif candidate.startswith(word):
+                score = 2.0
+            elif word in candidate:
+                score = 1.0
+            else:
+                continue
+            if position >= title_count:
+                score *= 0.75
+            best = max(best, score)
+        return best
+
+    def search(self, query: str, limit: int = 10, fuzzy: bool = True) -> List[Tuple[int, float]]:
+        """
+        Find the documents matching a query, best first.
+
+        Args:
+            query (str): Words to look for
+            limit (int): Maximum number of results
+            fuzzy (bool): Fall back to trigram similarity when no document has every word
+
+        Returns:
+            List[Tuple[int, float]]: Doc IDs and scores; documents with every
+                query word score above 1, fuzzy matches below
+        """
+        words = list(dict.fromkeys(tokenize(query)))
+        if not words:
+            return []
+        # Starting from the rarest trigram, each intersection only costs the candidates left
+        postings = sorted((posting for word in words for posting in self._postings(word)), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if not candidates:
+                break
+            candidates &= posting
+        if len(candidates) > MAX_RANKED:
+            # Whole-word matches rank first anyway
+            exact = sorted((self._by_word.get(word, _EMPTY) for word in words), key=len)
+            narrowed = candidates & exact[0]
+            for posting in exact[1:]:
+                narrowed &= posting
+            if narrowed:
+                candidates = narrowed
+            candidates = itertools.islice(candidates, MAX_RANKED)
+        results = []
+        for doc_id in candidates:
+            document_words, title_count = self.documents[doc_id]
+            total = 0.0
+            for word in words:
+                score = self._word_score(word, document_words, title_count)
+                if not score:
+                    # Trigrams spread over several words
+                    break
+                total += score
+            else:
+                # Shorter documents match more precisely
+                results.append((doc_id, 1 + total / (3 * len(words)) - len(document_words) / 1000))
+        if not results and fuzzy:
+            results = self._fuzzy(words)
+        return heapq.nlargest(limit, results, key=lambda result: result[1])
+
+    def _fuzzy(self, words: List[str]) -> List[Tuple[int, float]]:
+        wanted = set()
+        for word in words:
+            wanted |= word_trigrams(word)
+        shared: Counter = Counter()
+        for trigram in wanted:
+            shared.update(self._by_trigram.get(trigram, ()))
+        minimum = FUZZY_MIN_SHARED * len(wanted)
+        return [(doc_id, min(count / len(wanted), 0.99) - len(self.documents[doc_id][0]) / 1000)
+                for doc_id, count in shared.items() if count >= minimum]
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+class LibraryTrack:
+    """A local audio file with its tags."""
+
+    __slots__ = ('path', 'mtime', 'size', 'title', 'artist', 'album', 'duration', 'codec')
+
+    def __init__(self, path: str, mtime: int, size: int, title: str, artist: Optional[str] = None,
+                 album: Optional[str] = None, duration: Optional[int] = None, codec: Optional[str] = None):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.title = title
+        self.artist = artist
+        self.album = album
+        self.duration = duration
+        self.codec = codec
+
+    @property
+    def url(self) -> str:
+        """``file://`` URL songs of this track are queued under."""
+        return Path(self.path).as_uri()
+
+    @property
+    def display_title(self) -> str:
+        return f"{self.artist} - {self.title}" if self.artist else self.title
+
+    def to_record(self) -> List[Any]:
+        return [self.path, self.mtime, self.size, self.title, self.artist, self.album, self.duration, self.codec]
+
+    @classmethod
+    def from_record(cls, record: List[Any]) -> 'LibraryTrack':
+        return cls(*record)
+
+def _read_tags_mutagen(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        audio = mutagen.File(path, easy=True)
+    except Exception:
+        return None
+    if audio is None:
+        return None
+    tags = audio.tags or {}
+
+    def first(key: str) -> Optional[str]:
+        values = tags.get(key)
+        if not values:
+            return None
+        return str(values[0]).strip() or None
+
+    length = getattr(audio.info, 'length', None)
+    return {
+        'title': first('title'),
+        'artist': first('artist'),
+        'album': first('album'),
+        'duration': round(length) if length else None,
+        'codec': 'opus' if type(audio).__name__ in _MUTAGEN_OPUS_TYPES else None,
+    }
+
+def _read_tags_ffmpeg(path: str, executable: str) -> Optional[Dict[str, Any]]:
+    try:
+        # Without an output ffmpeg only prints the input's description, and fails
+        result = subprocess.run([executable, '-hide_banner', '-nostdin', '-i', path],
+                                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, timeout=PROBE_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"Could not read the tags of {path}: {e}")
+        return None
+    log = result.stderr.decode(errors='replace')
+    codec = _CODEC_PATTERN.search(log)
+    if codec is None:
+        # Not audio ffmpeg can decode
+        return None
+    info: Dict[str, Any] = {'title': None, 'artist': None, 'album': None, 'duration': None,
+                            'codec': codec.group(1)}
+    for key, value in _TAG_PATTERN.findall(log):
+        key = key.lower()
+        if info[key] is None:
+            info[key] = value.strip() or None
+    duration = _DURATION_PATTERN.search(log)
+    if duration:
+        hours, minutes, seconds = duration.groups()
+        info['duration'] = round(int(hours) * 3600 + int(minutes) * 60 + float(seconds))
+    return info
+
+def read_tags(path: str, executable: str = 'ffmpeg') -> Optional[Dict[str, Any]]:
+    """
+    Read the title, artist, album, duration and codec of an audio file.
+
+    mutagen is used when it is installed, ffmpeg's description of the input
+    otherwise (or for files mutagen does not know).
+
+    Args:
+        path (str): Audio file
+        executable (str): ffmpeg binary
+
+    Returns:
+        Optional[Dict[str, Any]]: The tags, missing ones as None; None if the file is not readable audio
+    """
+    info = _read_tags_mutagen(path) if mutagen is not None else None
+    if info is None:
+        info = _read_tags_ffmpeg(path, executable)
+    return info
+
+class MusicLibrary:
+    """
+    Index of local audio files, searched in memory.
+
+    Scans walk the configured directories and read the tags of new or changed
+    files only (by modification time and size), a few files at a time. The
+    tags are saved to ``index_path`` so a restart does not read them again.
+    Searches use a ``TextIndex`` over the title, artist and album of every
+    track; a scan running in a worker thread updates it in small batches
+    under a lock, so searches keep answering meanwhile.
+
+    Args:
+        directories (Sequence[str]): Directories searched recursively
+        index_path (str): JSON file the tags are saved in
+        workers (int): Files whose tags are read at once
+    """
+
+    def __init__(self, directories: Sequence[str] = LIBRARY_DIRS, index_path: str = LIBRARY_INDEX_PATH,
+                 workers: int = LIBRARY_SCAN_WORKERS):
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.index_path = index_path
+        self.workers = max(1, workers)
+        self.tracks: Dict[str, LibraryTrack] = {}
+        self.text = TextIndex()
+        self.last_scan: Dict[str, float] = {}
+        self._ids: Dict[str, int] = {}
+        self._by_id: Dict[int, LibraryTrack] = {}
+        self._by_url: Dict[str, LibraryTrack] = {}
+        self._next_id = 0
+        # Unreadable files by path, with the modification time and size they were tried at
+        self._unreadable: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._load_index()
+
+    def _load_index(self) -> None:
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            print(f"Library index is unreadable, rescanning every file: {e}")
+            return
+        if saved.get('version') != INDEX_VERSION:
+            return
+        for record in saved['tracks']:
+            self._add(LibraryTrack.from_record(record))
+
+    def save(self) -> None:
+        """Atomically write the index."""
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            records = [track.to_record() for track in self.tracks.values()]
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': INDEX_VERSION, 'tracks': records}, f, separators=(',', ':'))
+        os.replace(tmp_path, self.index_path)
+
+    def _add(self, track: LibraryTrack) -> None:
+        """Index a track, replacing an older version of its file. Hold the lock."""
+        self._remove(track.path)
+        doc_id = self._next_id
+        self._next_id += 1
+        self.tracks[track.path] = track
+        self._ids[track.path] = doc_id
+        self._by_id[doc_id] = track
+        self._by_url[track.url] = track
+        self.text.add(doc_id, track.title, f"{track.artist or ''} {track.album or ''}")
+
+    def _remove(self, path: str) -> None:
+        """Drop a file's track from the index. Hold the lock."""
+        track = self.tracks.pop(path, None)
+        if track is None:
+            return
+        doc_id = self._ids.pop(path)
+        del self._by_id[doc_id]
+        self._by_url.pop(track.url, None)
+        self.text.remove(doc_id)
+
+    def _walk(self, directory: str, visited: Set[Tuple[int, int]]) -> Iterator[Tuple[str, int, int]]:
+        """Yield the path, modification time (ns) and size of every audio file below a directory."""
+        try:
+            stat = os.stat(directory)
+            if (stat.st_dev, stat.st_ino) in visited:
+                # Reached again through a symlink
+                return
+            visited.add((stat.st_dev, stat.st_ino))
+            entries = list(os.scandir(directory))
+        except OSError as e:
+            print(f"Could not read library directory {directory}: {e}")
+            return
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    yield from self._walk(entry.path, visited)
+                elif os.path.splitext(entry.name)[1].lower() in AUDIO_EXTENSIONS:
+                    stat = entry.stat()
+                    yield entry.path, stat.st_mtime_ns, stat.st_size
+            except OSError:
+                continue
+
+    def _probe(self, file: Tuple[str, int, int]) -> Tuple[str, int, int, Optional[Dict[str, Any]]]:
+        return (*file, read_tags(file[0]))
+
+    def scan(self) -> Dict[str, float]:
+        """
+        Bring the index up to date with the files on disk. Blocks; run it in a worker thread.
+
+        A directory that cannot be read (e.g. an unmounted share) keeps its
+        tracks until it can be scanned again.
+
+        Returns:
+            Dict[str, float]: Files added, updated, removed, unchanged and
+                unreadable, and the seconds the scan took
+        """
+        with self._scan_lock:
+            started = time.perf_counter()
+            seen: Set[str] = set()
+            changed: List[Tuple[str, int, int]] = []
+            unchanged = 0
+            scanned_roots = []
+            visited: Set[Tuple[int, int]] = set()
+            for root in self.directories:
+                if not os.path.isdir(root):
+                    print(f"Library directory {root} is missing, keeping its tracks")
+                    continue
+                scanned_roots.append(os.path.join(root, ''))
+                for path, mtime, size in self._walk(root, visited):
+                    seen.add(path)
+                    track = self.tracks.get(path)
+                    if track is not None and track.mtime == mtime and track.size == size:
+                        unchanged += 1
+                    elif self._unreadable.get(path) != (mtime, size):
+                        changed.append((path, mtime, size))
+            added = updated = unreadable = 0
+            batch: List[LibraryTrack] = []
+            with ThreadPoolExecutor(self.workers, thread_name_prefix='library-scan') as executor:
+                for path, mtime, size, info in executor.map(self._probe, changed):
+                    if info is None:
+                        self._unreadable[path] = (mtime, size)
+                        unreadable += 1
+                        continue
+                    self._unreadable.pop(path, None)
+                    if path in self.tracks:
+                        updated += 1
+                    else:
+                        added += 1
+                    batch.append(self._track(path, mtime, size, info))
+                    if len(batch) >= SCAN_BATCH:
+                        self._apply(batch)
+                        batch = []
+            self._apply(batch)
+            gone = [path for path in self.tracks
+                    if path not in seen and any(path.startswith(root) for root in scanned_roots)]
+            with self._lock:
+                for path in gone:
+                    self._remove(path)
+            for path in [path for path in self._unreadable if path not in seen]:
+                del self._unreadable[path]
+            if added or updated or gone:
+                self.save()
+            seconds = time.perf_counter() - started
+            metrics.observe('library_scan_seconds', seconds)
+            metrics.increment('library_files_probed', len(changed))
+            self.last_scan = {'added': added, 'updated': updated, 'removed': len(gone),
+                              'unchanged': unchanged, 'unreadable': unreadable, 'seconds': seconds}
+            return self.last_scan
+
+    @staticmethod
+    def _track(path: str, mtime: int, size: int, info: Dict[str, Any]) -> LibraryTrack:
+        title, artist = info['title'], info['artist']
+        if not title:
+            # Untagged files are often named "<artist> - <title>"
+            title = os.path.splitext(os.path.basename(path))[0]
+            if not artist and ' - ' in title:
+                artist, title = (part.strip() for part in title.split(' - ', 1))
+        return LibraryTrack(path, mtime, size, title, artist, info['album'], info['duration'], info['codec'])
+
+    def _apply(self, tracks: List[LibraryTrack]) -> None:
+        with self._lock:
+            for track in tracks:
+                self._add(track)
+
+    def search(self, query: str, limit: int = 10) -> List[LibraryTrack]:
+        """
+        Find tracks by title, artist or album, best match first.
+
+        Args:
+            query (str): Words to look for, in any order
+            limit (int): Maximum number of results
+
+        Returns:
+            List[LibraryTrack]: Matching tracks, typo-tolerant matches after complete ones
+        """
+        started = time.perf_counter()
+        with self._lock:
+            results = [self._by_id[doc_id] for doc_id, _ in self.text.search(query, limit)]
+        metrics.observe('library_search_seconds', time.perf_counter() - started)
+        return results
+
+    def match(self, query: str) -> Optional[LibraryTrack]:
+        """
+        Get the best track containing every word of a query, as ``!play`` wants it.
+
+        Args:
+            query (str): Search query
+
+        Returns:
+            Optional[LibraryTrack]: The best complete match, None if no track has every word
+        """
+        started = time.perf_counter()
+        with self._lock:
+            results = self.text.search(query, 1, fuzzy=False)
+            track = self._by_id[results[0][0]] if results else None
+        metrics.observe('library_search_seconds', time.perf_counter() - started)
+        return track
+
+    def track(self, url: str) -> Optional[LibraryTrack]:
+        """Get the indexed track of a ``file://`` song URL; files outside the library are never played."""
+        with self._lock:
+            return self._by_url.get(url)
+
+    def __len__(self) -> int:
+        return len(self.tracks)
@@ -0,0 +1,142 @@
+import asyncio
+import re
+from typing import Optional, Set
+from config import LOUDNESS_TARGET, LOUDNESS_CONCURRENCY, LOUDNESS_TIMEOUT
+from audio_cache import AudioCache
+import metrics
+
+# Boosting quiet songs further than this would mostly raise their noise floor
+MAX_BOOST_DB = 6.0
+# ebur128 reports silence as -70 LUFS, which must not be normalized
+SILENCE_LUFS = -70.0
+
+_INTEGRATED_PATTERN = re.compile(r'Integrated loudness:\s*I:\s*(-?\d+(?:\.\d+)?) LUFS')
+
+def parse_integrated_loudness(log: str) -> Optional[float]:
+    """
+    Get the integrated loudness from the summary ffmpeg's ebur128 filter prints.
+
+    Args:
+        log (str): ffmpeg's stderr
+
+    Returns:
+        Optional[float]: Integrated loudness in LUFS, None if missing or silent
+    """
+    matches = _INTEGRATED_PATTERN.findall(log)
+    if not matches:
+        return None
+    lufs = float(matches[-1])
+    return lufs if lufs > SILENCE_LUFS else None
+
+def normalization_gain(lufs: Optional[float], target: Optional[float] = LOUDNESS_TARGET) -> float:
+    """
+    Get the linear gain that brings a song to the target loudness.
+
+    Args:
+        lufs (Optional[float]): Measured integrated loudness of the song
+        target (Optional[float]): Target loudness in LUFS, None to disable normalization
+
+    Returns:
+        float: Gain factor, 1.0 if the loudness is unknown
+    """
+    if lufs is None or target is None:
+        return 1.0
+    return 10 ** (min(target - lufs, MAX_BOOST_DB) / 20)
+
+async def measure_loudness(path: str, executable: str = 'ffmpeg',
+                           timeout: float = LOUDNESS_TIMEOUT) -> Optional[float]:
+    """
+    Measure the EBU R128 integrated loudness of an audio file.
+
+    ffmpeg decodes the file in a subprocess, so the event loop is not blocked.
+
+    Args:
+        path (str): Audio file
+        executable (str): ffmpeg binary
+        timeout (float): Seconds before the analysis is abandoned
+
+    Returns:
+        Optional[float]: Integrated loudness in LUFS, None if it could not be measured
+    """
+    process = await asyncio.create_subprocess_exec(
+        executable, '-hide_banner', '-nostats', '-i', path, '-map', '0:a:0',
+        '-af', 'ebur128=framelog=quiet', '-f', 'null', '-',
+        stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE)
+    try:
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        return None
+    return parse_integrated_loudness(stderr.decode(errors='ignore'))
+
+class LoudnessAnalyzer:
+    """
+    Measures the loudness of cached songs in the background, a few at a time.
+
+    Each song is analyzed once, from its file in the audio cache, and the
+    result is stored in the cache's index next to the file, so it survives
+    restarts and playback never needs an extra analysis pass.
+    """
+
+    def __init__(self, audio_cache: AudioCache, concurrency: int = LOUDNESS_CONCURRENCY):
+        self.audio_cache = audio_cache
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._pending: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def analyze(self, url: str) -> bool:
+        """
+        Schedule the analysis of a cached song unless it is measured or queued already.
+
+        Args:
+            url (str): Webpage URL (or cache key) of the song
+
+        Returns:
+            bool: True if an analysis was scheduled
+        """
+        key = self.audio_cache.key(url)
+        if key in self._pending or self.audio_cache.has_loudness(key):
+            return False
+        self._pending.add(key)
+        task = asyncio.get_running_loop().create_task(self._analyze(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    def backfill(self) -> int:
+        """
+        Schedule the analysis of every cached song that has not been measured yet.
+
+        Returns:
+            int: Number of scheduled analyses
+        """
+        return sum(self.analyze(key) for key in self.audio_cache.keys_without_loudness())
+
+    async def _analyze(self, key: str) -> None:
+        try:
+            async with self._semaphore:
+                path = self.audio_cache.peek(key)
+                if path is None:
+                    return
+                try:
+                    lufs = await measure_loudness(path)
+                except asyncio.TimeoutError:
+                    lufs = None
+                except OSError as e:
+                    print(f"Loudness analysis failed: {e}")
+                    return
+            metrics.increment('loudness_analyses')
+            # Silent or unreadable songs are stored too, so they are not analyzed again
+            self.audio_cache.set_loudness(key, lufs)
+        finally:
+            self._pending.discard(key)
+
+    async def close(self) -> None:
+        """Cancel the analyses that are still queued or running."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,170 @@
+import asyncio
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter, deque
+from typing import Any, Callable, Deque, Dict, List, Union
+
+# Number of most recent samples kept per timing
+TIMING_SAMPLES = 1000
+# Upper bounds in seconds of the histogram buckets every timing is counted in
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Prefix of every metric name in the Prometheus exposition
+PROMETHEUS_PREFIX = 'musicbot_'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Guards counters, timings and histograms, which the voice, journal, exporter and scan threads update too
+_lock = threading.Lock()
+# Process-wide event counters, e.g. stream URL reuse and refreshes
+counters: Counter = Counter()
+# Recent samples of measured durations in seconds, e.g. the gap between tracks
+timings: Dict[str, Deque[float]] = {}
+# Every timing since start-up as a histogram: [count per bucket (the last one unbounded), sum]
+histograms: Dict[str, List[Any]] = {}
+# Current values read when they are collected, either one value or one per label (e.g. guild ID)
+gauges: Dict[str, Callable[[], Union[float, Dict[Any, float]]]] = {}
+# Label name of the gauges that have one value per label
+gauge_labels: Dict[str, str] = {}
+
+def increment(name: str, value: int = 1) -> None:
+    """
+    Increment a named counter.
+    
+    Args:
+        name (str): Counter name
+        value (int): Amount to add
+    """
+    with _lock:
+        counters[name] += value
+
+def snapshot() -> Dict[str, int]:
+    """Get a copy of every counter."""
+    with _lock:
+        return dict(counters)
+
+def observe(name: str, seconds: float) -> None:
+    """
+    Record a measured duration.
+    
+    Args:
+        name (str): Timing name
+        seconds (float): Measured duration in seconds
+    """
+    bucket = bisect_left(HISTOGRAM_BUCKETS, seconds)
+    with _lock:
+        samples = timings.get(name)
+        if samples is None:
+            samples = timings[name] = deque(maxlen=TIMING_SAMPLES)
+            histograms[name] = [[0] * (len(HISTOGRAM_BUCKETS) + 1), 0.0]
+        samples.append(seconds)
+        histogram = histograms[name]
+        histogram[0][bucket] += 1
+        histogram[1] += seconds
+
+def samples(name: str) -> List[float]:
+    """Get the recent samples recorded for a timing."""
+    with _lock:
+        return list(timings.get(name, ()))
+
+def register_gauge(name: str, read: Callable[[], Union[float, Dict[Any, float]]], label: str = 'key') -> None:
+    """
+    Register a gauge, replacing any gauge of the same name.
+    
+    Args:
+        name (str): Gauge name
+        read (Callable): Returns the current value, or a dict of values by label
+        label (str): Name of the label when ``read`` returns a dict, e.g. 'guild'
+    """
+    gauges[name] = read
+    gauge_labels[name] = label
+
+def read_gauges() -> Dict[str, Union[float, Dict[Any, float]]]:
+    """Get the current value of every gauge."""
+    return {name: read() for name, read in gauges.items()}
+
+def _metric_name(name: str) -> str:
+    return PROMETHEUS_PREFIX + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+def _label_value(value: Any) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render() -> str:
+    """
+    Get every counter, timing histogram and gauge in the Prometheus text exposition format.
+    
+    Counters get a ``_total`` suffix; a gauge that fails to read is left out.
+    
+    Returns:
+        str: Exposition text, one metric family after another
+    """
+    with _lock:
+        counted = sorted(counters.items())
+        histogrammed = sorted((name, (list(counts), total)) for name, (counts, total) in histograms.items())
+    lines: List[str] = []
+    for name, value in counted:
+        metric = _metric_name(name) + '_total'
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    for name, (counts, total) in histogrammed:
+        metric = _metric_name(name)
+        lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for bound, count in zip(HISTOGRAM_BUCKETS + (math.inf,), counts):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{le="{_number(bound)}"}} {cumulative}')
+        lines += [f"{metric}_sum {_number(total)}", f"{metric}_count {cumulative}"]
+    for name, read in sorted(gauges.items()):
+        try:
+            value = read()
+        except Exception as e:
+            print(f"Error reading gauge {name}: {e}")
+            continue
+        metric = _metric_name(name)
+        lines.append(f"# TYPE {metric} gauge")
+        if isinstance(value, dict):
+            label = gauge_labels.get(name, 'key')
+            lines += [f'{metric}{{{label}="{_label_value(key)}"}} {_number(item)}' for key, item in value.items()]
+        else:
+            lines.append(f"{metric} {_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+async def _handle_scrape(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Answer one HTTP request: the exposition for GET /metrics, 404 otherwise."""
+    try:
+        request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 5)
+        method, target = request.split(b' ', 2)[:2]
+        if method in (b'GET', b'HEAD') and target.split(b'?')[0] in (b'/', b'/metrics'):
+            status, content_type, body = '200 OK', PROMETHEUS_CONTENT_TYPE, render().encode()
+        else:
+            status, content_type, body = '404 Not Found', 'text/plain; charset=utf-8', b'Not found\n'
+        head = (f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode()
+        writer.write(head if method == b'HEAD' else head + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+            ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(host: str, port: int) -> asyncio.AbstractServer:
+    """
+    Serve the Prometheus exposition over HTTP from the running event loop.
+    
+    Collection runs on the event loop, so gauges see queues between
+    commands; counters and histograms are copied under the lock that the
+    threads updating them take too.
+    
+    Args:
+        host (str): Address to listen on, e.g. '127.0.0.1'
+        port (int): TCP port, 0 for any free port
+        
+    Returns:
+        asyncio.AbstractServer: The listening server; close it to stop serving
+    """
+    return await asyncio.start_server(_handle_scrape, host, port)
@@ -1,23 +1,216 @@
 import asyncio
+import math
+import re
+import sys
+import tempfile
+import time
 import discord
 from discord.ext import commands
-import yt_dlp
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Awaitable, Callable, Tuple
 import json
-from config import YTDL_OPTIONS, FFMPEG_OPTIONS, DEFAULT_VOLUME
-from utils import is_valid_youtube_url, format_duration, truncate_text
+from config import (FFMPEG_OPTIONS, DEFAULT_VOLUME, STREAM_URL_TTL,
+                    STREAM_URL_EXPIRY_MARGIN, PLAYLIST_MAX_ENTRIES, PLAYLIST_BATCH_SIZE,
+                    AUDIO_CACHE_MAX_DURATION, PLAYBACK_MODE, BASE_GAIN, LOUDNESS_PASSTHROUGH_DB,
+                    GAPLESS_PRELOAD_SECONDS, GAPLESS_PREBUFFER_FRAMES, CROSSFADE_SECONDS,
+                    READAHEAD_SECONDS, READAHEAD_RESUME_SECONDS, STREAM_STALL_TIMEOUT, SEARCH_RESULTS)
+from audio_cache import AudioCache
+from audio_sources import (MappedFFmpegOpusAudio, MappedFFmpegPCMAudio, ReadAheadAudio,
+                           StreamFFmpegPCMAudio, TeeFFmpegOpusAudio, TeeFFmpegPCMAudio, find_source)
+from broadcast import Broadcast, BroadcastHub
+from dsp import create_pcm_transformer
+from extraction import Extractor, create_extractor
+from gapless import GaplessAudio, PrimedAudio, cleanup_later
+from library import LibraryTrack, MusicLibrary, is_local_url
+from loudness import LoudnessAnalyzer, normalization_gain
+import metrics
+import tracing
+from prefetch import Prefetcher
+from query_router import CACHE, FLAT, FULL, LIBRARY, LOCAL, PLAYLIST, SEARCH, QueryRoute, classify_query
+from queue_journal import GuildState, QueueJournal
+from song_cache import SongCache
+from stream_health import StreamHealthMonitor
+from track_queue import TrackQueue
+from utils import (is_valid_youtube_url, format_duration, truncate_text, safe_disconnect,
+                   parse_stream_expiry, extract_youtube_id)
+
+# Gains this close to 1.0 are left out of ffmpeg's filters, letting Opus streams pass through
+UNITY_GAIN_TOLERANCE = 0.005
+
+_YTIMG_PATTERN = re.compile(r'^https://i\.ytimg\.com/(vi|vi_webp)/([A-Za-z0-9_-]{11})/([^/?#]+)$')
 
 class Song:
-    """Represents a song with metadata."""
+    """
+    Represents a song with metadata.
+    
+    Large queues hold tens of thousands of songs, so the record is slotted,
+    keeps only the requester's ID instead of a live Member, and stores YouTube
+    URLs and thumbnails as the (interned) video ID and thumbnail name, from
+    which the full URLs are rebuilt on access.
+    """
+    
+    __slots__ = ('title', 'duration', 'requester_id', 'stream_url', 'stream_expires_at',
+                 'stream_codec', '_video_id', '_url', '_thumbnail')
     
     def __init__(self, title: str, url: str, duration: Optional[int] = None, 
-                 thumbnail: Optional[str] = None, requester: Optional[discord.Member] = None):
+                 thumbnail: Optional[str] = None, requester: Optional[discord.abc.Snowflake] = None):
         self.title = title
         self.url = url
         self.duration = duration
         self.thumbnail = thumbnail
         self.requester = requester
-        self.stream_url = None
+        self.stream_url: Optional[str] = None
+        self.stream_expires_at: Optional[float] = None
+        self.stream_codec: Optional[str] = None
+        
+    @property
+    def url(self) -> str:
+        """Webpage URL of the song."""
+        if self._url is None:
+            return f"https://www.youtube.com/watch?v={self._video_id}"
+        return self._url
+    
+    @url.setter
+    def url(self, url: str) -> None:
+        video_id = extract_youtube_id(url)
+        self._video_id = sys.intern(video_id) if video_id else None
+        # Canonical YouTube URLs are rebuilt from the video ID
+        self._url = None if video_id and url == f"https://www.youtube.com/watch?v={video_id}" else url
+        
+    @property
+    def is_local(self) -> bool:
+        """Whether the song is a file of the local music library."""
+        return self._url is not None and is_local_url(self._url)
+    
+    @property
+    def video_id(self) -> Optional[str]:
+        """YouTube video ID, or None for other sites."""
+        return self._video_id
+    
+    @property
+    def thumbnail(self) -> Optional[str]:
+        """Thumbnail image URL."""
+        thumbnail = self._thumbnail
+        if thumbnail is not None and not thumbnail.startswith('https://'):
+            # Stored as '<vi or vi_webp>/<file name>' relative to the video ID
+            folder, _, name = thumbnail.partition('/')
+            return f"https://i.ytimg.com/{folder}/{self._video_id}/{name}"
+        return thumbnail
+    
+    @thumbnail.setter
+    def thumbnail(self, thumbnail: Optional[str]) -> None:
+        if thumbnail and self._video_id:
+            match = _YTIMG_PATTERN.match(thumbnail)
+            if match and match.group(2) == self._video_id:
+                thumbnail = sys.intern(f"{match.group(1)}/{match.group(3)}")
+        self._thumbnail = thumbnail
+    
+    @property
+    def requester(self) -> Optional[discord.Object]:
+        """Lightweight handle of the member who requested the song."""
+        return discord.Object(self.requester_id) if self.requester_id is not None else None
+    
+    @requester.setter
+    def requester(self, requester: Optional[discord.abc.Snowflake]) -> None:
+        # Only the ID is kept so queued songs do not pin Member objects
+        self.requester_id = requester.id if requester is not None else None
+    
+    @property
+    def requester_mention(self) -> str:
+        """Mention of the requesting member, resolved without a Member object."""
+        return f"<@{self.requester_id}>" if self.requester_id is not None else "Unknown"
+        
+    def set_stream_url(self, stream_url: Optional[str], expires_at: Optional[float] = None,
+                       codec: Optional[str] = None) -> None:
+        """
+        Attach a resolved media URL and work out when it expires.
+        
+        Args:
+            stream_url (Optional[str]): Direct media URL resolved by yt-dlp
+            expires_at (Optional[float]): Known unix expiry, parsed from the URL if omitted
+            codec (Optional[str]): Audio codec of the media, e.g. 'opus'
+        """
+        self.stream_url = stream_url
+        self.stream_codec = codec if stream_url else None
+        if stream_url and expires_at is None:
+            expires_at = parse_stream_expiry(stream_url) or time.time() + STREAM_URL_TTL
+        self.stream_expires_at = expires_at if stream_url else None
+        
+    def has_fresh_stream_url(self, margin: float = STREAM_URL_EXPIRY_MARGIN) -> bool:
+        """
+        Check whether the stream URL will stay valid for the whole song plus a safety margin.
+        
+        Args:
+            margin (float): Extra seconds of validity required
+            
+        Returns:
+            bool: True if the stream URL can be reused, False if it must be refreshed
+        """
+        if not self.stream_url or self.stream_expires_at is None:
+            return False
+        return time.time() + (self.duration or 0) + margin < self.stream_expires_at
+        
+    def fill_metadata(self, data: Dict[str, Any]) -> None:
+        """
+        Complete a placeholder song (e.g. a playlist entry) with fully extracted metadata.
+        
+        Args:
+            data (Dict[str, Any]): yt-dlp info dict for this song
+        """
+        self.title = data.get('title') or self.title
+        if self.duration is None:
+            self.duration = data.get('duration')
+        if self.thumbnail is None:
+            self.thumbnail = data.get('thumbnail')
+            
+    def metadata(self) -> Dict[str, Any]:
+        """Get the cacheable metadata of this song."""
+        return {
+            'title': self.title,
+            'url': self.url,
+            'duration': self.duration,
+            'thumbnail': self.thumbnail,
+        }
+        
+    @classmethod
+    def from_metadata(cls, metadata: Dict[str, Any]) -> 'Song':
+        """Build a song from cached metadata, without a stream URL."""
+        return cls(metadata['title'], metadata['url'], metadata['duration'], metadata['thumbnail'])
+        
+    def to_record(self) -> Dict[str, Any]:
+        """Get the compact form of this song stored in the queue journal."""
+        # The stored fields are written as they are, so restoring skips URL parsing
+        record: Dict[str, Any] = {'t': self.title}
+        if self._url is None:
+            record['v'] = self._video_id
+        else:
+            record['u'] = self._url
+        if self.duration is not None:
+            record['d'] = self.duration
+        if self._thumbnail is not None:
+            record['th'] = self._thumbnail
+        if self.requester_id is not None:
+            record['r'] = self.requester_id
+        return record
+        
+    @classmethod
+    def from_record(cls, record: Dict[str, Any]) -> 'Song':
+        """Rebuild a song from its queue journal record."""
+        song = cls.__new__(cls)
+        song.title = record['t']
+        url = record.get('u')
+        if url is None:
+            song._video_id = sys.intern(record['v'])
+            song._url = None
+        else:
+            song.url = url
+        song.duration = record.get('d')
+        thumbnail = record.get('th')
+        song._thumbnail = sys.intern(thumbnail) if thumbnail and not thumbnail.startswith('https://') else thumbnail
+        song.requester_id = record.get('r')
+        song.stream_url = None
+        song.stream_expires_at = None
+        song.stream_codec = None
+        return song
         
     def __str__(self) -> str:
         duration_str = format_duration(self.duration) if self.duration else "Unknown"
@@ -26,136 +219,880 @@ class Song:
 class MusicPlayer:
     """Main music player class handling queue and playback."""
     
-    def __init__(self, bot: commands.Bot):
+    def __init__(self, bot: commands.Bot, guild_id: Optional[int] = None,
+                 extractor: Optional[Extractor] = None, song_cache: Optional[SongCache] = None,
+                 journal: Optional[QueueJournal] = None, audio_cache: Optional[AudioCache] = None,
+                 loudness: Optional[LoudnessAnalyzer] = None, library: Optional[MusicLibrary] = None):
         self.bot = bot
-        self.queue: List[Song] = []
+        self.guild_id = guild_id
+        self.queue = TrackQueue()
         self.current_song: Optional[Song] = None
         self.voice_client: Optional[discord.VoiceClient] = None
         self.volume = DEFAULT_VOLUME
         self.is_playing = False
         self.is_paused = False
         self.loop_enabled = False
-        self.ytdl = yt_dlp.YoutubeDL(YTDL_OPTIONS)
+        self.extractor = extractor or create_extractor()
+        self.song_cache = song_cache if song_cache is not None else SongCache()
+        self.last_activity = time.monotonic()
+        self.prefetcher = Prefetcher(self)
+        self.health = StreamHealthMonitor(self)
+        self.journal = journal
+        self.audio_cache = audio_cache
+        self.loudness = loudness
+        self.library = library
+        self._ffmpeg_log = None
+        # ffmpeg log of the song prepared for a gapless switch, and the task preparing it
+        self._next_log = None
+        self._preparing: Optional[asyncio.Task] = None
+        # Trace the current song was started in, linked from the trace of the song after it
+        self._trace_id: Optional[str] = None
+        # One track is started at a time: taking it off the queue, resolving its stream and playing it
+        self._start_lock = asyncio.Lock()
+        # Song whose stream is being resolved, and stops since then; a start gives up only if stop() ran
+        self._starting: Optional[Song] = None
+        self._stops = 0
+        # Skips asked for while a song was starting, each one passing over a song in turn
+        self._pending_skips = 0
+        # Wall-clock time the current song would have started at without pauses
+        self._started_at: Optional[float] = None
+        self._paused_position: Optional[float] = None
+        # When the previous track ended, to measure the silence before the next one
+        self._track_ended_at: Optional[float] = None
+        # Times the read-ahead buffer of a streamed song ran dry
+        self.underruns = 0
+
+    def _journal(self, op: str, **fields: Any) -> None:
+        """Record a queue mutation in the journal, if journaling is enabled."""
+        if self.journal is not None and self.guild_id is not None:
+            self.journal.record(self.guild_id, op, **fields)
+
+    def touch(self) -> None:
+        """Mark the player as recently used so it is not evicted as idle."""
+        self.last_activity = time.monotonic()
+
+    def is_idle(self, timeout: float, now: Optional[float] = None) -> bool:
+        """
+        Check whether the player has been inactive for at least ``timeout`` seconds.
         
-    async def extract_song_info(self, query: str) -> Optional[Song]:
+        A player that is playing, paused or starting a song is never considered idle.
+        
+        Args:
+            timeout (float): Seconds of inactivity before the player counts as idle
+            now (Optional[float]): Current monotonic time, defaults to time.monotonic()
+            
+        Returns:
+            bool: True if the player can be evicted, False otherwise
+        """
+        if self.voice_client and (self.voice_client.is_playing() or self.voice_client.is_paused()):
+            return False
+        if self._starting is not None or self._start_lock.locked():
+            return False
+        if now is None:
+            now = time.monotonic()
+        return now - self.last_activity >= timeout
+        
+    async def extract_song_info(self, query: str, defer_stream: Optional[bool] = None) -> Optional[Song]:
         """
         Extract song information from YouTube URL or search query.
         
+        The query is classified first and takes the cheapest path its kind
+        allows (see query_router): library tracks and cached songs need no
+        network at all, a search for a song that will only be queued needs
+        just a flat listing, and only the rest is fully resolved. The time
+        taken is observed as ``route_<kind>_<path>_seconds``.
+        
         Args:
-            query (str): YouTube URL or search query
+            query (str): YouTube URL, other URL, library file:// URL or search query
+            defer_stream (Optional[bool]): Leave the stream URL to be resolved
+                when the song is about to play; by default, while a song is playing
             
         Returns:
             Optional[Song]: Song object if successful, None otherwise
         """
-        try:
-            # Run yt-dlp extraction in executor to avoid blocking
-            loop = asyncio.get_event_loop()
-            data = await loop.run_in_executor(None, lambda: self.ytdl.extract_info(query, download=False))
-            
-            if not data:
-                return None
-                
-            # Handle playlist - take first entry
-            if 'entries' in data and data['entries']:
-                data = data['entries'][0]
-            
-            title = data.get('title', 'Unknown Title')
-            url = data.get('webpage_url', query)
-            duration = data.get('duration')
-            thumbnail = data.get('thumbnail')
-            
-            song = Song(title, url, duration, thumbnail)
-            song.stream_url = data.get('url')
+        route = classify_query(query)
+        if defer_stream is None:
+            defer_stream = self.current_song is not None
+        started = time.perf_counter()
+        path = FULL
+        with tracing.span('extract', kind=route.kind) as stage:
+            try:
+                song, path = await self._route_query(route, defer_stream)
+            except Exception as e:
+                print(f"Error extracting song info: {e}")
+                # Return None with error info for better user feedback
+                song = None
+                if stage is not None:
+                    stage.error = f"{type(e).__name__}: {e}"
+            if stage is not None:
+                stage.attributes.update(path=path, found=song is not None)
+        metrics.observe(f"route_{route.kind}_{path}_seconds", time.perf_counter() - started)
+        return song
+    
+    async def _route_query(self, route: QueryRoute, defer_stream: bool) -> Tuple[Optional[Song], str]:
+        """Get the song of a classified query, and the path (LIBRARY, CACHE, FLAT or FULL) that found it."""
+        if route.kind == LOCAL:
+            # Only files in the library can be played
+            track = self.library.track(route.query) if self.library is not None else None
+            return (self.library_song(track) if track is not None else None), LIBRARY
+        if route.kind == SEARCH and self.library is not None:
+            track = self.library.match(route.query)
+            if track is not None:
+                metrics.increment('library_hits')
+                return self.library_song(track), LIBRARY
+        
+        if route.kind != PLAYLIST:
+            cached = self.song_cache.lookup(route.query)
+            if cached:
+                metadata, stream = cached
+                song = Song.from_metadata(metadata)
+                if stream:
+                    song.set_stream_url(*stream)
+                return song, CACHE
+        
+        if route.kind == PLAYLIST or (route.kind == SEARCH and defer_stream):
+            # Metadata only; the stream is resolved by the prefetcher or play_song
+            data = await self.extractor.extract_flat(route.target)
+            entries = [entry for entry in (data or {}).get('entries') or [] if entry and entry.get('url')]
+            if not entries:
+                return None, FLAT
+            song = Song.from_metadata(self.entry_metadata(entries[0]))
+            self.song_cache.store(route.query, song.metadata())
+            return song, FLAT
+        
+        # Run yt-dlp extraction on the extraction workers to avoid blocking
+        data = await self.extractor.extract(route.target)
+        if data and 'entries' in data:
+            # Searches and playlists: take the first entry
+            data = data['entries'][0] if data['entries'] else None
+        if not data:
+            return None, FULL
+        
+        title = data.get('title', 'Unknown Title')
+        url = data.get('webpage_url', route.target)
+        duration = data.get('duration')
+        thumbnail = data.get('thumbnail')
+        
+        song = Song(title, url, duration, thumbnail)
+        song.set_stream_url(data.get('url'), codec=data.get('acodec'))
+        
+        self.song_cache.store(route.query, song.metadata(), song.stream_url, song.stream_expires_at,
+                              song.stream_codec)
+        return song, FULL
+    
+    @staticmethod
+    def entry_metadata(entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Get song metadata from an entry of a flat listing, which has no stream URL."""
+        thumbnails = entry.get('thumbnails') or [{}]
+        duration = entry.get('duration')
+        return {
+            'title': entry.get('title') or 'Unknown Title',
+            'url': entry['url'],
+            'duration': int(duration) if duration is not None else None,
+            'thumbnail': entry.get('thumbnail') or thumbnails[-1].get('url'),
+        }
+    
+    async def search(self, query: str, count: int = SEARCH_RESULTS) -> List[Song]:
+        """
+        Find the top YouTube results for a search query, for the requester to pick from.
+        
+        Only a flat listing is fetched, so results carry metadata but no
+        stream URL; the one picked is resolved by the prefetcher or when it
+        plays. Result lists are cached per normalized query.
+        
+        Args:
+            query (str): Search query
+            count (int): Number of results
             
-            return song
+        Returns:
+            List[Song]: Results, best first; empty if nothing was found
+        """
+        query = query.strip()
+        if not query:
+            return []
+        started = time.perf_counter()
+        results = self.song_cache.lookup_search(query, count)
+        if results is None:
+            try:
+                data = await self.extractor.extract_flat(f"ytsearch{count}:{query}")
+            except Exception as e:
+                print(f"Error searching: {e}")
+                return []
+            entries = [entry for entry in (data or {}).get('entries') or [] if entry and entry.get('url')]
+            results = [self.entry_metadata(entry) for entry in entries[:count]]
+            self.song_cache.store_search(query, results, count)
+        metrics.observe('search_seconds', time.perf_counter() - started)
+        return [Song.from_metadata(metadata) for metadata in results]
+    
+    @staticmethod
+    def library_song(track: LibraryTrack) -> Song:
+        """Create the song of a local library track, ready to play."""
+        song = Song(track.display_title, track.url, track.duration)
+        # Local files do not expire
+        song.set_stream_url(track.path, expires_at=math.inf, codec=track.codec)
+        return song
+    
+    async def import_playlist(self, url: str, requester: Optional[discord.Member] = None,
+                              progress: Optional[Callable[[int, int], Awaitable[None]]] = None) -> int:
+        """
+        Queue every entry of a playlist as a lightweight placeholder.
+        
+        Only a flat listing is extracted; each entry is fully resolved later,
+        when it reaches the prefetch window at the head of the queue.
+        
+        Args:
+            url (str): Playlist URL
+            requester (Optional[discord.Member]): Member who requested the playlist
+            progress (Optional[Callable[[int, int], Awaitable[None]]]): Called with
+                (entries queued, total entries) after each batch
             
+        Returns:
+            int: Number of queued entries, 0 if the playlist could not be read
+        """
+        try:
+            data = await self.extractor.extract_flat(url)
         except Exception as e:
-            print(f"Error extracting song info: {e}")
-            # Return None with error info for better user feedback
-            return None
-    
+            print(f"Error extracting playlist: {e}")
+            return 0
+        
+        entries = [entry for entry in (data or {}).get('entries') or [] if entry and entry.get('url')]
+        entries = entries[:PLAYLIST_MAX_ENTRIES]
+        total = len(entries)
+        
+        for start in range(0, total, PLAYLIST_BATCH_SIZE):
+            batch = []
+            for entry in entries[start:start + PLAYLIST_BATCH_SIZE]:
+                song = Song(entry.get('title') or 'Unknown Title', entry['url'], entry.get('duration'))
+                song.requester = requester
+                batch.append(song)
+            self.queue.extend(batch)
+            self._journal('extend', songs=[song.to_record() for song in batch])
+            self._queue_changed()
+            self.touch()
+            if progress:
+                await progress(min(start + PLAYLIST_BATCH_SIZE, total), total)
+            # Let other guilds' commands run between batches
+            await asyncio.sleep(0)
+        
+        return total
+        
     async def add_to_queue(self, song: Song) -> None:
         """Add a song to the queue."""
         self.queue.append(song)
+        self._journal('add', song=song.to_record())
+        self._queue_changed()
+        self.touch()
         
-    async def play_next(self) -> None:
-        """Play the next song in the queue."""
-        if not self.queue:
-            self.is_playing = False
-            self.current_song = None
-            # Disconnect after 5 minutes of inactivity
-            await asyncio.sleep(300)
-            if not self.is_playing and self.voice_client:
-                await self.voice_client.disconnect()
-            return
+    def clear_queue(self) -> None:
+        """Remove every queued song and cancel their prefetches."""
+        self.queue.clear()
+        self._journal('clear')
+        self._queue_changed()
+        
+    def remove_from_queue(self, index: int) -> Optional[Song]:
+        """
+        Remove the song at a queue position.
+        
+        Args:
+            index (int): 0-based queue position
+            
+        Returns:
+            Optional[Song]: The removed song, or None if the position is invalid
+        """
+        if not 0 <= index < len(self.queue):
+            return None
+        song = self.queue.pop(index)
+        self._journal('remove', i=index)
+        self._queue_changed()
+        return song
+        
+    def move_in_queue(self, source: int, destination: int) -> Optional[Song]:
+        """
+        Move a song to another queue position.
+        
+        Args:
+            source (int): Current 0-based position
+            destination (int): New 0-based position
+            
+        Returns:
+            Optional[Song]: The moved song, or None if a position is invalid
+        """
+        if not (0 <= source < len(self.queue) and 0 <= destination < len(self.queue)):
+            return None
+        song = self.queue.move(source, destination)
+        self._journal('move', i=source, to=destination)
+        self._queue_changed()
+        return song
+        
+    def shuffle_queue(self) -> bool:
+        """Shuffle the queue. Returns False if there is nothing to shuffle."""
+        if len(self.queue) < 2:
+            return False
+        self.queue.shuffle()
+        self._journal('shuffle', songs=[song.to_record() for song in self.queue])
+        self._queue_changed()
+        return True
+        
+    async def skip_to(self, index: int) -> bool:
+        """
+        Drop every song before a queue position and play the song at it.
+        
+        Args:
+            index (int): 0-based queue position
             
-        if self.voice_client and not self.voice_client.is_connected():
+        Returns:
+            bool: True if playback jumped, False if the position is invalid
+        """
+        if not 0 <= index < len(self.queue):
+            return False
+        self.queue.popleft_many(index)
+        self._journal('popleft', n=index)
+        self._queue_changed()
+        if not await self.skip() and self.voice_client:
+            await self.play_next()
+        return True
+        
+    def _queue_changed(self) -> None:
+        """Bring prefetches, and a prepared next song, in line with the head of the queue."""
+        self.prefetcher.refresh()
+        gapless = self._gapless()
+        if gapless is None:
             return
+        if gapless.next_song is not None and (not self.queue or self.queue[0] is not gapless.next_song):
+            self._drop_next_track(gapless)
+        self._prepare_if_near_end(gapless)
+        
+    async def resolve_stream(self, song: Song) -> Optional[str]:
+        """
+        Get a playable stream URL for a song, reusing the known one while it is still valid.
+        
+        Args:
+            song (Song): Song to resolve
             
-        self.current_song = self.queue.pop(0)
+        Returns:
+            Optional[str]: Direct media URL, or None if it could not be resolved
+        """
+        if song.is_local:
+            # Only files still in the library are played, whatever the URL says
+            track = self.library.track(song.url) if self.library is not None else None
+            if track is None:
+                print(f"{song.title} is no longer in the music library")
+                return None
+            song.set_stream_url(track.path, expires_at=math.inf, codec=track.codec)
+            return song.stream_url
+        
+        if song.has_fresh_stream_url():
+            metrics.increment('stream_urls_reused')
+            return song.stream_url
         
-        # Get fresh stream URL
         try:
-            loop = asyncio.get_event_loop()
-            data = await loop.run_in_executor(
-                None, 
-                lambda: self.ytdl.extract_info(self.current_song.url, download=False)
-            )
+            data = await self.extractor.extract(song.url)
             
             if data and 'entries' in data and data['entries']:
                 data = data['entries'][0]
                 
-            if not data:
-                await self.play_next()
-                return
-                
-            stream_url = data.get('url')
-            if not stream_url:
-                await self.play_next()
-                return
+            if not data or not data.get('url'):
+                return None
                 
         except Exception as e:
             print(f"Error getting stream URL: {e}")
-            await self.play_next()
-            return
+            return None
         
-        # Create audio source
-        try:
-            print(f"Attempting to play stream URL: {stream_url}")
+        metrics.increment('stream_urls_refreshed')
+        old_duration = song.duration
+        song.fill_metadata(data)
+        # Prefetched placeholders are still queued; keep the queue's total duration right
+        queued = any(entry is song for entry in self.queue[:self.prefetcher.depth])
+        if queued and song.duration != old_duration:
+            self.queue.adjust_duration(old_duration, song.duration)
+        song.set_stream_url(data['url'], codec=data.get('acodec'))
+        self.song_cache.store(song.url, song.metadata(), song.stream_url, song.stream_expires_at,
+                              song.stream_codec)
+        return song.stream_url
+        
+    def has_cached_audio(self, song: Song) -> bool:
+        """Check whether a song can be played from the on-disk audio cache."""
+        return self.audio_cache is not None and self.audio_cache.contains(song.url)
+        
+    def should_cache_audio(self, song: Song) -> bool:
+        """Check whether a song's playback should be teed into the audio cache."""
+        return (self.audio_cache is not None and not song.is_local and song.duration is not None
+                and 0 < song.duration <= AUDIO_CACHE_MAX_DURATION)
+        
+    def loudness_gain(self, song: Song) -> float:
+        """Get the gain that normalizes a song's loudness, 1.0 until it has been measured."""
+        lufs = self.audio_cache.loudness(song.url) if self.audio_cache is not None else None
+        return normalization_gain(lufs)
+        
+    def playback_gain(self, song: Song) -> float:
+        """Get the gain ffmpeg applies to a song, on top of the source level."""
+        if PLAYBACK_MODE == 'opus':
+            normalization = self.loudness_gain(song)
+            if abs(20 * math.log10(normalization)) < LOUDNESS_PASSTHROUGH_DB:
+                # Not worth giving up passthrough for
+                normalization = 1.0
+            return self.volume * normalization
+        # PCM sources get their gain and volume from the DSP chain instead
+        return 1.0
+        
+    def _ffmpeg_options(self, gain: float) -> str:
+        """Get ffmpeg's output options, with a volume filter unless the gain is unity."""
+        if abs(gain - 1.0) < UNITY_GAIN_TOLERANCE:
+            return FFMPEG_OPTIONS['options']
+        return f"{FFMPEG_OPTIONS['options']} -filter:a \"volume={gain:.4f}\""
+        
+    def create_audio_source(self, song: Song, start: float = 0.0, cache: bool = False) -> discord.AudioSource:
+        """
+        Create the audio source used to play a song's resolved stream URL.
+        
+        In 'opus' playback mode ffmpeg sends Opus packets, which discord.py
+        passes on without decoding. A stream that is already Opus (48 kHz, as
+        YouTube serves it) is copied through untouched unless a gain has to be
+        applied, in which case ffmpeg applies it while encoding.
+        
+        Args:
+            song (Song): Song whose stream URL is played
+            start (float): Offset in seconds to start playing from
+            cache (bool): Cache the audio of the song while it plays
             
-            # Create the audio source with proper error handling
-            audio_source = discord.FFmpegPCMAudio(
-                stream_url, 
-                before_options=FFMPEG_OPTIONS['before_options'],
-                options=FFMPEG_OPTIONS['options']
+        Returns:
+            discord.AudioSource: Source ready to be played
+        """
+        local = song.is_local
+        # Reconnecting is an HTTP option, ffmpeg refuses it for files
+        before_options = '' if local else FFMPEG_OPTIONS['before_options']
+        if start > 0:
+            # Input seeking skips to the offset without decoding what comes before it
+            before_options = f"-ss {start:.3f} {before_options}"
+        options = self._ffmpeg_options(self.playback_gain(song))
+        opus = PLAYBACK_MODE == 'opus'
+        passthrough = opus and song.stream_codec == 'opus' and options == FFMPEG_OPTIONS['options']
+        
+        # Keep ffmpeg's stderr so an expired (403/410) stream URL can be detected
+        self._ffmpeg_log = tempfile.TemporaryFile()
+        # Only a playback from the start can be cached as the whole song
+        cache_path = None
+        if cache and start <= 0 and self.audio_cache is not None:
+            cache_path = self.audio_cache.reserve(song.url)
+        spawn_started = time.perf_counter()
+        if cache_path:
+            cache_url = song.url
+            tee_options = dict(
+                copy_codec=song.stream_codec == 'opus',
+                before_options=before_options,
+                options=options,
+                stderr=self._ffmpeg_log,
+                on_finished=lambda completed: self.bot.loop.call_soon_threadsafe(
+                    self._commit_audio, cache_url, cache_path, completed),
             )
+            try:
+                if opus:
+                    audio_source = TeeFFmpegOpusAudio(song.stream_url, cache_path, copy_opus=passthrough,
+                                                      **tee_options)
+                else:
+                    audio_source = TeeFFmpegPCMAudio(song.stream_url, cache_path, **tee_options)
+            except Exception:
+                self.audio_cache.commit(cache_url, cache_path, False)
+                raise
+        elif opus:
+            audio_source = discord.FFmpegOpusAudio(
+                song.stream_url,
+                codec='copy' if passthrough else None,
+                before_options=before_options,
+                options=options,
+                stderr=self._ffmpeg_log
+            )
+        else:
+            audio_source = StreamFFmpegPCMAudio(
+                song.stream_url, 
+                before_options=before_options,
+                options=options,
+                stderr=self._ffmpeg_log
+            )
+        metrics.observe('ffmpeg_spawn_seconds', time.perf_counter() - spawn_started)
+        
+        print("Audio source created successfully")
+        if READAHEAD_SECONDS > 0 and not local:
+            # Buffered below the volume/DSP chain, so volume changes are not delayed by it
+            audio_source = ReadAheadAudio(audio_source, READAHEAD_SECONDS, READAHEAD_RESUME_SECONDS,
+                                          on_underrun=self._count_underrun, give_up=STREAM_STALL_TIMEOUT)
+        if opus:
+            return audio_source
+        
+        # Wrap with the volume and DSP chain
+        audio_source = create_pcm_transformer(audio_source, self.volume, BASE_GAIN * self.loudness_gain(song))
+        
+        print("Volume transformer applied")
+        return audio_source
+        
+    def _count_underrun(self) -> None:
+        # Called from the audio thread
+        self.underruns += 1
+        
+    def readahead_stats(self) -> Dict[str, float]:
+        """
+        Get the state of the read-ahead buffer of the song being played.
+        
+        Returns:
+            Dict[str, float]: Buffered seconds and fill ratio (0 without a
+                buffered stream), and underruns since the player was created
+        """
+        source = self.voice_client.source if self.voice_client else None
+        if isinstance(source, GaplessAudio):
+            source = source.current
+        buffer = find_source(source, ReadAheadAudio)
+        return {
+            'fill_seconds': buffer.fill_seconds if buffer else 0.0,
+            'fill_ratio': buffer.fill / buffer.capacity if buffer else 0.0,
+            'underruns': self.underruns,
+        }
+        
+    def create_cached_audio_source(self, song: Song, path: str, start: float = 0.0) -> discord.AudioSource:
+        """
+        Create the audio source used to play a song from the on-disk audio cache.
+        
+        Args:
+            song (Song): Song being played
+            path (str): Cached Ogg/Opus file
+            start (float): Offset in seconds to start playing from
             
-            print("Audio source created successfully")
-            
-            # Wrap with volume transformer
-            audio_source = discord.PCMVolumeTransformer(audio_source, volume=self.volume)
-            
-            print("Volume transformer applied")
+        Returns:
+            discord.AudioSource: Source ready to be played
+        """
+        self._ffmpeg_log = tempfile.TemporaryFile()
+        options = self._ffmpeg_options(self.playback_gain(song))
+        spawn_started = time.perf_counter()
+        # The start is found through the file's Ogg page index, a pipe cannot be seeked
+        if PLAYBACK_MODE == 'opus':
+            # Cached files are always Opus
+            audio_source = MappedFFmpegOpusAudio(
+                path,
+                start=start,
+                codec='copy' if options == FFMPEG_OPTIONS['options'] else None,
+                options=options,
+                stderr=self._ffmpeg_log
+            )
+            metrics.observe('ffmpeg_spawn_seconds', time.perf_counter() - spawn_started)
+            return audio_source
+        audio_source = MappedFFmpegPCMAudio(
+            path,
+            start=start,
+            options=options,
+            stderr=self._ffmpeg_log
+        )
+        metrics.observe('ffmpeg_spawn_seconds', time.perf_counter() - spawn_started)
+        return create_pcm_transformer(audio_source, self.volume, BASE_GAIN * self.loudness_gain(song))
+        
+    def _commit_audio(self, url: str, path: str, completed: bool) -> None:
+        """Add a teed song to the audio cache and schedule its loudness analysis."""
+        if self.audio_cache.commit(url, path, completed) and self.loudness is not None:
+            self.loudness.analyze(url)
+        
+    async def play_next(self, requested_at: Optional[float] = None) -> None:
+        """
+        Play the next song in the queue.
+        
+        Args:
+            requested_at (Optional[float]): time.perf_counter() of the command that
+                asked for playback, to measure how long the first frame took
+        """
+        self.touch()
+        # Calls that overlap (e.g. two quick !play) wait for the track being started instead of taking another
+        async with self._start_lock:
+            while not self.is_playing:
+                if not self.queue:
+                    # Idle players are disconnected by the PlayerManager reaper
+                    if self.current_song is not None:
+                        self._journal('end')
+                    self.current_song = None
+                    self._started_at = None
+                    self._track_ended_at = None
+                    self._pending_skips = 0
+                    return
+                    
+                if self.voice_client and not self.voice_client.is_connected():
+                    self._pending_skips = 0
+                    return
+                    
+                song = self.queue.popleft()
+                self._journal('popleft')
+                with tracing.span('play_next', queued=len(self.queue)):
+                    if await self._start_song(song, 0.0, requested_at):
+                        return
+        
+    async def play_song(self, song: Song, start: float = 0.0, requested_at: Optional[float] = None) -> None:
+        """
+        Play a song that has already been taken off the queue, or the next one if it cannot be played.
+        
+        Args:
+            song (Song): Song to play
+            start (float): Offset in seconds to start from
+            requested_at (Optional[float]): time.perf_counter() of the command that
+                asked for playback; the time until its first frame is observed
+                as ``play_to_first_frame_seconds``
+        """
+        async with self._start_lock:
+            if await self._start_song(song, start, requested_at):
+                return
+        await self.play_next(requested_at)
+        
+    async def _start_song(self, song: Song, start: float, requested_at: Optional[float]) -> bool:
+        """
+        Resolve a song's stream and start playing it; called with the start lock held.
+        
+        Returns:
+            bool: False if the song could not be played and the next one should be
+        """
+        self.current_song = song
+        self._starting = song
+        stops = self._stops
+        try:
+            return await self._resolve_and_play(song, start, requested_at, stops)
+        finally:
+            self._starting = None
+        
+    def _skip_pending(self, song: Song) -> bool:
+        """Take one of the skips asked for while the current song was starting, if any."""
+        if not self._pending_skips:
+            return False
+        self._pending_skips -= 1
+        print(f"Skipped {song.title} before it started")
+        return True
+        
+    async def _resolve_and_play(self, song: Song, start: float, requested_at: Optional[float], stops: int) -> bool:
+        if self._skip_pending(song):
+            return False
+        # Wait for the prefetch of this song if it is still running, and
+        # start resolving the song that just moved into the lookahead window
+        pending = self.prefetcher.take(song)
+        self.prefetcher.refresh()
+        if pending:
+            await tracing.traced('prefetch.wait', pending)
+        
+        # A song already on disk is played without touching the network
+        cached_path = self.audio_cache.lookup(song.url) if self.audio_cache and not song.is_local else None
+        
+        # Reuse the resolved stream URL unless it is about to expire
+        stream_url = None
+        if not cached_path:
+            with tracing.span('resolve_stream', reused=song.stream_url is not None):
+                stream_url = await self.resolve_stream(song)
+        if self._stops != stops:
+            # Stopped while the stream was being resolved
+            return True
+        if self._skip_pending(song) or (not stream_url and not cached_path):
+            return False
+        
+        # Create audio source
+        try:
+            # Create the audio source with proper error handling
+            with tracing.span('ffmpeg.spawn', cached=cached_path is not None):
+                if cached_path:
+                    print(f"Playing cached audio file: {cached_path}")
+                    audio_source = self.create_cached_audio_source(song, cached_path, start)
+                else:
+                    print(f"Attempting to play stream URL: {stream_url}")
+                    cache = self.voice_client is not None and self.should_cache_audio(song)
+                    audio_source = self.create_audio_source(song, start, cache)
             
             # Play the audio
             if self.voice_client:
                 print("Starting playback...")
+                # Ended from the voice thread once ffmpeg has produced the first frame
+                first_frame = tracing.start_span('voice.first_frame')
+                current = tracing.current_span()
+                self._trace_id = current.trace_id if current is not None else None
+                audio_source = self._wrap_gapless(audio_source, song, start, requested_at, first_frame)
                 self.voice_client.play(audio_source, after=lambda e: self.handle_playback_error(e))
                 self.is_playing = True
                 self.is_paused = False
+                self._started_at = time.time() - start
+                self._paused_position = None
+                self._journal('play', song=song.to_record(), t=self._started_at,
+                              channel=getattr(self.voice_client.channel, 'id', None))
+                if self._track_ended_at is not None:
+                    metrics.observe('track_gap_seconds', time.perf_counter() - self._track_ended_at)
+                    self._track_ended_at = None
                 print("Playback started successfully")
             else:
                 print("No voice client available")
+            return True
             
         except Exception as e:
             print(f"Error playing audio: {e}")
             print(f"Error type: {type(e)}")
             import traceback
             traceback.print_exc()
-            await self.play_next()
+            return False
+    
+    def _gapless(self) -> Optional[GaplessAudio]:
+        """Get the gapless source being played, if any."""
+        source = self.voice_client.source if self.voice_client else None
+        return source if isinstance(source, GaplessAudio) else None
+        
+    def _wrap_gapless(self, audio_source: discord.AudioSource, song: Song, start: float,
+                      requested_at: Optional[float] = None,
+                      first_frame: Optional[tracing.Span] = None) -> discord.AudioSource:
+        """
+        Wrap a song's source to track its position and, unless gapless playback
+        is off, let the next song's source be started before it ends.
+        """
+        loop = self.bot.loop
+        on_first_frame = None
+        if requested_at is not None or first_frame is not None:
+            def on_first_frame() -> None:
+                # Called from the voice thread
+                if first_frame is not None:
+                    first_frame.finish()
+                if requested_at is not None:
+                    loop.call_soon_threadsafe(metrics.observe, 'play_to_first_frame_seconds',
+                                              time.perf_counter() - requested_at)
+        return GaplessAudio(
+            audio_source, song, song.duration, start,
+            preload=GAPLESS_PRELOAD_SECONDS,
+            crossfade=CROSSFADE_SECONDS,
+            on_near_end=lambda: loop.call_soon_threadsafe(self._prepare_next_track),
+            on_advance=lambda next_song: loop.call_soon_threadsafe(self._advance_track, next_song),
+            on_first_frame=on_first_frame,
+        )
+        
+    def _prepare_next_track(self) -> None:
+        """Start the source of the song at the head of the queue, to be switched to gaplessly."""
+        gapless = self._gapless()
+        if gapless is None or not self.queue or self._preparing is not None:
+            return
+        if gapless.next_song is self.queue[0]:
+            return
+        self._preparing = self.bot.loop.create_task(self._prepare_next(gapless, self.queue[0]))
+        
+    def _prepare_if_near_end(self, gapless: GaplessAudio) -> None:
+        remaining = gapless.remaining_frames()
+        if remaining is not None and remaining <= gapless.preload_frames:
+            self._prepare_next_track()
+        
+    async def _prepare_next(self, gapless: GaplessAudio, song: Song) -> None:
+        source = None
+        log = None
+        try:
+            pending = self.prefetcher.take(song)
+            if pending:
+                await pending
+            cached_path = self.audio_cache.peek(song.url) if self.audio_cache else None
+            if not cached_path and not await self.resolve_stream(song):
+                return
+            # The current song's ffmpeg log stays in place until the switch
+            source, log = self._create_detached_source(song, 0.0, cached_path,
+                                                       cache=self.should_cache_audio(song))
+            source = await self._prime(source)
+            if self._gapless() is not gapless or not self.queue or self.queue[0] is not song:
+                return
+            handed_over, source = gapless.set_next(source, song, song.duration), None
+            if not handed_over:
+                return
+            self._close_log(self._next_log)
+            self._next_log, log = log, None
+            metrics.increment('gapless_prepared')
+        except Exception as e:
+            print(f"Error preparing the next song: {e}")
+        finally:
+            self._preparing = None
+            if source is not None:
+                cleanup_later(source)
+            self._close_log(log)
+            
+    def _create_detached_source(self, song: Song, start: float, cached_path: Optional[str],
+                                cache: bool = False) -> Tuple[discord.AudioSource, Any]:
+        """
+        Create a source for a song without replacing the ffmpeg log of the one playing.
+        
+        Returns:
+            Tuple[discord.AudioSource, Any]: The source and its ffmpeg log
+        """
+        current_log, self._ffmpeg_log = self._ffmpeg_log, None
+        try:
+            if cached_path:
+                source = self.create_cached_audio_source(song, cached_path, start)
+            else:
+                source = self.create_audio_source(song, start, cache)
+        finally:
+            log, self._ffmpeg_log = self._ffmpeg_log, current_log
+        return source, log
+        
+    async def _prime(self, source: discord.AudioSource) -> PrimedAudio:
+        """Wait in a worker thread until a new source has its first frames ready."""
+        primed = PrimedAudio(source)
+        # Spawning ffmpeg, probing the input and the first frames all happen now
+        buffer = find_source(source, ReadAheadAudio)
+        if buffer is not None:
+            # The buffer reads ahead by itself; wait for it without consuming frames
+            await asyncio.to_thread(buffer.wait_filled, GAPLESS_PREBUFFER_FRAMES)
+        else:
+            await asyncio.to_thread(primed.prime, GAPLESS_PREBUFFER_FRAMES)
+        return primed
+        
+    def _drop_next_track(self, gapless: GaplessAudio) -> None:
+        gapless.clear_next()
+        self._close_log(self._next_log)
+        self._next_log = None
+        
+    def _advance_track(self, song: Song) -> None:
+        """Take over the song a gapless source has just switched to."""
+        gapless = self._gapless()
+        self._close_log(self._ffmpeg_log)
+        self._ffmpeg_log, self._next_log = self._next_log, None
+        if self.queue and self.queue[0] is song:
+            self.queue.popleft()
+            self._journal('popleft')
+        else:
+            # The queue changed while the switch was under way
+            for index, queued in enumerate(self.queue):
+                if queued is song:
+                    self.queue.pop(index)
+                    self._journal('remove', i=index)
+                    break
+        self.current_song = song
+        # A crossfade has already played the start of the song
+        played = gapless.position() if gapless else 0.0
+        self._started_at = time.time() - played
+        self._paused_position = played if self.is_paused else None
+        self._journal('play', song=song.to_record(), t=self._started_at,
+                      channel=getattr(self.voice_client.channel, 'id', None) if self.voice_client else None)
+        if self.audio_cache is not None and self.audio_cache.contains(song.url):
+            # Count the cache hit and refresh the LRU position, as play_song does
+            self.audio_cache.lookup(song.url)
+        self.prefetcher.refresh()
+        metrics.increment('gapless_transitions')
+        self.touch()
+        if self._pending_skips:
+            # Skipped again before the switch was made
+            self._pending_skips -= 1
+            self.bot.loop.create_task(self.skip())
+        
+    @staticmethod
+    def _close_log(log) -> None:
+        if log is not None:
+            try:
+                log.close()
+            except Exception:
+                pass
+        
+    def _read_ffmpeg_log(self) -> str:
+        """Read and discard what ffmpeg wrote to stderr for the last track."""
+        log, self._ffmpeg_log = self._ffmpeg_log, None
+        if log is None:
+            return ""
+        try:
+            log.seek(0)
+            return log.read().decode(errors='ignore')
+        except Exception:
+            return ""
+        finally:
+            log.close()
     
     def handle_playback_error(self, error) -> None:
-        """Handle playback errors and continue to next song."""
+        """Handle the end of playback: resume a song whose stream died early, or continue to the next song."""
+        self._track_ended_at = time.perf_counter()
+        ffmpeg_log = self._read_ffmpeg_log()
         if error:
             print(f"Playback error: {error}")
         else:
@@ -164,15 +1101,31 @@ class MusicPlayer:
         # Reset playing state
         self.is_playing = False
         self.is_paused = False
+        # A next song prepared for a gapless switch that did not happen is played the usual way
+        self._close_log(self._next_log)
+        self._next_log = None
+        
+        # The source still knows how far the song got
+        gapless = self._gapless()
+        if gapless is not None and gapless.song is self.current_song:
+            position = gapless.position()
+            if (self.health.is_premature(gapless.song, position, gapless.ended, error, ffmpeg_log)
+                    and self.health.recover(gapless.song, position)):
+                return
         
-        # Schedule next song
+        # Schedule next song, traced on its own and linked to the trace that started this one;
+        # the coroutine is scheduled with this thread's context, which carries the new trace
+        root = tracing.start_trace('track_end', self.guild_id, previous_trace=self._trace_id)
         asyncio.run_coroutine_threadsafe(self.play_next(), self.bot.loop)
+        tracing.end_trace(root, error)
     
     async def pause(self) -> bool:
         """Pause the current song."""
         if self.voice_client and self.voice_client.is_playing():
             self.voice_client.pause()
+            self._paused_position = self.position()
             self.is_paused = True
+            self._journal('pause', offset=self._paused_position)
             return True
         return False
     
@@ -180,24 +1133,59 @@ class MusicPlayer:
         """Resume the paused song."""
         if self.voice_client and self.voice_client.is_paused():
             self.voice_client.resume()
+            if self._paused_position is not None:
+                self._started_at = time.time() - self._paused_position
+                self._paused_position = None
             self.is_paused = False
+            self._journal('resume', t=self._started_at)
             return True
         return False
     
     async def stop(self) -> bool:
         """Stop the current song and clear queue."""
-        if self.voice_client and (self.voice_client.is_playing() or self.voice_client.is_paused()):
-            self.voice_client.stop()
-            self.queue.clear()
+        recovering = self.health.cancel()
+        playing = self.voice_client and (self.voice_client.is_playing() or self.voice_client.is_paused())
+        # A song whose stream is still being resolved has not started playing yet
+        starting = self._starting is not None
+        if recovering or playing or starting:
+            self._stops += 1
+            self._pending_skips = 0
+            if playing:
+                self.voice_client.stop()
+            self.clear_queue()
             self.current_song = None
+            self._started_at = None
             self.is_playing = False
             self.is_paused = False
+            self._journal('end')
             return True
         return False
     
     async def skip(self) -> bool:
         """Skip the current song."""
-        if self.voice_client and (self.voice_client.is_playing() or self.voice_client.is_paused()):
+        if self.health.cancel() and not self.is_playing:
+            # The song was waiting to be resumed after its stream died
+            await self.play_next()
+            return True
+        playing = self.voice_client and (self.voice_client.is_playing() or self.voice_client.is_paused())
+        # Between songs: one is being started, or the last one stopped and the next is on its way
+        switching = self.current_song is not None and self.voice_client and self.voice_client.is_connected()
+        if self._starting is not None or (switching and not playing):
+            # Passed over once it is taken off the queue, instead of refusing the skip
+            self._pending_skips += 1
+            return True
+        if playing:
+            gapless = self._gapless()
+            if gapless is not None and gapless.switching:
+                # Passed over once the switch to it is made
+                self._pending_skips += 1
+                return True
+            if gapless is not None and gapless.skip():
+                # The prepared next song takes over on the next frame
+                if self.voice_client.is_paused():
+                    self.voice_client.resume()
+                    self.is_paused = False
+                return True
             self.voice_client.stop()
             return True
         return False
@@ -206,11 +1194,235 @@ class MusicPlayer:
         """Set the volume (0.0 to 1.0)."""
         if 0.0 <= volume <= 1.0:
             self.volume = volume
-            if self.voice_client and hasattr(self.voice_client.source, 'volume'):
+            self._journal('volume', volume=volume)
+            if PLAYBACK_MODE == 'opus':
+                # Opus sources get their gain from ffmpeg, which has to be restarted
+                self.restart_source()
+            elif self.voice_client and hasattr(self.voice_client.source, 'volume'):
                 self.voice_client.source.volume = volume
             return True
         return False
     
+    def restart_source(self) -> bool:
+        """
+        Swap the playing audio source for a new one started at the current position.
+        
+        Used to apply a new gain to an Opus source. The old source is cleaned
+        up off the audio thread.
+        
+        Returns:
+            bool: True if the source was replaced
+        """
+        song = self.current_song
+        gapless = self._gapless()
+        if not (song and gapless is not None and gapless.song is song
+                and (self.voice_client.is_playing() or self.voice_client.is_paused())):
+            return False
+        cached_path = self.audio_cache.peek(song.url) if self.audio_cache else None
+        if not cached_path and not song.stream_url:
+            return False
+        start = gapless.position()
+        try:
+            new_source, log = self._create_detached_source(song, start, cached_path)
+        except Exception as e:
+            print(f"Error restarting audio source: {e}")
+            return False
+        self._replace_source(gapless, new_source, log, start)
+        metrics.increment('audio_source_restarts')
+        return True
+    
+    def _replace_source(self, gapless: GaplessAudio, source: discord.AudioSource, log, start: float) -> None:
+        """Make a new source, starting at ``start`` seconds, the current song's."""
+        gapless.replace_current(source, start)
+        self._close_log(self._ffmpeg_log)
+        self._ffmpeg_log = log
+        # The prepared next song was made with the old gain, and after a seek it may be needed later
+        self._drop_next_track(gapless)
+        self._prepare_if_near_end(gapless)
+    
+    async def seek(self, position: float) -> bool:
+        """
+        Jump to a position in the current song.
+        
+        The new source is started and its first frames buffered while the old
+        one keeps playing, so the jump is heard as soon as it is ready. Streams
+        restart with input seeking (``-ss`` before ``-i``), which lets ffmpeg
+        request only the bytes it needs; cached files start at the Ogg page
+        the position falls in.
+        
+        Args:
+            position (float): Seconds from the start of the song
+            
+        Returns:
+            bool: True if playback jumped, False if nothing is playing or the position is out of range
+        """
+        song = self.current_song
+        gapless = self._gapless()
+        if not (song and gapless is not None and gapless.song is song
+                and (self.voice_client.is_playing() or self.voice_client.is_paused())):
+            return False
+        if position < 0 or (song.duration and position >= song.duration):
+            return False
+        started = time.perf_counter()
+        cached_path = self.audio_cache.peek(song.url) if self.audio_cache else None
+        if not cached_path and not await self.resolve_stream(song):
+            return False
+        source = log = None
+        try:
+            source, log = self._create_detached_source(song, position, cached_path)
+            source = await self._prime(source)
+            if self._gapless() is not gapless or gapless.song is not song:
+                # The song ended or was skipped in the meantime
+                return False
+            self._replace_source(gapless, source, log, position)
+            source = log = None
+        except Exception as e:
+            print(f"Error seeking: {e}")
+            return False
+        finally:
+            if source is not None:
+                cleanup_later(source)
+            self._close_log(log)
+        self._started_at = time.time() - position
+        if self.is_paused:
+            self._paused_position = position
+            self._journal('pause', offset=position)
+        else:
+            self._journal('resume', t=self._started_at)
+        metrics.increment('seeks')
+        metrics.observe('seek_seconds', time.perf_counter() - started)
+        self.touch()
+        return True
+    
+    async def start_broadcast(self, hub: BroadcastHub, name: str, song: Song) -> Optional[Broadcast]:
+        """
+        Start broadcasting a song that any guild can tune in to.
+        
+        The song is decoded (and in 'pcm' mode encoded to Opus) once, at this
+        guild's volume, however many guilds listen.
+        
+        Args:
+            hub (BroadcastHub): Registry of running broadcasts
+            name (str): Name to tune in by
+            song (Song): Song to broadcast
+            
+        Returns:
+            Optional[Broadcast]: The broadcast, None if the name is taken or the song cannot be played
+        """
+        if hub.get(name) is not None:
+            return None
+        cached_path = self.audio_cache.lookup(song.url) if self.audio_cache and not song.is_local else None
+        if not cached_path and not await self.resolve_stream(song):
+            return None
+        try:
+            source, log = self._create_detached_source(song, 0.0, cached_path)
+        except Exception as e:
+            print(f"Error starting broadcast: {e}")
+            return None
+        broadcast = hub.start(name, song, source, on_end=lambda _: self._close_log(log))
+        if broadcast is None:
+            cleanup_later(source)
+            self._close_log(log)
+        return broadcast
+    
+    async def listen(self, broadcast: Broadcast) -> bool:
+        """
+        Play a broadcast in place of this guild's own queue.
+        
+        A song that was playing goes back to the front of the queue, which
+        carries on once the broadcast ends or is skipped. A song being started
+        is waited for, so the two never play on the voice client at once.
+        
+        Args:
+            broadcast (Broadcast): Broadcast to tune in to
+            
+        Returns:
+            bool: False if not connected to voice or the broadcast is over
+        """
+        async with self._start_lock:
+            if not self.voice_client or not self.voice_client.is_connected() or broadcast.ended:
+                return False
+            subscriber = broadcast.subscribe()
+            song = self.current_song
+            self.health.cancel()
+            if self.voice_client.is_playing() or self.voice_client.is_paused():
+                # Swapped in place, so the voice client's after callback does not start the next song
+                old_source = self.voice_client.source
+                self.voice_client.source = subscriber
+                cleanup_later(old_source)
+                if self.voice_client.is_paused():
+                    self.voice_client.resume()
+                if song is not None and song is not broadcast.song:
+                    self.queue.appendleft(song)
+                    self._journal('add', song=song.to_record(), i=0)
+                self._close_log(self._ffmpeg_log)
+                self._close_log(self._next_log)
+                self._ffmpeg_log = self._next_log = None
+            else:
+                self.voice_client.play(subscriber, after=lambda e: self.handle_playback_error(e))
+            # Broadcasts are live, so there is nothing to resume after a restart
+            self._journal('end')
+            self.current_song = broadcast.song
+            self.is_playing = True
+            self.is_paused = False
+            self._started_at = time.time() - broadcast.position
+            self._paused_position = None
+            self.touch()
+            return True
+    
+    async def cleanup(self) -> None:
+        """Stop playback, drop the queue and disconnect from voice."""
+        self.health.cancel()
+        self.clear_queue()
+        self._journal('drop')
+        self.current_song = None
+        self._started_at = None
+        self.is_playing = False
+        self.is_paused = False
+        if self.voice_client:
+            # Stopping the voice client also kills the ffmpeg process
+            if self.voice_client.is_playing() or self.voice_client.is_paused():
+                self.voice_client.stop()
+            await safe_disconnect(self.voice_client)
+            self.voice_client = None
+    
+    def position(self) -> float:
+        """Get the playback offset of the current song in seconds."""
+        gapless = self._gapless()
+        if gapless is not None and gapless.song is self.current_song:
+            # Counted in frames actually played
+            return gapless.position()
+        if self._paused_position is not None:
+            return self._paused_position
+        if self._started_at is None:
+            return 0.0
+        return max(0.0, time.time() - self._started_at)
+    
+    def restore_state(self, state: GuildState, now: float) -> Optional[float]:
+        """
+        Rebuild the queue from a journaled guild state after a restart.
+        
+        The current song, if any, is kept aside as ``current_song`` rather
+        than queued, so the caller can reconnect and resume it.
+        
+        Args:
+            state (GuildState): State replayed from the queue journal
+            now (float): Latest time known to the journal, for the playback offset
+            
+        Returns:
+            Optional[float]: Offset to resume the current song at, None if nothing was playing
+        """
+        self.queue.clear()
+        self.queue.extend(Song.from_record(record) for record in state.queue)
+        if state.volume is not None:
+            self.volume = state.volume
+        if state.current is None:
+            return None
+        self.current_song = Song.from_record(state.current)
+        offset = state.offset(now)
+        self._paused_position = offset
+        return offset
+    
     def get_queue_info(self) -> Dict[str, Any]:
         """Get current queue information."""
         return {
@@ -219,5 +1431,7 @@ class MusicPlayer:
             'is_playing': self.is_playing,
             'is_paused': self.is_paused,
             'volume': self.volume,
-            'queue_length': len(self.queue)
+            'queue_length': len(self.queue),
+            'total_duration': self.queue.total_duration,
+            'unknown_durations': self.queue.unknown_durations
         }
@@ -0,0 +1,330 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+from discord.ext import commands
+from config import (PLAYER_IDLE_TIMEOUT, PLAYER_REAP_INTERVAL, MAX_PLAYERS, QUEUE_JOURNAL_PATH,
+                    RESTORE_CONCURRENCY, AUDIO_CACHE_DIR, LOUDNESS_TARGET, LIBRARY_DIRS,
+                    LIBRARY_SCAN_INTERVAL, METRICS_HOST, METRICS_PORT, TRACE_EXPORT_PATH,
+                    TRACE_OTLP_ENDPOINT)
+from audio_cache import AudioCache
+from audio_sources import live_ffmpeg_processes
+from broadcast import BroadcastHub
+from extraction import create_extractor
+from library import MusicLibrary
+from loudness import LoudnessAnalyzer
+import metrics
+import tracing
+from music_player import MusicPlayer
+from queue_journal import GuildState, QueueJournal
+from song_cache import SongCache
+
+PlayerFactory = Callable[..., MusicPlayer]
+
+class PlayerManager:
+    """Guild-keyed registry of MusicPlayer instances."""
+
+    def __init__(self, bot: commands.Bot, idle_timeout: float = PLAYER_IDLE_TIMEOUT,
+                 max_players: int = MAX_PLAYERS, reap_interval: float = PLAYER_REAP_INTERVAL,
+                 player_factory: PlayerFactory = MusicPlayer):
+        self.bot = bot
+        self.idle_timeout = idle_timeout
+        self.max_players = max_players
+        self.reap_interval = reap_interval
+        self.player_factory = player_factory
+        # Least recently used players first
+        self.players: "OrderedDict[int, MusicPlayer]" = OrderedDict()
+        # One pool of extraction workers is shared by every guild
+        self.extractor = create_extractor()
+        self.song_cache = SongCache()
+        # Broadcasts any guild can tune in to
+        self.broadcasts = BroadcastHub()
+        self.audio_cache: Optional[AudioCache] = AudioCache() if AUDIO_CACHE_DIR else None
+        # Cached songs are measured for loudness normalization
+        self.loudness: Optional[LoudnessAnalyzer] = None
+        if self.audio_cache is not None and LOUDNESS_TARGET is not None:
+            self.loudness = LoudnessAnalyzer(self.audio_cache)
+        # Local files searched before YouTube
+        self.library: Optional[MusicLibrary] = MusicLibrary() if LIBRARY_DIRS else None
+        # Queue changes are journaled once restore() has run
+        self.journal: Optional[QueueJournal] = QueueJournal() if QUEUE_JOURNAL_PATH else None
+        self.restored = False
+        self.evictions = 0
+        self._reaper_task: Optional[asyncio.Task] = None
+        self._scan_task: Optional[asyncio.Task] = None
+        self._metrics_task: Optional[asyncio.Task] = None
+        self._metrics_server: Optional[asyncio.AbstractServer] = None
+        self._closing: List[asyncio.Task] = []
+        metrics.register_gauge('readahead_fill_seconds', lambda: self._readahead_gauge('fill_seconds'), 'guild')
+        metrics.register_gauge('readahead_underruns', lambda: self._readahead_gauge('underruns'), 'guild')
+        metrics.register_gauge('broadcast_subscribers', self.broadcasts.stats, 'broadcast')
+        metrics.register_gauge('players', lambda: len(self.players))
+        metrics.register_gauge('queue_depth', lambda: sum(len(player.queue) for player in self.players.values()))
+        metrics.register_gauge('voice_clients', lambda: sum(
+            1 for player in self.players.values() if player.voice_client and player.voice_client.is_connected()))
+        metrics.register_gauge('extractor_backlog', self._extractor_backlog)
+        if os.path.isdir('/proc'):
+            metrics.register_gauge('ffmpeg_processes', live_ffmpeg_processes)
+        if self.library is not None:
+            metrics.register_gauge('library_tracks', lambda: len(self.library))
+
+    def _readahead_gauge(self, field: str) -> Dict[int, float]:
+        """Get a read-ahead buffer statistic of every playing guild."""
+        return {guild_id: player.readahead_stats()[field]
+                for guild_id, player in self.players.items() if player.is_playing}
+
+    def _extractor_backlog(self) -> int:
+        """Get the number of extraction jobs waiting for a worker, including a fallback pool's."""
+        fallback = getattr(self.extractor, 'fallback', None)
+        return self.extractor.backlog + (fallback.backlog if fallback is not None else 0)
+
+    def get(self, guild_id: int) -> MusicPlayer:
+        """
+        Get the player for a guild, creating it on first use.
+
+        Args:
+            guild_id (int): Discord guild ID
+
+        Returns:
+            MusicPlayer: The guild's music player
+        """
+        player = self.players.get(guild_id)
+        if player is None:
+            player = self.player_factory(self.bot, guild_id=guild_id, extractor=self.extractor,
+                                         song_cache=self.song_cache, journal=self.journal,
+                                         audio_cache=self.audio_cache, loudness=self.loudness,
+                                         library=self.library)
+            self.players[guild_id] = player
+            self._enforce_limit()
+        else:
+            self.players.move_to_end(guild_id)
+        player.touch()
+        return player
+
+    def peek(self, guild_id: int) -> Optional[MusicPlayer]:
+        """Get the player for a guild without creating it or marking it as used."""
+        return self.players.get(guild_id)
+
+    async def remove(self, guild_id: int) -> bool:
+        """
+        Remove a guild's player, stopping playback and disconnecting from voice.
+
+        Args:
+            guild_id (int): Discord guild ID
+
+        Returns:
+            bool: True if a player was removed, False otherwise
+        """
+        player = self.players.pop(guild_id, None)
+        if player is None:
+            return False
+        await player.cleanup()
+        return True
+
+    async def evict_idle(self, now: Optional[float] = None) -> int:
+        """
+        Evict every player that has been idle longer than the idle timeout.
+
+        Args:
+            now (Optional[float]): Current monotonic time, defaults to time.monotonic()
+
+        Returns:
+            int: Number of evicted players
+        """
+        if now is None:
+            now = time.monotonic()
+        idle = [guild_id for guild_id, player in self.players.items()
+                if player.is_idle(self.idle_timeout, now)]
+        for guild_id in idle:
+            await self.remove(guild_id)
+        self.evictions += len(idle)
+        return len(idle)
+
+    def _enforce_limit(self) -> None:
+        """Evict least recently used players that have nothing to play while over the size limit."""
+        overflow = len(self.players) - self.max_players
+        if overflow <= 0:
+            return
+        # The newest player is the one being handed out
+        for guild_id, player in list(self.players.items())[:-1]:
+            if overflow <= 0:
+                break
+            # Never cut off a guild that is listening, starting a song or has songs waiting
+            if not player.is_idle(0) or player.queue or player.current_song is not None:
+                continue
+            del self.players[guild_id]
+            self.evictions += 1
+            overflow -= 1
+            # Cleaning up journals the drop, so the guild's state is not restored after a restart
+            task = asyncio.get_running_loop().create_task(player.cleanup())
+            self._closing.append(task)
+            task.add_done_callback(self._closing.remove)
+
+    async def restore(self, concurrency: int = RESTORE_CONCURRENCY) -> int:
+        """
+        Restore the journaled queues after a restart and start journaling.
+        
+        Queues are rebuilt right away; reconnecting to voice and resuming the
+        songs that were playing runs in the background, ``concurrency``
+        guilds at a time. Only the first call does anything.
+        
+        Args:
+            concurrency (int): Voice channels reconnected at once
+            
+        Returns:
+            int: Number of restored guild queues
+        """
+        if self.restored or self.journal is None:
+            return 0
+        self.restored = True
+        # Changes made while the old journal is read are buffered and written after it
+        self.journal.open()
+        states = await asyncio.to_thread(self.journal.load)
+        return await self._restore_queues(states, concurrency)
+        
+    async def _restore_queues(self, states: Dict[int, GuildState], concurrency: int) -> int:
+        now = self.journal.last_time
+        resumes = []
+        for count, (guild_id, state) in enumerate(list(states.items())):
+            if count % 100 == 99:
+                # Let commands run between batches of rebuilt queues
+                await asyncio.sleep(0)
+            if self.peek(guild_id) is not None:
+                # The guild started a new queue meanwhile; its journal entries start from empty
+                del states[guild_id]
+                continue
+            if state.current is not None and state.channel_id is None:
+                # Nowhere to resume it, so the interrupted song goes back to the front of the queue
+                state.queue.insert(0, state.current)
+                state.current = state.started_at = state.paused_at = None
+            offset = self.get(guild_id).restore_state(state, now)
+            # The songs are resumed in new sessions, so their old start times no longer apply
+            state.freeze(now)
+            if offset is not None and state.channel_id is not None:
+                resumes.append((guild_id, state.channel_id, offset, state.paused_at is not None))
+        self.journal.start(states.values())
+        if resumes:
+            task = asyncio.get_running_loop().create_task(self._resume_all(resumes, concurrency))
+            self._closing.append(task)
+            task.add_done_callback(self._closing.remove)
+        return len(states)
+    
+    async def _resume_all(self, resumes: List, concurrency: int) -> None:
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def bounded(guild_id: int, channel_id: int, offset: float, paused: bool) -> None:
+            async with semaphore:
+                try:
+                    await self._resume(guild_id, channel_id, offset, paused)
+                except Exception as e:
+                    print(f"Could not resume playback in guild {guild_id}: {e}")
+        
+        await asyncio.gather(*(bounded(*resume) for resume in resumes))
+        
+    async def _resume(self, guild_id: int, channel_id: int, offset: float, paused: bool) -> None:
+        """Reconnect a restored guild to its voice channel and resume the current song."""
+        player = self.peek(guild_id)
+        guild = self.bot.get_guild(guild_id)
+        channel = guild.get_channel(channel_id) if guild else None
+        if player is None or player.current_song is None or channel is None:
+            return
+        if player.voice_client is None:
+            player.voice_client = await channel.connect()
+        await player.play_song(player.current_song, start=offset)
+        if paused:
+            await player.pause()
+            
+    def start(self) -> None:
+        """
+        Start the background tasks that evict idle players and scan the music
+        library, measure unmeasured cached songs, serve the metrics endpoint
+        and export trace spans.
+        """
+        tracing.start_exporter(TRACE_EXPORT_PATH, TRACE_OTLP_ENDPOINT)
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.get_running_loop().create_task(self._reap_forever())
+            if self.loudness is not None:
+                queued = self.loudness.backfill()
+                if queued:
+                    print(f"Measuring the loudness of {queued} cached songs in the background")
+        if self.library is not None and (self._scan_task is None or self._scan_task.done()):
+            self._scan_task = asyncio.get_running_loop().create_task(self._scan_forever())
+        if METRICS_PORT and self._metrics_task is None:
+            self._metrics_task = asyncio.get_running_loop().create_task(self._serve_metrics())
+
+    async def _serve_metrics(self) -> None:
+        try:
+            self._metrics_server = await metrics.serve(METRICS_HOST, METRICS_PORT)
+            print(f"Serving metrics on http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            # The bot plays music all the same, e.g. when a second instance holds the port
+            print(f"Could not serve metrics on {METRICS_HOST}:{METRICS_PORT}: {e}")
+
+    async def _reap_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            try:
+                evicted = await self.evict_idle()
+                if evicted:
+                    print(f"Evicted {evicted} idle music players")
+                if self.audio_cache is not None:
+                    # Persist the LRU order changed by cache hits
+                    self.audio_cache.flush()
+            except Exception as e:
+                print(f"Error evicting idle players: {e}")
+
+    async def _scan_forever(self) -> None:
+        while True:
+            try:
+                result = await asyncio.to_thread(self.library.scan)
+                print(f"Scanned the music library in {result['seconds']:.1f}s: {len(self.library)} tracks, "
+                      f"{result['added']} added, {result['updated']} updated, {result['removed']} removed")
+            except Exception as e:
+                print(f"Error scanning the music library: {e}")
+            if LIBRARY_SCAN_INTERVAL <= 0:
+                return
+            await asyncio.sleep(LIBRARY_SCAN_INTERVAL)
+
+    async def close(self) -> None:
+        """Stop the reaper and clean up every player, keeping their journaled queues."""
+        if self._reaper_task:
+            self._reaper_task.cancel()
+            self._reaper_task = None
+        if self._scan_task:
+            # A scan already in its worker thread finishes in the background
+            self._scan_task.cancel()
+            self._scan_task = None
+        if self._metrics_task:
+            self._metrics_task.cancel()
+            self._metrics_task = None
+        if self._metrics_server is not None:
+            self._metrics_server.close()
+            self._metrics_server = None
+        tracing.stop_exporter()
+        # Close the journal first so shutting down does not erase the queues to restore
+        if self.journal is not None:
+            self.journal.close()
+        for guild_id in list(self.players):
+            await self.remove(guild_id)
+        self.broadcasts.stop_all()
+        self.extractor.shutdown()
+        if self.loudness is not None:
+            await self.loudness.close()
+        if self.audio_cache is not None:
+            self.audio_cache.flush()
+
+    def __len__(self) -> int:
+        return len(self.players)
+
+    def stats(self) -> Dict[str, int]:
+        """Get registry counters."""
+        return {
+            'players': len(self.players),
+            'playing': sum(1 for p in self.players.values() if p.is_playing),
+            'evictions': self.evictions,
+            'underruns': sum(p.underruns for p in self.players.values()),
+            'stream_recoveries': sum(p.health.recoveries for p in self.players.values()),
+            'broadcasts': len(self.broadcasts.broadcasts),
+            'library_tracks': len(self.library) if self.library is not None else 0,
+        }
@@ -0,0 +1,75 @@
+import asyncio
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+from config import PREFETCH_DEPTH
+import metrics
+import tracing
+
+if TYPE_CHECKING:
+    from music_player import MusicPlayer, Song
+
+class Prefetcher:
+    """
+    Keeps the stream URLs of the next few queued songs resolved while the current one plays.
+
+    Each song in the lookahead window gets its own resolve task. Whenever the queue
+    changes, refresh() cancels tasks for songs that left the window (skipped,
+    removed, reordered or cleared) and starts tasks for songs that entered it.
+    """
+
+    def __init__(self, player: 'MusicPlayer', depth: int = PREFETCH_DEPTH):
+        self.player = player
+        self.depth = depth
+        # id(song) -> (song, resolve task)
+        self._tasks: Dict[int, Tuple['Song', asyncio.Task]] = {}
+
+    def refresh(self) -> None:
+        """Bring the in-flight resolves in line with the head of the queue."""
+        window = {id(song): song for song in self.player.queue[:self.depth]} if self.depth > 0 else {}
+        for key, (song, task) in list(self._tasks.items()):
+            if key not in window:
+                task.cancel()
+                del self._tasks[key]
+                metrics.increment('prefetch_cancelled')
+        for key, song in window.items():
+            if key in self._tasks or song.has_fresh_stream_url() or self.player.has_cached_audio(song):
+                continue
+            task = asyncio.get_running_loop().create_task(self._resolve(song))
+            self._tasks[key] = (song, task)
+
+    async def _resolve(self, song: 'Song') -> None:
+        # Part of the trace of whatever changed the queue, e.g. the !play that added the song
+        with tracing.span('prefetch', title=song.title) as span:
+            resolved = await self.player.resolve_stream(song)
+            if span is not None:
+                span.attributes['resolved'] = bool(resolved)
+        if resolved:
+            metrics.increment('prefetch_resolved')
+        entry = self._tasks.get(id(song))
+        if entry and entry[0] is song:
+            del self._tasks[id(song)]
+
+    def take(self, song: 'Song') -> Optional[asyncio.Task]:
+        """
+        Hand over the in-flight resolve of a song that is about to be played.
+
+        Args:
+            song (Song): Song popped from the queue
+
+        Returns:
+            Optional[asyncio.Task]: Resolve task to await, or None if none is running
+        """
+        entry = self._tasks.get(id(song))
+        if entry is None or entry[0] is not song:
+            return None
+        del self._tasks[id(song)]
+        return entry[1]
+
+    def cancel(self) -> None:
+        """Cancel every in-flight resolve."""
+        for song, task in self._tasks.values():
+            task.cancel()
+        metrics.increment('prefetch_cancelled', len(self._tasks))
+        self._tasks.clear()
+
+    def __len__(self) -> int:
+        return len(self._tasks)
@@ -0,0 +1,58 @@
+from typing import NamedTuple
+from library import is_local_url
+from utils import extract_youtube_id, is_playlist_url, is_url, is_valid_youtube_url
+
+# Kinds of queries
+LOCAL = 'local'
+VIDEO = 'video'
+PLAYLIST = 'playlist'
+SEARCH = 'search'
+# A page of any other site (or a YouTube page that is not a video or playlist)
+URL = 'url'
+
+# Ways a query is answered, cheapest first
+LIBRARY = 'library'
+CACHE = 'cache'
+FLAT = 'flat'
+FULL = 'full'
+
+class QueryRoute(NamedTuple):
+    """
+    What a query is and how to look it up.
+
+    Attributes:
+        kind (str): LOCAL, VIDEO, PLAYLIST, SEARCH or URL
+        query (str): The query as the user wrote it, without surrounding <> or spaces
+        target (str): What to extract: the canonical watch URL of a video, a
+            ``ytsearch1:`` query for a search, the URL otherwise
+    """
+    kind: str
+    query: str
+    target: str
+
+def classify_query(query: str) -> QueryRoute:
+    """
+    Tell what kind of thing a ``!play`` query is, without touching the network.
+
+    Args:
+        query (str): URL, ``file://`` URL of a library track or search words
+
+    Returns:
+        QueryRoute: The query's kind and extraction target
+    """
+    query = query.strip()
+    if query.startswith('<') and query.endswith('>'):
+        # Discord's syntax for a link without a preview
+        query = query[1:-1].strip()
+    if is_local_url(query):
+        return QueryRoute(LOCAL, query, query)
+    if is_valid_youtube_url(query):
+        video_id = extract_youtube_id(query)
+        if video_id:
+            return QueryRoute(VIDEO, query, f"https://www.youtube.com/watch?v={video_id}")
+        if is_playlist_url(query):
+            return QueryRoute(PLAYLIST, query, query)
+        return QueryRoute(URL, query, query)
+    if is_url(query):
+        return QueryRoute(URL, query, query)
+    return QueryRoute(SEARCH, query, f"ytsearch1:{query}")
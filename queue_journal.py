@@ -0,0 +1,289 @@
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+from config import (QUEUE_JOURNAL_PATH, JOURNAL_FSYNC_INTERVAL, JOURNAL_TICK_INTERVAL,
+                    JOURNAL_COMPACT_BYTES)
+import metrics
+
+SongRecord = Dict[str, Any]
+
+class GuildState:
+    """
+    A guild's queue as rebuilt from the journal.
+
+    Songs are kept as the plain records stored in the journal (see
+    ``Song.to_record``) so replaying thousands of guilds stays cheap.
+    """
+
+    __slots__ = ('guild_id', 'queue', 'current', 'started_at', 'paused_at', 'channel_id', 'volume')
+
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        self.queue: List[SongRecord] = []
+        self.current: Optional[SongRecord] = None
+        # Wall-clock time the current song would have started at if played without pauses
+        self.started_at: Optional[float] = None
+        # Offset of the current song while paused
+        self.paused_at: Optional[float] = None
+        self.channel_id: Optional[int] = None
+        self.volume: Optional[float] = None
+
+    def apply(self, entry: Dict[str, Any]) -> None:
+        """Apply one journal entry to the state."""
+        op = entry['op']
+        if op == 'add':
+            index = entry.get('i')
+            if index is None:
+                self.queue.append(entry['song'])
+            else:
+                self.queue.insert(index, entry['song'])
+        elif op == 'extend':
+            self.queue.extend(entry['songs'])
+        elif op == 'popleft':
+            del self.queue[:entry.get('n', 1)]
+        elif op == 'remove':
+            del self.queue[entry['i']]
+        elif op == 'move':
+            self.queue.insert(entry['to'], self.queue.pop(entry['i']))
+        elif op in ('clear', 'shuffle'):
+            self.queue = list(entry.get('songs', ()))
+        elif op == 'play':
+            self.current = entry['song']
+            self.started_at = entry['t']
+            self.paused_at = None
+            self.channel_id = entry.get('channel', self.channel_id)
+        elif op == 'pause':
+            self.paused_at = entry['offset']
+        elif op == 'resume':
+            self.started_at = entry['t']
+            self.paused_at = None
+        elif op == 'end':
+            self.current = None
+            self.started_at = self.paused_at = None
+        elif op == 'volume':
+            self.volume = entry['volume']
+        elif op == 'snapshot':
+            self.queue = entry['queue']
+            self.current = entry.get('current')
+            self.started_at = entry.get('started_at')
+            self.paused_at = entry.get('paused_at')
+            self.channel_id = entry.get('channel')
+            self.volume = entry.get('volume')
+
+    def offset(self, now: float) -> float:
+        """Approximate playback offset of the current song at ``now``."""
+        if self.paused_at is not None:
+            return self.paused_at
+        if self.started_at is None:
+            return 0.0
+        offset = max(0.0, now - self.started_at)
+        duration = (self.current or {}).get('d')
+        return min(offset, duration) if duration else offset
+
+    def freeze(self, now: float) -> None:
+        """Turn a playing song into one paused at its offset, for a restart."""
+        if self.current is not None and self.paused_at is None:
+            self.paused_at = self.offset(now)
+
+    def is_empty(self) -> bool:
+        return not self.queue and self.current is None
+
+    def to_record(self) -> Dict[str, Any]:
+        """Serialize the state as a single snapshot entry."""
+        record: Dict[str, Any] = {'g': self.guild_id, 'op': 'snapshot', 'queue': self.queue}
+        for key, value in (('current', self.current), ('started_at', self.started_at),
+                           ('paused_at', self.paused_at), ('channel', self.channel_id),
+                           ('volume', self.volume)):
+            if value is not None:
+                record[key] = value
+        return record
+
+class QueueJournal:
+    """
+    Append-only journal of queue mutations for every guild.
+
+    ``record`` only hands the entry to a writer thread, so journaling never
+    blocks the event loop. The writer appends entries in batches and fsyncs at
+    most every ``fsync_interval`` seconds, so a crash loses at most that much.
+
+    Instead of logging every guild's playback position, the writer appends one
+    global tick every ``tick_interval`` seconds while anything is playing; a
+    song's offset is then the last tick minus the time it started at. The file
+    is rewritten as one snapshot per guild on start-up and whenever it grows
+    past ``compact_bytes``.
+    """
+
+    def __init__(self, path: str = QUEUE_JOURNAL_PATH, fsync_interval: float = JOURNAL_FSYNC_INTERVAL,
+                 tick_interval: float = JOURNAL_TICK_INTERVAL, compact_bytes: int = JOURNAL_COMPACT_BYTES):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.tick_interval = tick_interval
+        self.compact_bytes = compact_bytes
+        # Latest wall-clock time known to be written, from ticks and play entries
+        self.last_time = 0.0
+        self._entries: "queue.SimpleQueue[Optional[Dict[str, Any]]]" = queue.SimpleQueue()
+        self._playing: Set[int] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._accepting = False
+
+    def record(self, guild_id: int, op: str, **fields: Any) -> None:
+        """
+        Queue a journal entry for writing. Ignored until the journal is opened.
+
+        Args:
+            guild_id (int): Discord guild ID
+            op (str): Mutation name, see ``GuildState.apply``
+            **fields: Entry payload
+        """
+        if not self._accepting:
+            return
+        if op in ('play', 'resume'):
+            self._playing.add(guild_id)
+        elif op in ('pause', 'end', 'drop'):
+            self._playing.discard(guild_id)
+        fields['g'] = guild_id
+        fields['op'] = op
+        self._entries.put(fields)
+
+    def load(self) -> Dict[int, GuildState]:
+        """
+        Replay the journal file into per-guild states.
+
+        A torn last line from a crash is ignored.
+
+        Returns:
+            Dict[int, GuildState]: Non-empty guild states keyed by guild ID
+        """
+        states: Dict[int, GuildState] = {}
+        last_time = 0.0
+        try:
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        metrics.increment('journal_corrupt_lines')
+                        continue
+                    op = entry.get('op')
+                    if op == 'tick':
+                        last_time = max(last_time, entry['t'])
+                        continue
+                    guild_id = entry.get('g')
+                    if op == 'drop':
+                        states.pop(guild_id, None)
+                        continue
+                    state = states.get(guild_id)
+                    if state is None:
+                        state = states[guild_id] = GuildState(guild_id)
+                    try:
+                        state.apply(entry)
+                    except (KeyError, IndexError, TypeError) as e:
+                        print(f"Skipping bad journal entry for guild {guild_id}: {e}")
+                        metrics.increment('journal_corrupt_lines')
+                    if op in ('play', 'resume'):
+                        last_time = max(last_time, entry['t'])
+        except FileNotFoundError:
+            pass
+        self.last_time = last_time
+        return {guild_id: state for guild_id, state in states.items() if not state.is_empty()}
+
+    def open(self) -> None:
+        """Start accepting entries; they are buffered until the writer is started."""
+        self._accepting = True
+
+    def start(self, states: Optional[Iterable[GuildState]] = None) -> None:
+        """
+        Start accepting entries and launch the writer thread.
+
+        Args:
+            states (Optional[Iterable[GuildState]]): Restored guild states; the
+                file is first rewritten as one snapshot per state
+        """
+        if self._thread is not None:
+            return
+        self.open()
+        snapshots = [state.to_record() for state in states or ()]
+        self._thread = threading.Thread(target=self._write_forever, args=(snapshots,),
+                                        name='queue-journal', daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Stop accepting entries, write out the pending ones and fsync."""
+        self._accepting = False
+        if self._thread is not None:
+            self._entries.put(None)
+            self._thread.join()
+            self._thread = None
+
+    # Writer thread
+
+    def _rewrite(self, snapshots: List[Dict[str, Any]]) -> None:
+        """Atomically replace the journal with the given snapshot entries."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for snapshot in snapshots:
+                f.write(json.dumps(snapshot, separators=(',', ':')))
+                f.write('\n')
+            f.write(json.dumps({'op': 'tick', 't': time.time()}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        metrics.increment('journal_compactions')
+
+    def _compact(self) -> None:
+        states = self.load()
+        self._rewrite([state.to_record() for state in states.values()])
+
+    def _write_forever(self, snapshots: List[Dict[str, Any]]) -> None:
+        f = None
+        dirty = False
+        closing = False
+        try:
+            # A failure here stops the writer like any other, so record() stops queueing
+            self._rewrite(snapshots)
+            f = open(self.path, 'a', encoding='utf-8')
+            last_sync = last_tick = time.monotonic()
+            while not closing:
+                timeout = min(self.fsync_interval, self.tick_interval) if dirty or self._playing else None
+                batch: List[Dict[str, Any]] = []
+                try:
+                    entry = self._entries.get(timeout=timeout)
+                    # Drain whatever else is waiting into the same write
+                    while True:
+                        if entry is None:
+                            closing = True
+                            break
+                        batch.append(entry)
+                        entry = self._entries.get_nowait()
+                except queue.Empty:
+                    pass
+                now = time.monotonic()
+                if self._playing and now - last_tick >= self.tick_interval:
+                    batch.append({'op': 'tick', 't': time.time()})
+                    last_tick = now
+                if batch:
+                    f.write(''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in batch))
+                    f.flush()
+                    dirty = True
+                    metrics.increment('journal_entries', len(batch))
+                if dirty and (closing or now - last_sync >= self.fsync_interval):
+                    os.fsync(f.fileno())
+                    last_sync = now
+                    dirty = False
+                    metrics.increment('journal_fsyncs')
+                    if not closing and f.tell() > self.compact_bytes:
+                        f.close()
+                        self._compact()
+                        f = open(self.path, 'a', encoding='utf-8')
+        except Exception as e:
+            print(f"Queue journal writer stopped: {e}")
+            self._accepting = False
+        finally:
+            if f is not None:
+                f.close()
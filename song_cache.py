@@ -0,0 +1,235 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+from config import (SONG_CACHE_SIZE, SONG_CACHE_TTL, QUERY_CACHE_TTL, STREAM_URL_TTL,
+                    STREAM_URL_EXPIRY_MARGIN, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+from utils import canonical_query_key, extract_youtube_id, normalize_query
+
+V = TypeVar('V')
+
+class TTLCache(Generic[V]):
+    """Size-bounded LRU cache whose entries also expire after a time-to-live."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (expires_at, value), least recently used first
+        self._entries: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, now: Optional[float] = None) -> Optional[V]:
+        """
+        Look up a key, refreshing its LRU position.
+
+        Args:
+            key (Hashable): Cache key
+            now (Optional[float]): Current monotonic time, defaults to time.monotonic()
+
+        Returns:
+            Optional[V]: Cached value, or None if missing or expired
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if now is None:
+            now = time.monotonic()
+        expires_at, value = entry
+        if expires_at <= now:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        """
+        Store a value, evicting least recently used entries past the size bound.
+
+        Args:
+            key (Hashable): Cache key
+            value (V): Value to store
+            ttl (Optional[float]): Seconds until expiry, defaults to the cache TTL
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        """Remove a key and return its value, if present."""
+        entry = self._entries.pop(key, None)
+        return entry[1] if entry else None
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def stats(self) -> Dict[str, int]:
+        """Get hit/miss/eviction counters."""
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+class SongCache:
+    """
+    Cache of extracted song metadata in front of yt-dlp.
+
+    Metadata is keyed by canonical video ID (or webpage URL for other sites) and
+    lives for hours. Search queries map to those keys through a separate, shorter
+    lived alias table. Stream URLs expire quickly, so they are kept on their own.
+    The result lists of ``!search`` are kept per normalized query as well.
+    """
+
+    def __init__(self, max_entries: int = SONG_CACHE_SIZE, ttl: float = SONG_CACHE_TTL,
+                 query_ttl: float = QUERY_CACHE_TTL, stream_ttl: float = STREAM_URL_TTL,
+                 max_searches: int = SEARCH_CACHE_SIZE, search_ttl: float = SEARCH_CACHE_TTL):
+        self.songs: TTLCache[Dict[str, Any]] = TTLCache(max_entries, ttl)
+        self.queries: TTLCache[str] = TTLCache(max_entries, query_ttl)
+        # normalized query -> (results asked for, metadata of the results, best first)
+        self.searches: TTLCache[Tuple[int, List[Dict[str, Any]]]] = TTLCache(max_searches, search_ttl)
+        # key -> (stream URL, unix expiry timestamp, audio codec)
+        self.streams: TTLCache[Tuple[str, float, Optional[str]]] = TTLCache(max_entries, stream_ttl)
+
+    @staticmethod
+    def song_key(url: str) -> str:
+        """Get the canonical cache key for a webpage URL."""
+        return extract_youtube_id(url) or url
+
+    def key_for_query(self, query: str) -> Optional[str]:
+        """
+        Resolve a user query to a metadata key without touching the network.
+
+        Args:
+            query (str): YouTube URL or search query
+
+        Returns:
+            Optional[str]: Metadata key if the query is a URL or a known search, None otherwise
+        """
+        video_id = extract_youtube_id(query)
+        if video_id:
+            return video_id
+        return self.queries.get(canonical_query_key(query))
+
+    def lookup(self, query: str) -> Optional[Tuple[Dict[str, Any], Optional[Tuple[str, float, Optional[str]]]]]:
+        """
+        Look up cached metadata and, if still fresh, the stream URL for a query.
+
+        Args:
+            query (str): YouTube URL or search query
+
+        Returns:
+            Optional[Tuple[Dict[str, Any], Optional[Tuple[str, float, Optional[str]]]]]:
+                (metadata, (stream URL, expiry, codec) or None) or None on a miss
+        """
+        key = self.key_for_query(query)
+        if key is None:
+            self.songs.misses += 1
+            return None
+        metadata = self.songs.get(key)
+        if metadata is None:
+            return None
+        return metadata, self.streams.get(key)
+
+    def store(self, query: str, metadata: Dict[str, Any], stream_url: Optional[str] = None,
+              stream_expires_at: Optional[float] = None, stream_codec: Optional[str] = None) -> str:
+        """
+        Cache metadata extracted for a query.
+
+        Args:
+            query (str): The query that was extracted
+            metadata (Dict[str, Any]): Song fields (title, url, duration, thumbnail)
+            stream_url (Optional[str]): Resolved media URL, if any
+            stream_expires_at (Optional[float]): Unix timestamp the media URL expires at
+            stream_codec (Optional[str]): Audio codec of the media URL
+
+        Returns:
+            str: Metadata key the entry was stored under
+        """
+        key = self.song_key(metadata['url'])
+        self.songs.set(key, metadata)
+        if key != query and not extract_youtube_id(query):
+            # Keyed like the extractor's in-flight jobs: URLs keep their case, searches are normalized
+            self.queries.set(canonical_query_key(query), key)
+        if stream_url:
+            self.store_stream(metadata['url'], stream_url, stream_expires_at, stream_codec)
+        return key
+
+    def lookup_search(self, query: str, count: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get the cached results of a search, if at least ``count`` were fetched.
+
+        Args:
+            query (str): Search query
+            count (int): Number of results wanted
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: Metadata of up to ``count`` results, None on a miss
+        """
+        entry = self.searches.get(normalize_query(query))
+        if entry is None:
+            return None
+        fetched, results = entry
+        if fetched < count:
+            # Fewer results were asked for last time; the listing may have more
+            return None
+        return results[:count]
+
+    def store_search(self, query: str, results: List[Dict[str, Any]], count: int) -> None:
+        """
+        Cache the results of a search, and each result's metadata on its own.
+
+        Args:
+            query (str): Search query
+            results (List[Dict[str, Any]]): Metadata of the results, best first
+            count (int): Number of results that were asked for
+        """
+        for metadata in results:
+            self.songs.set(self.song_key(metadata['url']), metadata)
+        self.searches.set(normalize_query(query), (count, results))
+
+    def store_stream(self, url: str, stream_url: str, expires_at: Optional[float] = None,
+                     codec: Optional[str] = None) -> None:
+        """
+        Cache a resolved stream URL until shortly before it expires.
+
+        Args:
+            url (str): Webpage URL of the song
+            stream_url (str): Resolved media URL
+            expires_at (Optional[float]): Unix timestamp the media URL expires at
+            codec (Optional[str]): Audio codec of the media URL, e.g. 'opus'
+        """
+        if expires_at is None:
+            expires_at = time.time() + self.streams.ttl
+        ttl = expires_at - time.time() - STREAM_URL_EXPIRY_MARGIN
+        if ttl > 0:
+            self.streams.set(self.song_key(url), (stream_url, expires_at, codec), ttl)
+
+    def invalidate_stream(self, url: str) -> None:
+        """Forget the stream URL of a song, e.g. after the server rejected it."""
+        self.streams.pop(self.song_key(url))
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Get counters for each cache table."""
+        return {
+            'songs': self.songs.stats(),
+            'queries': self.queries.stats(),
+            'streams': self.streams.stats(),
+            'searches': self.searches.stats(),
+        }
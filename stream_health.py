@@ -0,0 +1,149 @@
+import asyncio
+import time
+from typing import TYPE_CHECKING, Optional, Set
+from audio_sources import ReadAheadAudio, find_source
+from config import STREAM_END_TOLERANCE, STREAM_RECOVERY_BACKOFF, STREAM_RECOVERY_RETRIES
+import metrics
+from utils import is_expired_stream_error
+
+if TYPE_CHECKING:
+    from music_player import MusicPlayer, Song
+
+# Seconds a song has to play past its last failure before the retry budget is refilled
+PROGRESS_RESET_SECONDS = 30.0
+# Longest wait between two recovery attempts
+MAX_BACKOFF_SECONDS = 30.0
+# Longest wait for a resumed stream's first audio when measuring the recovery time
+RESUME_TIMEOUT_SECONDS = 10.0
+
+class StreamHealthMonitor:
+    """
+    Tells a song that stopped early from one that played to its end, and resumes it.
+
+    When ffmpeg exits before the song is over (the stream URL expired during
+    a long mix, the connection broke for longer than ``-reconnect`` waits),
+    the frames played fall short of ``Song.duration``. Such a song is resumed
+    where it stopped with a freshly resolved stream URL instead of being
+    dropped. Each song gets ``retries`` attempts; the first runs at once and
+    the next ones back off exponentially, so a stream that dies again right
+    away does not respawn ffmpeg in a tight loop. The budget is refilled once
+    a resumed song has made progress again.
+
+    Args:
+        player (MusicPlayer): Player whose songs are monitored
+        retries (int): Recovery attempts per song (0 disables recovery)
+        backoff (float): Seconds before the second attempt, doubled for each further one
+        tolerance (float): Seconds short of the duration an end still counts as normal
+    """
+
+    def __init__(self, player: 'MusicPlayer', retries: int = STREAM_RECOVERY_RETRIES,
+                 backoff: float = STREAM_RECOVERY_BACKOFF, tolerance: float = STREAM_END_TOLERANCE):
+        self.player = player
+        self.retries = retries
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.recoveries = 0
+        self._song: Optional['Song'] = None
+        self._attempts = 0
+        self._failed_at = 0.0
+        self._task: Optional[asyncio.Future] = None
+        # Measurements of resumed songs, which a skip no longer cancels
+        self._measuring: Set[asyncio.Task] = set()
+
+    def is_premature(self, song: 'Song', position: float, ended: bool, error: Optional[Exception],
+                     ffmpeg_log: str = "") -> bool:
+        """
+        Check whether playback stopped before the end of the song.
+
+        Args:
+            song (Song): Song that stopped
+            position (float): Seconds of the song that were played
+            ended (bool): Whether the source ran out of audio, rather than being stopped
+            error (Optional[Exception]): Error playback stopped with, if any
+            ffmpeg_log (str): What ffmpeg wrote to stderr
+
+        Returns:
+            bool: True if the song should have kept playing
+        """
+        if not ended and error is None:
+            # Stopped on purpose (skip, stop, disconnect)
+            return False
+        if song.duration:
+            return song.duration - position > self.tolerance
+        # Without a duration only a failure says the song did not finish
+        return error is not None or is_expired_stream_error(ffmpeg_log)
+
+    def recover(self, song: 'Song', position: float) -> bool:
+        """
+        Schedule a song that stopped early to resume where it stopped.
+
+        Called from the audio thread.
+
+        Args:
+            song (Song): Song that stopped
+            position (float): Seconds of the song that were played
+
+        Returns:
+            bool: False if the song's retry budget is spent and it should be given up
+        """
+        metrics.increment('premature_stream_ends')
+        if song is not self._song or position - self._failed_at >= PROGRESS_RESET_SECONDS:
+            self._song = song
+            self._attempts = 0
+        self._failed_at = position
+        if self._attempts >= self.retries:
+            print(f"Giving up on {song.title} after {self._attempts} recovery attempts")
+            metrics.increment('stream_recovery_failures')
+            return False
+        self._attempts += 1
+        delay = 0.0 if self._attempts == 1 else min(self.backoff * 2 ** (self._attempts - 2), MAX_BACKOFF_SECONDS)
+        print(f"Stream ended early at {position:.1f}s, resuming (attempt {self._attempts}) in {delay:g}s")
+        self._task = asyncio.run_coroutine_threadsafe(
+            self._resume(song, position, delay, time.perf_counter()), self.player.bot.loop)
+        return True
+
+    def cancel(self) -> bool:
+        """
+        Abandon a pending recovery, e.g. because the song was skipped.
+
+        A recovery that has already restarted the song is not pending any
+        more; that song is skipped like any other playing song.
+
+        Returns:
+            bool: True if a recovery was pending
+        """
+        task, self._task = self._task, None
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    async def _resume(self, song: 'Song', position: float, delay: float, detected: float) -> None:
+        player = self.player
+        await asyncio.sleep(delay)
+        if player.current_song is not song:
+            return
+        # The old URL may be the reason ffmpeg died
+        song.set_stream_url(None)
+        player.song_cache.invalidate_stream(song.url)
+        # The silence is a recovery, not a gap between tracks
+        player._track_ended_at = None
+        # Moves on to the next song by itself if no new URL can be had
+        await player.play_song(song, position)
+        if player.current_song is song and player.is_playing:
+            # Measured in its own task, so this one is done and a skip stops the resumed song
+            task = asyncio.get_running_loop().create_task(self._measure(detected))
+            self._measuring.add(task)
+            task.add_done_callback(self._measuring.discard)
+        else:
+            metrics.increment('stream_recovery_failures')
+
+    async def _measure(self, detected: float) -> None:
+        # Recovered once audio flows again, not when ffmpeg has merely been started
+        gapless = self.player._gapless()
+        buffer = find_source(gapless.current, ReadAheadAudio) if gapless is not None else None
+        if buffer is not None:
+            await asyncio.to_thread(buffer.wait_filled, buffer.resume_frames, RESUME_TIMEOUT_SECONDS)
+        self.recoveries += 1
+        metrics.increment('stream_recoveries')
+        metrics.observe('stream_recovery_seconds', time.perf_counter() - detected)
@@ -0,0 +1,325 @@
+import contextlib
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from typing import Any, Awaitable, Dict, Iterator, List, Optional, TypeVar
+from config import TRACE_KEEP, TRACE_FLUSH_INTERVAL, TRACE_EXPORT_MAX_BYTES
+import metrics
+
+T = TypeVar('T')
+
+class Span:
+    """
+    One timed stage of a command or of playback.
+
+    Spans of the same trace share ``trace_id``; ``parent_id`` is the span the
+    stage ran inside of, None for the root. Times are wall-clock seconds, so
+    spans ended from other threads (e.g. the voice thread) line up.
+    """
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'start', 'end', 'attributes', 'error')
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.end: Optional[float] = None
+        # Unknown values are left out rather than exported as "None"
+        self.attributes = {key: value for key, value in (attributes or {}).items() if value is not None}
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        return None if self.end is None else self.end - self.start
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        """End the span, from any thread; ending it again does nothing."""
+        if self.end is not None:
+            return
+        self.end = time.time()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        _finished(self)
+
+    def to_record(self) -> Dict[str, Any]:
+        """Get the span as one line of the JSONL export."""
+        record = {'trace': self.trace_id, 'span': self.span_id, 'parent': self.parent_id, 'name': self.name,
+                  'start': self.start, 'end': self.end, 'attributes': self.attributes}
+        if self.error:
+            record['error'] = self.error
+        return record
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Get the span in the OTLP/HTTP JSON encoding."""
+        span: Dict[str, Any] = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,
+            'startTimeUnixNano': str(int(self.start * 1e9)),
+            'endTimeUnixNano': str(int((self.end or self.start) * 1e9)),
+            'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in self.attributes.items()],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+class SpanExporter:
+    """
+    Writes finished spans to a JSONL file and/or posts them to an OTLP/HTTP collector.
+
+    Spans are handed to a writer thread, so finishing one never blocks the
+    event loop or the voice thread; they are written in batches every
+    ``flush_interval`` seconds. The file is rotated to ``<path>.1`` once it
+    grows past ``max_bytes``.
+    """
+
+    def __init__(self, path: Optional[str] = None, endpoint: Optional[str] = None,
+                 flush_interval: float = TRACE_FLUSH_INTERVAL, max_bytes: int = TRACE_EXPORT_MAX_BYTES):
+        self.path = path
+        self.endpoint = endpoint
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self._spans: "queue.SimpleQueue[Optional[Span]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+
+    def export(self, span: Span) -> None:
+        self._spans.put(span)
+
+    def start(self) -> None:
+        """Launch the writer thread."""
+        if self._thread is not None:
+            return
+        if self.path and os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._thread = threading.Thread(target=self._write_forever, name='trace-exporter', daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Write out the pending spans and stop the writer thread."""
+        if self._thread is not None:
+            self._spans.put(None)
+            self._thread.join()
+            self._thread = None
+
+    # Writer thread
+
+    def _write_forever(self) -> None:
+        closing = False
+        while not closing:
+            batch: List[Span] = []
+            deadline = time.monotonic() + self.flush_interval
+            try:
+                while True:
+                    span = self._spans.get(timeout=max(0.0, deadline - time.monotonic()))
+                    if span is None:
+                        closing = True
+                        break
+                    batch.append(span)
+            except queue.Empty:
+                pass
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    print(f"Error exporting {len(batch)} trace spans: {e}")
+                    metrics.increment('trace_spans_dropped', len(batch))
+
+    def _write(self, batch: List[Span]) -> None:
+        if self.path:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, f"{self.path}.1")
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(span.to_record(), separators=(',', ':')) + '\n' for span in batch))
+        if self.endpoint:
+            body = json.dumps({'resourceSpans': [{
+                'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'music-bot'}}]},
+                'scopeSpans': [{'scope': {'name': 'music-bot'}, 'spans': [span.to_otlp() for span in batch]}],
+            }]}).encode()
+            request = urllib.request.Request(self.endpoint, body, {'Content-Type': 'application/json'})
+            with urllib.request.urlopen(request, timeout=5) as response:
+                response.read()
+        metrics.increment('trace_spans_exported', len(batch))
+
+# Span the running code is part of; copied into tasks and into executor jobs
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('current_span', default=None)
+# Spans of the most recent traces by trace ID, oldest trace first
+_traces: "OrderedDict[str, List[Span]]" = OrderedDict()
+# Root span of the last traced command of each guild
+_last_command: Dict[int, Span] = {}
+_lock = threading.Lock()
+exporter: Optional[SpanExporter] = None
+
+def _finished(span: Span) -> None:
+    if exporter is not None:
+        exporter.export(span)
+
+def current_span() -> Optional[Span]:
+    """Get the span the running code is part of, if any."""
+    return _current.get()
+
+def start_trace(name: str, guild_id: Optional[int] = None, command: bool = False, **attributes: Any) -> Span:
+    """
+    Start a new trace and make its root span the current one.
+
+    Args:
+        name (str): Name of the root span, e.g. '!play'
+        guild_id (Optional[int]): Guild the trace belongs to
+        command (bool): Whether it traces a command, which ``last_trace`` returns
+        **attributes: Attributes of the root span
+
+    Returns:
+        Span: The root span; finish it with ``end_trace``
+    """
+    if guild_id is not None:
+        attributes['guild'] = guild_id
+    root = Span(name, os.urandom(16).hex(), attributes=attributes)
+    with _lock:
+        _traces[root.trace_id] = [root]
+        while len(_traces) > TRACE_KEEP:
+            _traces.popitem(last=False)
+        if command and guild_id is not None:
+            _last_command[guild_id] = root
+    _current.set(root)
+    return root
+
+def end_trace(root: Span, error: Optional[BaseException] = None) -> None:
+    """Finish the root span of a trace; stages still running (e.g. waiting for audio) go on."""
+    root.finish(error)
+    if _current.get() is root:
+        _current.set(None)
+
+def start_span(name: str, **attributes: Any) -> Optional[Span]:
+    """
+    Start a span inside the current one without making it current, e.g. to finish it from another thread.
+
+    Returns:
+        Optional[Span]: The span, None when nothing is being traced
+    """
+    parent = _current.get()
+    if parent is None:
+        return None
+    span = Span(name, parent.trace_id, parent.span_id, attributes)
+    with _lock:
+        spans = _traces.get(parent.trace_id)
+        if spans is not None:
+            spans.append(span)
+    return span
+
+@contextlib.contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Time a stage as a span inside the current one; does nothing when nothing is being traced.
+
+    Args:
+        name (str): Stage name, e.g. 'extract'
+        **attributes: Attributes of the span
+
+    Yields:
+        Optional[Span]: The span, to add attributes to; None when not tracing
+    """
+    child = start_span(name, **attributes)
+    if child is None:
+        yield None
+        return
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.finish(e)
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+@contextlib.contextmanager
+def activate(span: Optional[Span]) -> Iterator[None]:
+    """Make a span from ``start_span`` the current one for a block, without finishing it."""
+    if span is None:
+        yield
+        return
+    token = _current.set(span)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+async def traced(name: str, awaitable: Awaitable[T], **attributes: Any) -> T:
+    """Await something as a span, e.g. ``await traced('discord.send', ctx.send(...))``."""
+    with span(name, **attributes):
+        return await awaitable
+
+def last_trace(guild_id: int) -> Optional[List[Span]]:
+    """
+    Get the spans of a guild's last traced command, in start order.
+
+    Args:
+        guild_id (int): Discord guild ID
+
+    Returns:
+        Optional[List[Span]]: Spans with the root first, None if none is kept
+    """
+    with _lock:
+        root = _last_command.get(guild_id)
+        spans = _traces.get(root.trace_id) if root is not None else None
+        return sorted(spans, key=lambda span: span.start) if spans else None
+
+def format_breakdown(spans: List[Span]) -> List[str]:
+    """
+    Lay a trace out as one line per span: start offset, duration and name, children indented under their parent.
+
+    Args:
+        spans (List[Span]): Spans of one trace, root first (see ``last_trace``)
+
+    Returns:
+        List[str]: Lines of the breakdown; spans still running show no duration
+    """
+    root = spans[0]
+    children: Dict[Optional[str], List[Span]] = {}
+    for span in spans[1:]:
+        children.setdefault(span.parent_id, []).append(span)
+    lines = []
+    pending = [(root, 0)]
+    while pending:
+        span, depth = pending.pop()
+        offset = (span.start - root.start) * 1000
+        duration = f"{span.duration * 1000:7.0f}ms" if span.end is not None else "running"
+        details = ' '.join(f"{key}={value}" for key, value in span.attributes.items() if key != 'guild')
+        if span.error:
+            details = f"{details} error={span.error}".strip()
+        lines.append(f"+{offset:6.0f}ms {duration:>9} {'  ' * depth}{span.name} {details}".rstrip())
+        # Children in start order
+        pending.extend((child, depth + 1) for child in reversed(children.get(span.span_id, [])))
+    return lines
+
+def start_exporter(path: Optional[str], endpoint: Optional[str]) -> None:
+    """Export finished spans to a JSONL file and/or an OTLP/HTTP collector from now on."""
+    global exporter
+    if exporter is None and (path or endpoint):
+        exporter = SpanExporter(path, endpoint)
+        exporter.start()
+
+def stop_exporter() -> None:
+    """Write out the pending spans and stop exporting."""
+    global exporter
+    if exporter is not None:
+        exporter.close()
+        exporter = None
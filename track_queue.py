@@ -0,0 +1,312 @@
+import random
+from collections import deque
+from itertools import chain, islice
+from typing import TYPE_CHECKING, Deque, Iterable, Iterator, List, Optional, Tuple, Union, overload
+
+if TYPE_CHECKING:
+    from music_player import Song
+
+class TrackQueue:
+    """
+    Song queue supporting cheap operations at any position.
+
+    Songs are stored in chunks of roughly ``LOAD`` entries, and a Fenwick tree
+    over the chunk sizes finds the chunk holding any position in O(log n).
+
+    - popleft/appendleft/append: O(1) amortized
+    - insert/pop/move at a position: O(log n + LOAD)
+    - shuffle: O(n), reshuffles references without copying songs
+    - total_duration: maintained incrementally
+    """
+
+    LOAD = 256
+
+    def __init__(self, songs: Iterable['Song'] = ()):
+        self._chunks: List[Deque['Song']] = []
+        # 1-based Fenwick tree over chunk sizes
+        self._tree: List[int] = [0]
+        # Songs popped from the first chunk that the tree still counts, so
+        # popleft does not have to touch the tree
+        self._head_removed = 0
+        self._len = 0
+        self._duration = 0
+        self._unknown_durations = 0
+        self.extend(songs)
+
+    # Index maintenance
+
+    def _rebuild(self) -> None:
+        """Rebuild the Fenwick tree from the current chunk sizes."""
+        self._head_removed = 0
+        tree = [0] + [len(chunk) for chunk in self._chunks]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, chunk_index: int, delta: int) -> None:
+        i = chunk_index + 1
+        tree = self._tree
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _tree_prefix(self, count: int) -> int:
+        """Sum of the sizes of the first ``count`` chunks."""
+        total = 0
+        tree = self._tree
+        while count > 0:
+            total += tree[count]
+            count -= count & -count
+        return total
+
+    def _tree_append(self, size: int) -> None:
+        """Add a node for a new last chunk in O(log k)."""
+        i = len(self._tree)
+        self._tree.append(size + self._tree_prefix(i - 1) - self._tree_prefix(i - (i & -i)))
+
+    def _locate(self, index: int) -> Tuple[int, int]:
+        """Map a queue position to (chunk index, offset inside that chunk)."""
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("queue index out of range")
+        # Positions in the tree still include the songs popped from the first chunk
+        remaining = index + self._head_removed
+        pos = 0
+        step = 1 << (len(self._tree).bit_length() - 1)
+        tree = self._tree
+        while step:
+            nxt = pos + step
+            if nxt < len(tree) and tree[nxt] <= remaining:
+                pos = nxt
+                remaining -= tree[nxt]
+            step >>= 1
+        if pos == 0:
+            remaining -= self._head_removed
+        return pos, remaining
+
+    def _split(self, chunk_index: int) -> None:
+        chunk = self._chunks[chunk_index]
+        half = len(chunk) // 2
+        tail = deque(islice(chunk, half, None))
+        for _ in range(len(tail)):
+            chunk.pop()
+        self._chunks.insert(chunk_index + 1, tail)
+        self._rebuild()
+
+    def _drop_chunk(self, chunk_index: int) -> None:
+        del self._chunks[chunk_index]
+        self._rebuild()
+
+    def _count(self, song: 'Song', sign: int) -> None:
+        if song.duration is None:
+            self._unknown_durations += sign
+        else:
+            self._duration += sign * song.duration
+
+    # Mutation
+
+    def append(self, song: 'Song') -> None:
+        """Add a song to the end of the queue."""
+        if not self._chunks or len(self._chunks[-1]) >= self.LOAD:
+            self._chunks.append(deque([song]))
+            self._tree_append(1)
+        else:
+            self._chunks[-1].append(song)
+            self._tree_add(len(self._chunks) - 1, 1)
+        self._len += 1
+        self._count(song, 1)
+
+    def extend(self, songs: Iterable['Song']) -> None:
+        """Add songs to the end of the queue, building whole chunks at once."""
+        songs = list(songs)
+        if self._chunks and len(songs) < self.LOAD:
+            for song in songs:
+                self.append(song)
+            return
+        # Top up the last chunk, add full chunks and rebuild the tree once
+        rest = songs
+        if self._chunks:
+            room = max(self.LOAD - len(self._chunks[-1]), 0)
+            self._chunks[-1].extend(songs[:room])
+            rest = songs[room:]
+        self._chunks.extend(deque(rest[i:i + self.LOAD]) for i in range(0, len(rest), self.LOAD))
+        self._rebuild()
+        self._len += len(songs)
+        for song in songs:
+            self._count(song, 1)
+
+    def appendleft(self, song: 'Song') -> None:
+        """Put a song at the front of the queue."""
+        if not self._chunks:
+            self.append(song)
+            return
+        self._chunks[0].appendleft(song)
+        if self._head_removed:
+            self._head_removed -= 1
+        else:
+            self._tree_add(0, 1)
+        self._len += 1
+        self._count(song, 1)
+
+    def popleft(self) -> 'Song':
+        """Remove and return the song at the front of the queue."""
+        if not self._len:
+            raise IndexError("pop from an empty queue")
+        song = self._chunks[0].popleft()
+        self._head_removed += 1
+        if not self._chunks[0]:
+            self._drop_chunk(0)
+        self._len -= 1
+        self._count(song, -1)
+        return song
+
+    def insert(self, index: int, song: 'Song') -> None:
+        """
+        Insert a song before the given position.
+
+        Args:
+            index (int): 0-based position; values past the end append
+            song (Song): Song to insert
+        """
+        if index < 0:
+            index = max(0, index + self._len)
+        if index >= self._len:
+            self.append(song)
+            return
+        if index == 0:
+            self.appendleft(song)
+            return
+        chunk_index, offset = self._locate(index)
+        chunk = self._chunks[chunk_index]
+        chunk.insert(offset, song)
+        self._tree_add(chunk_index, 1)
+        self._len += 1
+        self._count(song, 1)
+        if len(chunk) > 2 * self.LOAD:
+            self._split(chunk_index)
+
+    def pop(self, index: int = -1) -> 'Song':
+        """
+        Remove and return the song at a position.
+
+        Args:
+            index (int): 0-based position, negative values count from the end
+
+        Returns:
+            Song: The removed song
+
+        Raises:
+            IndexError: The position is out of range
+        """
+        chunk_index, offset = self._locate(index)
+        if chunk_index == 0 and offset == 0:
+            return self.popleft()
+        chunk = self._chunks[chunk_index]
+        song = chunk[offset]
+        del chunk[offset]
+        self._len -= 1
+        self._count(song, -1)
+        if chunk:
+            self._tree_add(chunk_index, -1)
+        else:
+            self._drop_chunk(chunk_index)
+        return song
+
+    def move(self, source: int, destination: int) -> 'Song':
+        """
+        Move a song to another position.
+
+        Args:
+            source (int): Current 0-based position
+            destination (int): 0-based position the song ends up at
+
+        Returns:
+            Song: The moved song
+
+        Raises:
+            IndexError: Either position is out of range
+        """
+        if not 0 <= destination < self._len:
+            raise IndexError("queue index out of range")
+        song = self.pop(source)
+        self.insert(destination, song)
+        return song
+
+    def popleft_many(self, count: int) -> List['Song']:
+        """Remove and return the first ``count`` songs."""
+        return [self.popleft() for _ in range(min(count, self._len))]
+
+    def shuffle(self) -> None:
+        """Shuffle the queue in place."""
+        songs = list(self)
+        random.shuffle(songs)
+        self._chunks = [deque(songs[i:i + self.LOAD]) for i in range(0, len(songs), self.LOAD)]
+        self._rebuild()
+
+    def clear(self) -> None:
+        self._chunks = []
+        self._tree = [0]
+        self._head_removed = 0
+        self._len = 0
+        self._duration = 0
+        self._unknown_durations = 0
+
+    def adjust_duration(self, old: Optional[int], new: Optional[int]) -> None:
+        """Account for a queued song whose duration became known after it was queued."""
+        if old is None:
+            self._unknown_durations -= 1
+        else:
+            self._duration -= old
+        if new is None:
+            self._unknown_durations += 1
+        else:
+            self._duration += new
+
+    # Access
+
+    @property
+    def total_duration(self) -> int:
+        """Total duration in seconds of queued songs with a known duration."""
+        return self._duration
+
+    @property
+    def unknown_durations(self) -> int:
+        """Number of queued songs whose duration is not known yet."""
+        return self._unknown_durations
+
+    @overload
+    def __getitem__(self, index: int) -> 'Song': ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List['Song']: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union['Song', List['Song']]:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step != 1:
+                return list(self)[index]
+            if start >= stop:
+                return []
+            return list(islice(self._iter_from(start), stop - start))
+        chunk_index, offset = self._locate(index)
+        return self._chunks[chunk_index][offset]
+
+    def _iter_from(self, start: int) -> Iterator['Song']:
+        chunk_index, offset = self._locate(start)
+        first = islice(self._chunks[chunk_index], offset, None)
+        return chain(first, *self._chunks[chunk_index + 1:])
+
+    def __iter__(self) -> Iterator['Song']:
+        return chain.from_iterable(self._chunks)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __bool__(self) -> bool:
+        return self._len > 0
+
+    def __repr__(self) -> str:
+        return f"<TrackQueue len={self._len} duration={self._duration}s>"
@@ -1,6 +1,12 @@
 import re
 import asyncio
+import math
 from typing import Optional
+from urllib.parse import urlsplit, parse_qs
+
+_YOUTUBE_URL_PATTERN = re.compile(
+    r'^(?:https?://)?(?:www\.|m\.|music\.)?(?:youtube\.com|youtu\.be|youtube-nocookie\.com)/', re.IGNORECASE
+)
 
 def is_valid_youtube_url(url: str) -> bool:
     """
@@ -12,18 +18,132 @@ def is_valid_youtube_url(url: str) -> bool:
     Returns:
         bool: True if valid YouTube URL, False otherwise
     """
-    youtube_patterns = [
-        r'(https?://)?(www\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/',
-        r'(https?://)?(www\.)?youtu\.be/',
-        r'(https?://)?(www\.)?youtube\.com/watch\?v=',
-        r'(https?://)?(www\.)?youtube\.com/embed/',
-        r'(https?://)?(www\.)?youtube\.com/v/',
-    ]
+    return _YOUTUBE_URL_PATTERN.match(url.strip()) is not None
+
+_YOUTUBE_ID_PATTERN = re.compile(
+    r'^(?:https?://)?(?:www\.|m\.|music\.)?'
+    r'(?:youtube\.com/(?:watch\?(?:.*&)?v=|watch/|embed/|v/|e/|shorts/|live/)|youtu\.be/'
+    r'|youtube-nocookie\.com/embed/)'
+    r'([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])'
+)
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+_URL_PATTERN = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*://')
+
+def extract_youtube_id(url: str) -> Optional[str]:
+    """
+    Extract the canonical 11-character video ID from a YouTube URL.
+    
+    Args:
+        url (str): A YouTube watch, short, embed or youtu.be URL
+        
+    Returns:
+        Optional[str]: The video ID, or None if the URL is not a YouTube video URL
+    """
+    match = _YOUTUBE_ID_PATTERN.match(url.strip())
+    return match.group(1) if match else None
+
+_YOUTUBE_PLAYLIST_PATTERN = re.compile(
+    r'^(?:https?://)?(?:www\.|m\.|music\.)?youtube\.com/(?:playlist|watch)\?(?:.*&)?list=([A-Za-z0-9_-]+)'
+)
+
+def is_url(text: str) -> bool:
+    """Check whether text is a URL (has a scheme) rather than a search query."""
+    return _URL_PATTERN.match(text.strip()) is not None
+
+def extract_playlist_id(url: str) -> Optional[str]:
+    """
+    Extract the playlist ID from a YouTube playlist URL.
+    
+    Args:
+        url (str): A youtube.com/playlist?list=... URL, or a watch URL with a list parameter
+        
+    Returns:
+        Optional[str]: The playlist ID, or None if the URL does not reference a playlist
+    """
+    match = _YOUTUBE_PLAYLIST_PATTERN.match(url.strip())
+    return match.group(1) if match else None
+
+def is_playlist_url(url: str) -> bool:
+    """
+    Check if a URL points at a playlist rather than a single video.
+    
+    Watch URLs that carry both a video and a list parameter count as a single video.
+    
+    Args:
+        url (str): The URL to check
+        
+    Returns:
+        bool: True if the URL is a playlist page
+    """
+    return extract_playlist_id(url) is not None and extract_youtube_id(url) is None
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search query so trivially different spellings share a cache entry.
     
-    for pattern in youtube_patterns:
-        if re.match(pattern, url):
-            return True
-    return False
+    Args:
+        query (str): Raw search query
+        
+    Returns:
+        str: Lowercased query with collapsed whitespace
+    """
+    return _WHITESPACE_PATTERN.sub(' ', query).strip().lower()
+
+def canonical_query_key(query: str) -> str:
+    """
+    Get a key that is identical for requests that resolve to the same song.
+    
+    Args:
+        query (str): YouTube URL, other URL or search query
+        
+    Returns:
+        str: Video ID for YouTube URLs, the URL itself for other sites, the normalized query otherwise
+    """
+    video_id = extract_youtube_id(query)
+    if video_id:
+        return video_id
+    query = query.strip()
+    # URL paths are case-sensitive, only searches are normalized
+    if _URL_PATTERN.match(query):
+        return query
+    return normalize_query(query)
+
+_EXPIRE_PATH_PATTERN = re.compile(r'/expire/(\d+)')
+_HTTP_EXPIRED_PATTERN = re.compile(r'(?:Server returned|HTTP error) (403|410)')
+
+def parse_stream_expiry(stream_url: str) -> Optional[float]:
+    """
+    Read the expiry timestamp embedded in a resolved media URL.
+    
+    YouTube media URLs carry it as an ``expire`` query parameter, manifest URLs
+    as an ``/expire/<timestamp>/`` path segment.
+    
+    Args:
+        stream_url (str): Direct media URL resolved by yt-dlp
+        
+    Returns:
+        Optional[float]: Unix timestamp the URL expires at, or None if unknown
+    """
+    parts = urlsplit(stream_url)
+    expire = parse_qs(parts.query).get('expire')
+    if expire and expire[0].isdigit():
+        return float(expire[0])
+    match = _EXPIRE_PATH_PATTERN.search(parts.path)
+    if match:
+        return float(match.group(1))
+    return None
+
+def is_expired_stream_error(ffmpeg_log: str) -> bool:
+    """
+    Check whether ffmpeg output shows the stream URL was rejected as expired.
+    
+    Args:
+        ffmpeg_log (str): Text ffmpeg wrote to stderr
+        
+    Returns:
+        bool: True if the server answered 403 Forbidden or 410 Gone
+    """
+    return bool(_HTTP_EXPIRED_PATTERN.search(ffmpeg_log))
 
 def format_duration(seconds: int) -> str:
     """
@@ -47,6 +167,31 @@ def format_duration(seconds: int) -> str:
     else:
         return f"{minutes:02d}:{seconds:02d}"
 
+# One field of a timestamp: digits with an optional fraction, no signs, exponents or nan/inf
+_TIMESTAMP_PART_PATTERN = re.compile(r'[0-9]+(?:\.[0-9]*)?|\.[0-9]+')
+
+def parse_timestamp(text: str) -> Optional[float]:
+    """
+    Parse a time given as seconds, MM:SS or HH:MM:SS.
+    
+    Args:
+        text (str): Time entered by a user, e.g. "90", "1:30" or "1:02:03.5"
+        
+    Returns:
+        Optional[float]: Time in seconds, or None if it cannot be parsed
+    """
+    parts = text.strip().split(':')
+    if not 1 <= len(parts) <= 3 or not all(_TIMESTAMP_PART_PATTERN.fullmatch(part) for part in parts):
+        return None
+    values = [float(part) for part in parts]
+    if any(value >= 60 for value in values[1:]):
+        return None
+    seconds = 0.0
+    for value in values:
+        seconds = seconds * 60 + value
+    # A long enough run of digits overflows to inf
+    return seconds if math.isfinite(seconds) else None
+
 def truncate_text(text: str, max_length: int = 50) -> str:
     """
     Truncate text to specified length with ellipsis.